@@ -20,18 +20,21 @@ sys.path.insert(0, this_path + sep + 'src')  # path to our code
 logging.basicConfig()
 
 from building_seeding import district
+from parameters import FETCH_TILE_SIZE
 from settlement import Settlement
 from terrain import TerrainMaps, ObstacleMap
 
 
-def main(districts=None, seeding=None, parcels=None, generation=None, visualize=False, undo=False) -> None:
+def main(districts=None, seeding=None, parcels=None, generation=None, visualize=False, undo=False, cache=None, tile_size=None) -> None:
     print("Hello Settlers!")
     # get & parse building zone
-    terrain: TerrainMaps = TerrainMaps.request()
+    terrain: TerrainMaps = TerrainMaps.request(cache=cache, tile_size=tile_size)
     ObstacleMap.from_terrain(terrain)  # initialize obstacle map from the terrain
     settlement = Settlement(terrain)
 
     if districts:
+        # layers read by the districts step, the others are computed on first access
+        terrain.materialize("fluid_map", "trees")
         districts(settlement, visualize=visualize)
     else: return
 
@@ -48,6 +51,7 @@ def main(districts=None, seeding=None, parcels=None, generation=None, visualize=
 
     if generation:
         # build buildings on parcels
+        terrain.forget_cache()  # the cached terrain is outdated as soon as the world is modified
         settlement.terraform()
         generation(settlement)
     else: return
@@ -68,6 +72,11 @@ def get_parser() -> argparse.ArgumentParser:
     parser.add_argument("--steps", "-s", nargs='+', type=str, default=["D1", "S0", "G", "P"])
     parser.add_argument("--visualize", "-v", action="store_true", help="Export visualization maps during run")
     parser.add_argument("--time", "-T", type=int, default=600, help="Time limit in seconds for the whole run, negative value for no limit")
+    parser.add_argument("--cache", "-c", nargs='?', const="use", choices=["use", "refresh"], default=None,
+                        help="Restore the terrain maps of the build area from the disk cache if available (use), or "
+                             "request the level and overwrite the cache (refresh)")
+    parser.add_argument("--tiles", "-t", nargs='?', type=int, const=FETCH_TILE_SIZE, default=None, dest="tile_size",
+                        help="Request the level as concurrent chunk aligned tiles of this size")
 
     run_modes = parser.add_mutually_exclusive_group()
     run_modes.add_argument("--undo", "-u", action="store_true", help="Undo generation after user input")
@@ -145,6 +154,8 @@ if __name__ == '__main__':
     gen_options = get_generation_options(args.steps)
     gen_options["visualize"] = args.visualize
     gen_options["undo"] = args.undo
+    gen_options["cache"] = args.cache
+    gen_options["tile_size"] = args.tile_size
 
     if args.perf:
         print("Running profiler mode...")
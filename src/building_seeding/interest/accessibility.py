@@ -15,5 +15,8 @@ def local_accessibility(x, z, building_type, scenario, road_network):
     return attraction_repulsion(distance, lambda_min, lambda_0, lambda_max)
 
 
-def accessibility(building_type, scenario, road_network, size):
-    return attraction_repulsion(road_network.distance_map[:], *BUILDING_ENCYCLOPEDIA[scenario]["Accessibility"][building_type.name])
+def accessibility(building_type, scenario, road_network, size, window=(slice(None), slice(None))):
+    """
+    :param window: tuple of slices, part of the map to compute, the whole map by default
+    """
+    return attraction_repulsion(road_network.distance_map[window], *BUILDING_ENCYCLOPEDIA[scenario]["Accessibility"][building_type.name])
@@ -8,6 +8,6 @@ from utils import *
 def density(shape, districts, lambdas):
     # type: (tuple, Districts, tuple) -> np.ndarray
     assert len(shape) == 2 and len(lambdas) == 3
-    interest_matrix = np.vectorize(lambda d: balance(d, *lambdas))(districts[:])
+    interest_matrix = balance(np.asarray(districts, dtype=float), *lambdas)
     return interest_matrix
 
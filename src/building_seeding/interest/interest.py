@@ -1 +1 @@
-# coding=utf-8"""Function used to compute interests"""import randomfrom typing import Dictfrom building_seeding import BUILDING_ENCYCLOPEDIA, BuildingType, Parcelfrom building_seeding.district.districts import Districtsfrom building_seeding.interest import *from building_seeding.interest.density import densityfrom terrain import TerrainMapsfrom terrain.road_network import *class InterestSeeder:    """    Stores an InterestMap for each BuildingType and contains methods relative to seeding building types    """    def __init__(self, maps: TerrainMaps, districts: Districts, parcel_list: List[Parcel], scenario: str):        self.__terrain_maps = maps        self.__districts = districts        self.__interest_maps = dict()  # type: Dict[BuildingType, InterestMap]        self.__parcels = parcel_list        self.__scenario = scenario    def __getitem__(self, item):        if isinstance(item, BuildingType):            if item not in self.__interest_maps:                self.__interest_maps[item] = InterestMap(item, self.__scenario, self.__terrain_maps, self.__districts)            return self.__interest_maps[item]        elif type(item) == object:            raise TypeError("Expected BuildingType, found {} of class {}", item, item.__class__)        raise TypeError("Expected BuildingType, found {} of type {}", item, type(item))    def get_seed(self, building_type):        typed_interest_map = self[building_type]        typed_interest_map.update(self.__parcels)        seed, interest = None, -1        for _ in range(SEED_COUNT):            potential_seed = self.__districts.seed()            if ObstacleMap().is_accessible(potential_seed):                potential_interest = typed_interest_map.get_interest(potential_seed)                if seed is None or potential_interest > interest:                    seed, interest = potential_seed, potential_interest        if seed is None:            percentile = 95            while percentile >= 30:                potential_seed = typed_interest_map.get_seed(perc=percentile)                if potential_seed is None or ObstacleMap().is_accessible(potential_seed):                    return potential_seed                percentile -= 5            return None        return seed    def try_to_reuse_existing_parcel(self, new_type) -> BuildingType:        """        Replaces the type of an existing parcel with the type we're seeding if it increases its interest        :param new_type: type of the building we're seeding        :return: the type to seed        """        parcels = [_ for _ in self.__parcels if _.building_type != BuildingType.ghost and _.building_type != new_type]        if len(parcels) > REPLACE_PARCEL_TYPE_EXPLORATION:            parcels = random.sample(parcels, REPLACE_PARCEL_TYPE_EXPLORATION)        for parcel in parcels:            cur_type = parcel.building_type            # For every parcel of a different type than the one to be seeded, compute interest in changing type            seed = parcel.center            other_parcels = list(filter(lambda p: p != parcel, self.__parcels))            if not other_parcels:                continue            # Using sociability computed from the other placed parcels, compute local interest for both            # building types: the parcel's type and the seeded type            cur_interest = max(0., self[cur_type].get_interest(seed, other_parcels))            new_interest = max(0., self[new_type].get_interest(seed, other_parcels))            if bernouilli(0.3*(new_interest - cur_interest) + 0.7*new_interest):                # todo: replace with max search ?                self.__change_parcel_type(parcel, new_type)                return cur_type        return new_type    def __change_parcel_type(self, parcel: Parcel, new_type: BuildingType):        """        Changes the type of a parcel and updates all the interest maps (sociability) accordingly        """        old_type = parcel.building_type  # stores replaced type        parcel.building_type = new_type  # change parcel type        for typed_interest_map in self.__interest_maps.values():            # updates pre computed sociability when necessary            typed_interest_map.notify_type_change(self.__parcels, parcel, old_type)        # Set the building type to be seeded        print("Replaced {} parcel at {} with type {}".format(old_type.name, parcel.center, parcel.building_type.name))    def get_optimal_type(self, seed):        # type: (Point) -> BuildingType        """        For a seed, returns a type with the highest interest        """        int_seed = Point(round(seed.x), round(seed.z))        building_type_iter = self.__interest_maps.items()        type_interest = {b_type: b_map.get_interest(int_seed, self.__parcels) for b_type, b_map in building_type_iter}        max_interest = max(type_interest.values())        if max_interest == -1:            return BuildingType.ghost        else:            best_types = list(filter(lambda b_type: type_interest[b_type] == max_interest, type_interest))            return choice(best_types)class InterestMap:    """    Stores precomputed interest matrices for a given building type and contains methods to quickly update these matrices    """    def __init__(self, building_type: BuildingType, scenario: str, terrain_maps: TerrainMaps, districts: Districts):        # Parameters        self.__type = building_type  # type: BuildingType        self.__road_net = terrain_maps.road_network  # type: RoadNetwork        self.__districts = districts        self.__known_seeds = 0  # type: int        self.__scenario = scenario        self.__size = terrain_maps.width, terrain_maps.length        # Weights        w = BUILDING_ENCYCLOPEDIA[scenario]        b = building_type.name        self.__lambdas = {c: (w[c][b] if b in w[c] else w[c]["default"]) for c in w if (b in w[c] or "default" in w[c])}        self.__lambdas["Sociability"] = w["Sociability"]        self.__acc_w = self.__lambdas["Weighting_factors"][0]        self.__soc_w = self.__lambdas["Weighting_factors"][1]        self.__fix_w = sum(self.__lambdas["Weighting_factors"][3:])        # Interest functions        self.__access = None        self.__social = None        self.__fixed_interest = self.__compute_fixed_interest(terrain_maps)        self.__interest_value = None    def update(self, __parcels):        """        Updates the interest matrix with the newest road network and parcels added since last update        """        n, m = self.__known_seeds, len(__parcels) - self.__known_seeds        if n == 0:            # currently, density is a fixed interest but requires existing parcels (town center)            # so it is added now to the fixed interest, at the first call of this method            dense_intrst = density(self.__size, self.__districts, self.__lambdas["Density"])            dense_weight = self.__lambdas["Weighting_factors"][2]            fixed_intrst = self.__fixed_interest            fixed_weight = self.__fix_w            self.__fix_w += dense_weight            self.__fixed_interest = ((fixed_intrst * fixed_weight) + (dense_intrst * dense_weight)) / self.__fix_w            self.__fixed_interest[(fixed_intrst == -1) | (dense_intrst == -1)] = -1        if m > 0:            self.__access = accessibility(self.type, self.scenario, self.__road_net, self.__size)            old_soc = self.__social            new_soc = sociability(self.type, self.scenario, __parcels[n:], self.__size)            if old_soc is None:                self.__social = new_soc            else:                self.__social = (old_soc * n + new_soc * m) / (n + m)                self.__social[(old_soc == -1) | (new_soc == -1)] = -1            self.__known_seeds += m            self.__compute_interest()    def get_seed(self, max_iteration=None, perc=95):        assert self.__interest_value is not None        length = self.__interest_value.shape[1]        size = self.__interest_value.size        cells_ids: List[int] = list(range(size))        reachable_high_interest = percentile(self.__interest_value, perc)        cells_ids = list(filter(lambda pos: (self.__interest_value[pos // length, pos % length] >= reachable_high_interest), cells_ids))        if not cells_ids:            return None  # all positions have a negative interest: impossible to seed        random.shuffle(cells_ids)  # shuffles in place        if max_iteration and max_iteration < len(list(cells_ids)):            cells_ids = cells_ids[:max_iteration]  # limit search to first max_iter elements        for random_index in cells_ids:            x, z = random_index // length, random_index % length  # convert index to coordinates            interest_score = self.__interest_value[x, z]            if bernouilli(interest_score):                return Point(x, z)        return None    def __compute_fixed_interest(self, maps: TerrainMaps) -> np.ndarray:        """        Computes interest for fixed functions (relative to the terrain).        Should be called only once -- at the instance init        """        _t = time.time()        def river_interest(_x, _z):            if maps.fluid_map.has_river:                return close_distance(maps.fluid_map.river_distance[_x, _z], self.__lambdas["RiverDistance"])            return 0        def ocean_interest(_x, _z):            if maps.fluid_map.has_ocean:                return close_distance(maps.fluid_map.ocean_distance[_x, _z], self.__lambdas["OceanDistance"])            return 0        def lava_interest(_x, _z):            if maps.fluid_map.has_lava:                return obstacle(maps.fluid_map.lava_distance[_x, _z], self.__lambdas["LavaObstacle"])            return 0        def altitude_interest(_x, _z):            alt = maps.height_map[_x, _z]            lm, l0, lM = self.__lambdas["Altitude"]            return balance(alt, lm, l0, lM)        def steepness_interest(_x, _z):            steep = maps.height_map.steepness(_x, _z)            return open_distance(steep, self.__lambdas["Steepness"])        size = maps.width, maps.length        _interest_map = np.zeros(size)        extendability_map = extendability(size, MIN_PARCEL_SIZE)        altitude_interest_map = np.array([[altitude_interest(x, z) for z in range(size[1])] for x in range(size[0])])        steep_interest_map = np.array([[steepness_interest(x, z) for z in range(size[1])] for x in range(size[0])])        ocean_interest_map = np.array([[ocean_interest(x, z) for z in range(size[1])] for x in range(size[0])])        river_interest_map = np.array([[river_interest(x, z) for z in range(size[1])] for x in range(size[0])])        lava_interest_map = np.array([[lava_interest(x, z) for z in range(size[1])] for x in range(size[0])])        temp_interest_map = np.vectorize(lambda d: soft_balance(d, *self.__lambdas["Temperature"]))(maps.biome.temperature_map)        tree_interest_map = np.vectorize(lambda d: attraction_repulsion(d, *self.__lambdas["TreeDistance"]))(maps.trees.tree_distance)        for x, z, in itertools.product(range(size[0]), range(size[1])):            interest_functions = np.array([                altitude_interest_map[x, z],                river_interest_map[x, z],                ocean_interest_map[x, z],                lava_interest_map[x, z],                steep_interest_map[x, z],                temp_interest_map[x, z],                tree_interest_map[x, z]            ])            if min(interest_functions) == -1 or extendability_map[x][z] == -1:                interest_score = -1            else:                weights = np.array(self.__lambdas["Weighting_factors"][3:])                interest_score = interest_functions.dot(weights) / sum(weights)                # interest_score = max(-1, weighted_score)            _interest_map[x][z] = interest_score        print("[InterestMap] Computed fixed interest functions for type {} in {:0.2} s".format(self.type.name, time.time() - _t))        return _interest_map    def __compute_interest(self):        """        Must be called when any of the interest matrices are modified to update the main interest matrix        """        a, s, f = self.__acc_w, self.__soc_w, self.__fix_w        mask = (self.__access == -1) | (self.__social == -1) | (self.__fixed_interest == -1)        soc: np.ndarray = self.__social        min_soc = soc.min()        max_soc = soc.max()        soc = 2 * (soc - min_soc) / (max_soc - min_soc) - 1        self.__interest_value = (self.__access * a + soc * s + self.__fixed_interest * f) / (a + s + f)        self.__interest_value[mask] = -1    def get_interest(self, seed, parcels=None):        # type: (Point, List[Parcel]) -> float        """        Returns interest value at a given seed. If a list of parcels is passed, will recompute local accessibility        and sociability from this parcel list        """        if parcels is None:            return self.__interest_value[seed.xz]        local_acc = local_accessibility(seed.x, seed.z, self.type, self.scenario, self.__road_net)        local_soc = local_sociability(seed.x, seed.z, self.type, self.scenario, parcels)        local_fix = self.__fixed_interest[seed.x, seed.z]        if local_acc == -1 or local_soc == -1 or local_fix == -1:            return -1        a, s, f = self.__acc_w, self.__soc_w, self.__fix_w        return (local_acc * a + local_soc * s + local_fix * f) / (a + s + f)    def notify_type_change(self, parcels, parcel, old_type):        """        When an existing parcel changes type, recomputing in sociability (and interest) matrices may be necessary        """        if parcel not in parcels[:self.__known_seeds]:            # parcel with old type has no effect on self.__access -> nothing to do            return        # Update sociability matrix        old_lambda = self.__lambdas["Sociability"]["-".join([self.type.name, old_type.name])]        old_social = sociability_one_seed(*old_lambda, parcel.mean_x, parcel.mean_z, self.__size)        new_lambda = self.__lambdas["Sociability"]["-".join([self.type.name, parcel.building_type.name])]        new_social = sociability_one_seed(*new_lambda, parcel.mean_x, parcel.mean_z, self.__size)        self.__social += (new_social - old_social) / self.__known_seeds        self.__social[new_social == -1] = -1        for x, z in filter(lambda xz: old_social[xz] == -1, itertools.product(range(self.__size[0]), range(self.__size[1]))):            self.__social[x, z] = local_sociability(x, z, self.type, self.scenario, parcels[:self.__known_seeds])        # Compute interest with the updated sociability matrix        self.__compute_interest()    @property    def type(self):        return BuildingType(self.__type)    @property    def scenario(self):        return str(self.__scenario)    @property    def accessibility(self):        return np.array(self.__access)    @property    def sociability(self):        return np.array(self.__social)        @property    def terrain_interest(self) -> np.ndarray:        return self.__fixed_interest[:]    @property    def map(self):        return np.array(self.__interest_value)
\ No newline at end of file
+# coding=utf-8"""Function used to compute interests"""import randomfrom typing import Dictfrom building_seeding import BUILDING_ENCYCLOPEDIA, BuildingType, Parcelfrom building_seeding.district.districts import Districtsfrom building_seeding.interest import *from building_seeding.interest.density import densityfrom terrain import TerrainMapsfrom terrain.road_network import *class InterestSeeder:    """    Stores an InterestMap for each BuildingType and contains methods relative to seeding building types    """    def __init__(self, maps: TerrainMaps, districts: Districts, parcel_list: List[Parcel], scenario: str):        self.__terrain_maps = maps        self.__districts = districts        self.__interest_maps = dict()  # type: Dict[BuildingType, InterestMap]        self.__parcels = parcel_list        self.__scenario = scenario    def __getitem__(self, item):        if isinstance(item, BuildingType):            if item not in self.__interest_maps:                self.__interest_maps[item] = InterestMap(item, self.__scenario, self.__terrain_maps, self.__districts)            return self.__interest_maps[item]        elif type(item) == object:            raise TypeError("Expected BuildingType, found {} of class {}", item, item.__class__)        raise TypeError("Expected BuildingType, found {} of type {}", item, type(item))    def get_seed(self, building_type):        typed_interest_map = self[building_type]        typed_interest_map.update(self.__parcels)        seed, interest = None, -1        for _ in range(SEED_COUNT):            potential_seed = self.__districts.seed()            if ObstacleMap().is_accessible(potential_seed):                potential_interest = typed_interest_map.get_interest(potential_seed)                if seed is None or potential_interest > interest:                    seed, interest = potential_seed, potential_interest        if seed is None:            percentile = 95            while percentile >= 30:                potential_seed = typed_interest_map.get_seed(perc=percentile)                if potential_seed is None or ObstacleMap().is_accessible(potential_seed):                    return potential_seed                percentile -= 5            return None        return seed    def try_to_reuse_existing_parcel(self, new_type) -> BuildingType:        """        Replaces the type of an existing parcel with the type we're seeding if it increases its interest        :param new_type: type of the building we're seeding        :return: the type to seed        """        parcels = [_ for _ in self.__parcels if _.building_type != BuildingType.ghost and _.building_type != new_type]        if len(parcels) > REPLACE_PARCEL_TYPE_EXPLORATION:            parcels = random.sample(parcels, REPLACE_PARCEL_TYPE_EXPLORATION)        for parcel in parcels:            cur_type = parcel.building_type            # For every parcel of a different type than the one to be seeded, compute interest in changing type            seed = parcel.center            other_parcels = list(filter(lambda p: p != parcel, self.__parcels))            if not other_parcels:                continue            # Using sociability computed from the other placed parcels, compute local interest for both            # building types: the parcel's type and the seeded type            cur_interest = max(0., self[cur_type].get_interest(seed, other_parcels))            new_interest = max(0., self[new_type].get_interest(seed, other_parcels))            if bernouilli(0.3*(new_interest - cur_interest) + 0.7*new_interest):                # todo: replace with max search ?                self.__change_parcel_type(parcel, new_type)                return cur_type        return new_type    def __change_parcel_type(self, parcel: Parcel, new_type: BuildingType):        """        Changes the type of a parcel and updates all the interest maps (sociability) accordingly        """        old_type = parcel.building_type  # stores replaced type        parcel.building_type = new_type  # change parcel type        for typed_interest_map in self.__interest_maps.values():            # updates pre computed sociability when necessary            typed_interest_map.notify_type_change(self.__parcels, parcel, old_type)        # Set the building type to be seeded        print("Replaced {} parcel at {} with type {}".format(old_type.name, parcel.center, parcel.building_type.name))    def get_optimal_type(self, seed):        # type: (Point) -> BuildingType        """        For a seed, returns a type with the highest interest        """        int_seed = Point(round(seed.x), round(seed.z))        building_type_iter = self.__interest_maps.items()        type_interest = {b_type: b_map.get_interest(int_seed, self.__parcels) for b_type, b_map in building_type_iter}        max_interest = max(type_interest.values())        if max_interest == -1:            return BuildingType.ghost        else:            best_types = list(filter(lambda b_type: type_interest[b_type] == max_interest, type_interest))            return choice(best_types)_FULL_WINDOW = (slice(None), slice(None))class InterestMap:    """    Stores precomputed interest matrices for a given building type and contains methods to quickly update these matrices    """    def __init__(self, building_type: BuildingType, scenario: str, terrain_maps: TerrainMaps, districts: Districts):        # Parameters        self.__type = building_type  # type: BuildingType        self.__road_net = terrain_maps.road_network  # type: RoadNetwork        self.__districts = districts        self.__known_seeds = 0  # type: int        self.__scenario = scenario        self.__size = terrain_maps.width, terrain_maps.length        # Weights        w = BUILDING_ENCYCLOPEDIA[scenario]        b = building_type.name        self.__lambdas = {c: (w[c][b] if b in w[c] else w[c]["default"]) for c in w if (b in w[c] or "default" in w[c])}        self.__lambdas["Sociability"] = w["Sociability"]        self.__acc_w = self.__lambdas["Weighting_factors"][0]        self.__soc_w = self.__lambdas["Weighting_factors"][1]        self.__fix_w = sum(self.__lambdas["Weighting_factors"][3:])        # Interest functions        self.__access = None        # rectangles (x0, z0, x1, z1) where the road distances changed since last update, only recorded once the        # accessibility is computed, so that maps which are never updated are not referenced by the road network        self.__access_dirty = set()        self.__social_sum = np.zeros(self.__size)  # sum of the sociability of the known seeds        self.__social_veto = np.zeros(self.__size, dtype=int)  # number of known seeds with -1 sociability        self.__social_bounds = None  # (x0, z0, x1, z1) bounds of the windows of the known seeds        self.__interest_map = None  # combined interest, recomputed in the windows where its matrices changed        self.__interest_dirty = []  # windows of the interest map to recompute before the next read        self.__fixed_interest = self.__compute_fixed_interest(terrain_maps)    def update(self, __parcels):        """        Updates the interest matrix with the newest road network and parcels added since last update        """        n, m = self.__known_seeds, len(__parcels) - self.__known_seeds        if n == 0:            # currently, density is a fixed interest but requires existing parcels (town center)            # so it is added now to the fixed interest, at the first call of this method            dense_intrst = density(self.__size, self.__districts, self.__lambdas["Density"])            dense_weight = self.__lambdas["Weighting_factors"][2]            fixed_intrst = self.__fixed_interest            fixed_weight = self.__fix_w            self.__fix_w += dense_weight            self.__fixed_interest = ((fixed_intrst * fixed_weight) + (dense_intrst * dense_weight)) / self.__fix_w            self.__fixed_interest[(fixed_intrst == -1) | (dense_intrst == -1)] = -1            self.__interest_map = None        if m > 0:            # accessibility is only recomputed where the road distances changed            if self.__access is None:                self.__access = accessibility(self.type, self.scenario, self.__road_net, self.__size)                self.__road_net.add_listener(lambda *rectangle: self.__access_dirty.add(rectangle))            else:                for x0, z0, x1, z1 in self.__access_dirty:                    window = (slice(x0, x1), slice(z0, z1))                    self.__access[window] = accessibility(self.type, self.scenario, self.__road_net, self.__size, window)                    self.__interest_dirty.append(window)            self.__access_dirty.clear()            for parcel in __parcels[n:]:                self.__add_seed_sociability(parcel.building_type, parcel.center, 1)            self.__known_seeds += m            # the mean sociability changes wherever a known seed has a non null sociability            x0, z0, x1, z1 = self.__social_bounds            self.__interest_dirty.append((slice(x0, x1), slice(z0, z1)))    def get_seed(self, max_iteration=None, perc=95):        assert self.__access is not None        interest_value = self.__interest()        length = interest_value.shape[1]        size = interest_value.size        cells_ids: List[int] = list(range(size))        reachable_high_interest = percentile(interest_value, perc)        cells_ids = list(filter(lambda pos: (interest_value[pos // length, pos % length] >= reachable_high_interest), cells_ids))        if not cells_ids:            return None  # all positions have a negative interest: impossible to seed        random.shuffle(cells_ids)  # shuffles in place        if max_iteration and max_iteration < len(list(cells_ids)):            cells_ids = cells_ids[:max_iteration]  # limit search to first max_iter elements        for random_index in cells_ids:            x, z = random_index // length, random_index % length  # convert index to coordinates            interest_score = interest_value[x, z]            if bernouilli(interest_score):                return Point(x, z)        return None    def __compute_fixed_interest(self, maps: TerrainMaps) -> np.ndarray:        """        Computes interest for fixed functions (relative to the terrain).        Should be called only once -- at the instance init        """        _t = time.time()        size = maps.width, maps.length        features = maps.features        def fluid_interest(interest_function, distance_map, lambdas):            if distance_map is not None:                return interest_function(distance_map, *lambdas)            return np.zeros(size)        extendability_map = extendability(size, MIN_PARCEL_SIZE)        interest_functions = np.array([            balance(features["altitude"], *self.__lambdas["Altitude"]),            fluid_interest(close_distance, features["river_distance"], self.__lambdas["RiverDistance"]),            fluid_interest(close_distance, features["ocean_distance"], self.__lambdas["OceanDistance"]),            fluid_interest(obstacle, features["lava_distance"], self.__lambdas["LavaObstacle"]),            open_distance(features["steepness"], *self.__lambdas["Steepness"]),            soft_balance(features["temperature"], *self.__lambdas["Temperature"]),            attraction_repulsion(features["tree_distance"], *self.__lambdas["TreeDistance"])        ], dtype=float)        weights = np.array(self.__lambdas["Weighting_factors"][3:])        _interest_map = np.tensordot(weights, interest_functions, 1) / sum(weights)        _interest_map[(interest_functions == -1).any(axis=0) | (extendability_map == -1)] = -1        print("[InterestMap] Computed fixed interest functions for type {} in {:0.2} s".format(self.type.name, time.time() - _t))        return _interest_map    def __add_seed_sociability(self, neighbor_type: BuildingType, center: Point, sign: int):        """        Adds (sign = 1) or removes (sign = -1) the sociability of a seed to the running sum and veto matrices, only        in the window where it is not null        """        lambdas = self.__lambdas["Sociability"]["-".join([self.type.name, neighbor_type.name])]        window, social = sociability_one_seed(*lambdas, center.x, center.z, self.__size)        self.__social_sum[window] += sign * social        self.__social_veto[window] += sign * (social == -1)        self.__interest_dirty.append(window)        bounds = window[0].start, window[1].start, window[0].stop, window[1].stop        if self.__social_bounds is None:            self.__social_bounds = bounds        else:            self.__social_bounds = tuple(map(min, self.__social_bounds[:2], bounds[:2])) \                                   + tuple(map(max, self.__social_bounds[2:], bounds[2:]))    def __mean_sociability(self, window=_FULL_WINDOW) -> np.ndarray:        """        :return: mean sociability of the known seeds in the window, -1 where any of them has a -1 sociability        """        return np.where(self.__social_veto[window] > 0, -1, self.__social_sum[window] / self.__known_seeds)    def __interest(self, window=_FULL_WINDOW) -> np.ndarray:        """        Main interest matrix in the window, read from the combined interest map after recomputing the windows where the        interest matrices changed        :param window: tuple of slices, part of the map to read, the whole map by default        """        if self.__interest_map is None:            self.__interest_map = self.__combine_interest()        else:            for dirty_window in self.__interest_dirty:                self.__interest_map[dirty_window] = self.__combine_interest(dirty_window)        self.__interest_dirty.clear()        return self.__interest_map[window]    def __combine_interest(self, window=_FULL_WINDOW) -> np.ndarray:        """        Combines the interest matrices in the window. Sociability already lies in [-1, 1] and is not rescaled, so that        the interest of a point only depends on the matrices at this point        :param window: tuple of slices, part of the map to compute, the whole map by default        """        a, s, f = self.__acc_w, self.__soc_w, self.__fix_w        access, soc, fixed_interest = self.__access[window], self.__mean_sociability(window), self.__fixed_interest[window]        interest_value = (access * a + soc * s + fixed_interest * f) / (a + s + f)        interest_value[(access == -1) | (soc == -1) | (fixed_interest == -1)] = -1        return interest_value    def get_interest(self, seed, parcels=None):        # type: (Point, List[Parcel]) -> float        """        Returns interest value at a given seed. If a list of parcels is passed, will recompute local accessibility        and sociability from this parcel list        """        if parcels is None:            return self.__interest((slice(seed.x, seed.x + 1), slice(seed.z, seed.z + 1)))[0, 0]        local_acc = local_accessibility(seed.x, seed.z, self.type, self.scenario, self.__road_net)        local_soc = local_sociability(seed.x, seed.z, self.type, self.scenario, parcels)        local_fix = self.__fixed_interest[seed.x, seed.z]        if local_acc == -1 or local_soc == -1 or local_fix == -1:            return -1        a, s, f = self.__acc_w, self.__soc_w, self.__fix_w        return (local_acc * a + local_soc * s + local_fix * f) / (a + s + f)    def notify_type_change(self, parcels, parcel, old_type):        """        When an existing parcel changes type, recomputing in sociability (and interest) matrices may be necessary        """        if parcel not in parcels[:self.__known_seeds]:            # parcel with old type has no effect on self.__access -> nothing to do            return        # Update sociability matrices in the windows of the old and new sociability of the parcel        self.__add_seed_sociability(old_type, parcel.center, -1)        self.__add_seed_sociability(parcel.building_type, parcel.center, 1)    @property    def type(self):        return BuildingType(self.__type)    @property    def scenario(self):        return str(self.__scenario)    @property    def accessibility(self):        return np.array(self.__access)    @property    def sociability(self):        return self.__mean_sociability()        @property    def terrain_interest(self) -> np.ndarray:        return self.__fixed_interest[:]    @property    def map(self):        return np.array(self.__interest())
\ No newline at end of file
@@ -3,7 +3,7 @@ Function used to compute interests
 """
 
 import numpy as np
-from numba import njit, vectorize
+from numba import vectorize
 
 
 # @njit
@@ -23,7 +23,7 @@ def attraction_repulsion(d, lambda_min, lambda_0, lambda_max):
     return res
 
 
-@njit
+@vectorize(cache=True)
 def balance(d, lambda_min, lambda_0, lambda_max):
     if d < lambda_min or d > lambda_max:
         res = -1
@@ -36,7 +36,7 @@ def balance(d, lambda_min, lambda_0, lambda_max):
     return res
 
 
-@njit
+@vectorize(cache=True)
 def soft_balance(d, lambda_min, lambda_0, lambda_max):
     """
     Same shape as the balance function but converges to 0 at extremes instead of -1
@@ -45,10 +45,8 @@ def soft_balance(d, lambda_min, lambda_0, lambda_max):
     return (a + 1) / 2
 
 
-@njit
-def close_distance(d, lambdas):
-    # type: (float, (float, float)) -> float
-    lambda_min, lambda_max = lambdas
+@vectorize(cache=True)
+def close_distance(d, lambda_min, lambda_max):
     if d <= lambda_min or d > lambda_max:
         res = -1
 
@@ -58,25 +56,22 @@ def close_distance(d, lambdas):
     return res
 
 
-@njit
-def open_distance(d, lambdas):
-    lambda_min, lambda_max = lambdas
+@vectorize(cache=True)
+def open_distance(d, lambda_min, lambda_max):
     if d <= lambda_min:
         return 1
     else:
-        return close_distance(d, lambdas)
+        return close_distance(d, lambda_min, lambda_max)
 
 
-@njit
-def obstacle(d, lambdas):
-    # type: (float, (float, float)) -> float
+@vectorize(cache=True)
+def obstacle(d, lambda_min, lambda_max):
     """
     Obstacle type interest base function:
-    below lambda min (lambdas[0]), impossible to spawn
+    below lambda min, impossible to spawn
     between lambdas, possible but unwanted
     above lambda max, neutral
     """
-    lambda_min, lambda_max = lambdas
     if d <= lambda_min:
         return -1
     elif d >= lambda_max:
@@ -8,12 +8,11 @@ from __future__ import division
 from typing import List
 
 import numpy as np
-from numba import njit
 
 from building_seeding import Parcel
 from building_seeding.building_encyclopedia import BUILDING_ENCYCLOPEDIA
 from building_seeding.interest.math_function import attraction_repulsion
-from utils import Point, X_ARRAY, Z_ARRAY, absolute_distance
+from utils import Point, absolute_distance
 
 
 def local_sociability(x, z, building_type, scenario, settlement_seeds: List[Parcel]):
@@ -47,19 +46,21 @@ def sociability(building_type, scenario, settlement_seeds, size):
     for seed in settlement_seeds:
         neighbor_type, pos = seed.building_type, seed.center
         lambdas = BUILDING_ENCYCLOPEDIA[scenario]["Sociability"][building_type.name + "-" + neighbor_type.name]
-        sociability_one = sociability_one_seed(*lambdas, pos.x, pos.z, size)
-        unreachable |= (sociability_one == -1)
-        sociability_all += sociability_one
+        window, sociability_one = sociability_one_seed(*lambdas, pos.x, pos.z, size)
+        unreachable[window] |= (sociability_one == -1)
+        sociability_all[window] += sociability_one
 
     sociability_all /= len(settlement_seeds)
     sociability_all[unreachable] = -1
     return sociability_all
 
 
-@njit()
 def sociability_one_seed(l0, l1, l2, x, z, size):
-    X = np.full(size, x)
-    Z = np.full(size, z)
-    D = np.maximum(np.abs(X - X_ARRAY), np.abs(Z - Z_ARRAY))
-    # D = np.sqrt((X - X_ARRAY) ** 2 + (Z - Z_ARRAY) ** 2)
-    return attraction_repulsion(D, l0, l1, l2)
+    """
+    Sociability of a seed is null beyond l2, it is only computed in the Chebyshev window of radius l2 around it
+    :return: window of the map as a tuple of slices, sociability of the seed in this window
+    """
+    window = tuple(slice(max(0, int(c - l2)), max(0, min(s, int(c + l2) + 2))) for c, s in zip((x, z), size))
+    X, Z = np.ogrid[window]
+    D = np.maximum(np.abs(x - X), np.abs(z - Z))
+    return window, attraction_repulsion(D, l0, l1, l2)
@@ -50,18 +50,9 @@ class Parcel(TransformBox):
         Computes entry point of the parcel based on the closest road point
         """
         road_net = self._map.road_network
-
-        def key(road_block):
-            """
-            arbitrary key to find closest road point
-            :param road_block:
-            :return:
-            """
-            road_y = self._map.height_map[road_block.x, road_block.z]
-            self_y = self._map.height_map[self.mean_x, self.mean_z]
-            return manhattan(Point(self.mean_x, self.mean_z, self_y), Point(road_block.x, road_block.z, road_y))
-
-        self._entry_point = argmin(road_net.road_blocks, key=key) if road_net.road_blocks else Position(0, 0)
+        # closest road point in manhattan distance, accounting for the heights
+        entry_point = road_net.closest_road_block(Point(self.mean_x, self.mean_z), self._map.height_map)
+        self._entry_point = entry_point if entry_point is not None else Position(0, 0)
 
     def expand(self, direction: Direction, **kwargs):
         """
@@ -88,7 +79,7 @@ class Parcel(TransformBox):
         if ext.minx < 0 or ext.minz < 0 or ext.maxx >= obstacle.width or ext.maxz >= obstacle.length:
             return False
 
-        no_obstacle = (obstacle[ext.minx:ext.maxx, ext.minz:ext.maxz] == 0).all()
+        no_obstacle = obstacle.is_free(ext.minx, ext.minz, ext.maxx, ext.maxz)
         # h = self._map.height_map.box_height(expanded, True)
         # flat_extend = (h.max() - h.min()) / min(expanded.width, expanded.length) <= 0.7
         flat_extend = True
@@ -212,12 +203,13 @@ class MaskedParcel(Parcel):
             Parcel.__init__(self, seed, building_type, mc_map)
             self.__expendable = True
 
-    def __valid_extended_point(self, x, z, direction):
-        """Can we extend the parcel to the point x, z from a given direction"""
+    @staticmethod
+    def __valid_extension(ext, direction):
+        """Can we extend the parcel to the points of ext from a given direction"""
         obstacle = ObstacleMap()
-        point = Point(x, z)
-        source = point - direction.value  # type: Point
-        return obstacle.is_accessible(source) and obstacle.is_accessible(direction)
+        dx, dz = direction.x, direction.z
+        sources = np.asarray(obstacle[ext.minx - dx:ext.maxx - dx, ext.minz - dz:ext.maxz - dz]) == 0
+        return sources.flatten() & obstacle.is_accessible(direction)
 
     def is_expendable(self, direction: Direction) -> bool:
         if not self.__expendable:
@@ -237,9 +229,9 @@ class MaskedParcel(Parcel):
             if not (expanded.width <= 3 and expanded.length <= 3) or MIN_RATIO_SIDE <= expanded_ratio: return False
 
             obstacle.hide_obstacle(*self.obstacle())
-            validity = [self.__valid_extended_point(x, z, direction) for x, y, z in ext.positions]
+            validity = self.__valid_extension(ext, direction)
             obstacle.reveal_obstacles()
-            return sum(validity) >= len(validity) // 2
+            return validity.sum() >= len(validity) // 2
 
     def expand(self, direction: Direction, **kwargs) -> None:
         from numpy import insert
@@ -249,10 +241,10 @@ class MaskedParcel(Parcel):
 
         # compute extended mask and mark it on the obstacle map
         ext = TransformBox.expand(self, direction) - self
-        mask_extension = [self.__valid_extended_point(x, z, direction) for x, y, z in ext.positions]
+        mask_extension = self.__valid_extension(ext, direction)
 
         super(Parcel, self).expand(direction, inplace=True)
-        self._mask = insert(self._mask, index[direction], np.array(mask_extension), axis=axis[direction])
+        self._mask = insert(self._mask, index[direction], mask_extension, axis=axis[direction])
         ObstacleMap().add_obstacle(*self.obstacle())
 
     def obstacle(self, margin=0, forget=False):
@@ -5,7 +5,7 @@ from gdpc import worldLoader
 
 from generation.generators import *
 from generation.structure import AREA_STRUCTURE
-from utils import bernouilli, Direction
+from utils import bernouilli, Direction, FenwickTree
 
 
 class ProcHouseGenerator(MaskedGenerator):
@@ -445,6 +445,7 @@ class ProcHouseGeneratorBuilder():
     def __init__(self, origin: Position, mask: np.ndarray):
         self.__origin = origin
         self.__mask = mask
+        self.__excluded = FenwickTree(~np.asarray(mask, dtype=bool))  # points outside of the mask
 
     def build(self, box: BoundingBox, n_iter: int = 100) -> _RoomSymbol:
         best_foot_print: _RoomSymbol = None
@@ -524,7 +525,7 @@ class ProcHouseGeneratorBuilder():
         for sub_room in rooms:
             min_x = sub_room.origin.x - self.__origin.x
             min_z = sub_room.origin.z - self.__origin.z
-            if not self.__mask[min_x:(min_x + sub_room.width), min_z:(min_z + sub_room.length)].all():
+            if self.__excluded.sum(min_x, min_z, min_x + sub_room.width, min_z + sub_room.length):
                 return False
         return True
 
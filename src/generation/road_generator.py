@@ -6,6 +6,7 @@ from typing import Dict
 import numpy as np
 from numpy import uint8
 from numpy.random.mtrand import choice
+from scipy import ndimage
 
 from generation.generators import Generator, place_street_lamp, place_torch_post
 from terrain import ObstacleMap
@@ -18,10 +19,14 @@ class RoadGenerator(Generator):
     def __init__(self, network, box: BoundingBox, maps):
         super().__init__(box)
         self.__network = network
-        self.__fluids = maps.fluid_map
         self.__maps = maps
         self.__origin = Point(box.minx, box.minz)  # type: Point
 
+    @property
+    def __fluids(self):
+        # terrain layers are computed on first access
+        return self.__maps.fluid_map
+
     def generate(self, terrain, height_map=None, palette=None):
         from terrain import TerrainMaps
         terrain: TerrainMaps
@@ -75,15 +80,17 @@ class RoadGenerator(Generator):
         print("OK")
 
     def __generate_street_lamps(self, terrain, districts):
+        from terrain.road_network import _NORMAL_ROAD
         unlit_array: np.ndarray = np.zeros((self.width, self.length), dtype=np.uint8)
         network = self.__network
         W, L = self.width, self.length
         for dw in range(2, -1, -1):  # dw in (2, 1, 0):
-            for road_point in network.road_blocks:  # type: Point
-                w0: int = network.get_road_width(road_point) // 2
-                x, z = road_point.x, road_point.z
-                w1 = w0 + dw
-                unlit_array[max(0, x - w1):min(W, x + w1 + 1), max(0, z - w1):min(W, z + w1 + 1)] = dw
+            for width in np.unique(network.network[network.network > 0]):
+                # squares of side 2 * w1 + 1 around the road blocks of this width
+                w1 = width // 2 + dw
+                road_blocks = (network.network == width) & (network.road_class == _NORMAL_ROAD)
+                square = np.ones((2 * w1 + 1, 2 * w1 + 1), dtype=bool)
+                unlit_array[ndimage.binary_dilation(road_blocks, structure=square)] = dw
         unlit_array[ObstacleMap()[:] > 0] = 0  # lamps don't spawn on obstacles
         # del w0, w1, dw, x, z
 
@@ -36,6 +36,14 @@ MIN_DIST_TO_RIVER = 4
 SEED_COUNT = 200
 REPLACE_PARCEL_TYPE_EXPLORATION = 15
 
+# level requests
+FETCH_TILE_SIZE = 256  # side of the tiles requested concurrently, rounded up to a multiple of the chunk size
+FETCH_WORKERS = 4
+FETCH_RETRIES = 2
+
+# terrain analysis
+LAYER_WORKERS = 2  # processes computing independent terrain layers, 1 to compute them sequentially
+
 MAX_INT = 1 << 15
 MAX_FLOAT = float(MAX_INT)
 TERRAFORM_ITERATIONS = 3
\ No newline at end of file
@@ -1,11 +1,11 @@
-import itertools
 import logging
 import traceback
-from math import exp
+from math import ceil, exp
 from random import choice
 from typing import List, Dict
 
 import numpy as np
+from scipy import ndimage
 from sortedcontainers import SortedList
 
 from building_seeding import Districts, Parcel, VillageSkeleton, BuildingType, MaskedParcel
@@ -88,8 +88,8 @@ class Settlement:
                 else:
                     logging.debug('\tDismissed point {} at {}m < {}m'.format(*log_args))
                     min_distance_to_roads *= 0.9
-            print(f"[Settlement] Creating road towards border point at {out_connections[-1]}")
-            self._road_network.connect_to_network(out_connections[-1])
+            print(f"[Settlement] Settled on border point at {out_connections[-1]}")
+        self._road_network.connect_all_to_network([_.asPosition for _ in out_connections[1:]])
 
     def build_skeleton(self, time_limit: int, do_visu: bool = False):
         village_skeleton = VillageSkeleton('Flat_scenario', self._maps, self.districts, self._parcels)
@@ -221,11 +221,11 @@ class Settlement:
             ya = base_height[u.x, u.z]
             new_y = smooth_height[u.x, u.z]
             self._maps.height_map.update([u], [new_y])
-            surface_block = self._maps.level.getBlockAt(u.abs_x, ya, u.abs_z)
+            surface_block = self._maps.blocks.name_at(u.x, ya, u.z)
             setBlock(Point(u.abs_x, u.abs_z, new_y), surface_block)
 
             if ya + 4 > new_y > ya:
-                below_block = self._maps.level.getBlockAt(u.abs_x, ya - 1, u.abs_z)
+                below_block = self._maps.blocks.name_at(u.x, ya - 1, u.z)
                 box = TransformBox((u.abs_x, ya, u.abs_z), (1, new_y - ya, 1))
                 fillBlocks(box, below_block)
 
@@ -235,33 +235,29 @@ class Settlement:
                 fillBlocks(box, BlockAPI.blocks.Air)
 
     def clean_road_network(self):
-        road_map = (self._road_network.network > 0).astype(int)
+        """
+        Truncates the dead ends of the road network which start at a node, by up to AVERAGE_PARCEL_SIZE / 2 blocks.
+        Every dead end loses its extremity at each pass, the road blocks with a single neighbour among their 8
+        neighbours being found by a convolution of the road map
+        """
         network: RoadNetwork = self._road_network
-
-        def degree(p: Point):
-            arr = road_map[max(0, p.x - 1):min(p.x + 2, road_map.shape[0]),
-                           max(0, p.z - 1):min(p.z + 2, road_map.shape[1])]
-            return arr.sum() - 1
-
-        def get_neighbour(p: Point):
-            for dx, dz in itertools.product(range(-1, 2), range(-1, 2)):
-                if self._maps.in_limits(p + Point(dx, dz), False) and road_map[p.x + dx, p.z + dz]:
-                    return p + Point(dx, dz)
-
-        def unset_road(p: Position):
-            if p in network.road_blocks:
-                network.road_blocks.remove(p)
-            else:
-                network.special_road_blocks.remove(p)
-            road_map[p.x, p.z] = 0
-            network.network[p.x, p.z] = 0
-
-        for extremity in filter(lambda node: degree(node) == 1, network.nodes):
-            truncated_length = 0
-            while truncated_length < AVERAGE_PARCEL_SIZE / 2 and bool(extremity) and degree(extremity) == 1:
-                unset_road(extremity)
-                extremity = get_neighbour(extremity)
-                truncated_length += 1
+        road_map = network.network > 0
+        neighbourhood = np.ones((3, 3), dtype=bool)
+
+        extremities = np.zeros(road_map.shape, dtype=bool)
+        for node in network.nodes:
+            extremities[node.x, node.z] = True
+
+        for _ in range(ceil(AVERAGE_PARCEL_SIZE / 2)):
+            degree = ndimage.convolve(road_map.astype(int), neighbourhood.astype(int), mode='constant') - road_map
+            extremities &= road_map & (degree == 1)
+            if not extremities.any():
+                break
+            road_map[extremities] = False
+            for x, z in np.argwhere(extremities):
+                network.remove_road_block(Position(x, z))
+            # next extremities: the neighbours of the removed blocks
+            extremities = ndimage.binary_dilation(extremities, structure=neighbourhood)
 
     def __generate_road_signs(self):
         from building_seeding.settlement import Town
@@ -1,5 +1,6 @@
 from .entity_manager import EntityManager
 from .obstacle_map import ObstacleMap
+from terrain.block_volume import BlockVolume
 from terrain.fluid_map import FluidMap
 from terrain.height_map import HeightMap
 from terrain.road_network import RoadNetwork
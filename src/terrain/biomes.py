@@ -1,5 +1,6 @@
 from enum import Enum
 from itertools import product
+from typing import Dict
 
 import cv2
 import numpy as np
@@ -80,12 +81,26 @@ class BiomeMap(PointArray):
             x0, z0 = chunkX * 4, chunkZ * 4
             values[x0: (x0+4), z0: (z0+4)] = np.array(biomes).reshape((4, 4), order='F')
 
-        obj = super().__new__(cls, values)
+        return cls.restore({"values": values, "size": np.array(level.rect[2:])}, area)
+
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray], area: BuildArea):
+        obj = super().__new__(cls, arrays["values"])
         obj.__offset = Point(area.x % 16, area.z % 16)
-        obj.awidth = level.rect[2]
-        obj.alength = level.rect[3]
+        obj.awidth, obj.alength = (int(_) for _ in arrays["size"])
         return obj
 
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {"values": np.asarray(self), "size": np.array([self.awidth, self.alength])}
+
+    @property
+    def block_values(self) -> np.ndarray:
+        """
+        :return: (x, z) array of the biome ids of every block of the build area
+        """
+        x_array, z_array = np.indices((self.awidth, self.alength))
+        return np.asarray(self)[(x_array + self.__offset.x) // 4, (z_array + self.__offset.z) // 4].astype(int)
+
     def __getitem__(self, item):
         if not isinstance(item, Point):
             return self[Point(item[0], item[1])]
@@ -137,7 +152,10 @@ class BiomeMap(PointArray):
     def temperature_map(self) -> np.ndarray:
         mult = 100
         if self.__temperature is None:
-            init_temperature = np.array([[self.temperature(Position(x, z)) * mult for z in range(self.alength)] for x in range(self.awidth)], dtype=np.uint8)
+            # temperature of each biome of the build area, then broadcast to its blocks
+            biome_ids, block_biomes = np.unique(self.block_values, return_inverse=True)
+            temperatures = np.array([Biomes.from_name(self.getBiome(_)).temperature for _ in biome_ids])
+            init_temperature = (temperatures[block_biomes].reshape(self.awidth, self.alength) * mult).astype(np.uint8)
             self.__temperature = cv2.blur(init_temperature, (15, 15)) / mult
 
         return self.__temperature
@@ -0,0 +1,179 @@
+"""
+Numeric representation of the blocks of the build area, decoded once from the chunk sections of a WorldSlice
+"""
+from math import ceil, log2
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from gdpc.worldLoader import WorldSlice
+from utils import BuildArea, ground_blocks, water_blocks, lava_blocks
+
+WORLD_HEIGHT = 256
+SECTION_SIZE = 16
+VOID_AIR = "minecraft:void_air"  # block returned by WorldSlice.getBlockAt in missing sections
+
+
+def short_name(block: str) -> str:
+    """
+    :param block: namespaced block string, eg "minecraft:oak_stairs[facing=north]"
+    :return: block name without namespace nor properties, eg "oak_stairs"
+    """
+    return block.split(':')[-1].split('[')[0]
+
+
+def _is_trunk(name: str) -> bool:
+    return 'log' in name or 'stem' in name
+
+
+def _is_leaves(name: str) -> bool:
+    return '_leaves' in name or 'mushroom_block' in name
+
+
+# Block categories shared by the terrain maps, as predicates on the short block name
+BLOCK_CATEGORIES: Dict[str, Callable[[str], bool]] = {
+    "air": lambda name: name.endswith("air"),
+    "ground": lambda name: name in ground_blocks,
+    "water": lambda name: name in water_blocks,
+    "lava": lambda name: name in lava_blocks,
+    "log": _is_trunk,
+    "leaves": _is_leaves,
+    "tree": lambda name: _is_trunk(name) or _is_leaves(name),
+    "cave_air": lambda name: name == "cave_air"
+}
+
+
+class BlockVolume:
+    """
+    Blocks of the build area stored as a uint16 (x, y, z) array of palette indexes, coordinates relative to the build
+    area. The palette is shared by all chunk sections, so that block categories can be evaluated with lookup tables
+    """
+
+    def __init__(self, ids: np.ndarray, palette: List[str]):
+        self.ids: np.ndarray = ids
+        self.palette: List[str] = palette
+        self.__tables: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_world_slice(cls, level: WorldSlice, area: BuildArea):
+        """
+        Unpacks the block states of every chunk section in level.nbtfile
+        :param level: world slice containing the build area
+        :param area: build area, sets the shape of the volume
+        :return: decoded block volume
+        """
+        palette: List[str] = [VOID_AIR]
+        palette_index: Dict[str, int] = {VOID_AIR: 0}
+        ids = np.zeros((area.width, WORLD_HEIGHT, area.length), dtype=np.uint16)
+
+        x_offset, z_offset = level.rect[0] % SECTION_SIZE, level.rect[1] % SECTION_SIZE
+        chunk_width, chunk_length = level.chunkRect[2], level.chunkRect[3]
+        for chunk_x in range(chunk_width):
+            for chunk_z in range(chunk_length):
+                # chunk bounds in the volume, and in the chunk, clipped to the build area
+                x0, z0 = chunk_x * SECTION_SIZE - x_offset, chunk_z * SECTION_SIZE - z_offset
+                vx0, vz0 = max(x0, 0), max(z0, 0)
+                vx1, vz1 = min(x0 + SECTION_SIZE, area.width), min(z0 + SECTION_SIZE, area.length)
+                if vx0 >= vx1 or vz0 >= vz1:
+                    continue
+
+                chunk_id = chunk_x + chunk_z * chunk_width
+                for section in level.nbtfile['Chunks'][chunk_id]['Level']['Sections']:
+                    section_y = section['Y'].value
+                    if 'BlockStates' not in section or not (0 <= section_y < WORLD_HEIGHT // SECTION_SIZE):
+                        continue
+                    names = [_['Name'].value for _ in section['Palette']]
+                    for name in names:
+                        if name not in palette_index:
+                            palette_index[name] = len(palette)
+                            palette.append(name)
+                    lut = np.array([palette_index[name] for name in names], dtype=np.uint16)
+                    states = unpack_block_states(section['BlockStates'].value, len(names))
+                    section_ids = lut[states].reshape((SECTION_SIZE, SECTION_SIZE, SECTION_SIZE)).transpose((2, 0, 1))
+
+                    y0 = section_y * SECTION_SIZE
+                    ids[vx0:vx1, y0:(y0 + SECTION_SIZE), vz0:vz1] = section_ids[(vx0 - x0):(vx1 - x0), :, (vz0 - z0):(vz1 - z0)]
+
+        return cls(ids, palette)
+
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray]):
+        return cls(arrays["ids"], [str(_) for _ in arrays["palette"]])
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {"ids": self.ids, "palette": np.array(self.palette)}
+
+    def table(self, category: str) -> np.ndarray:
+        """
+        :param category: key of BLOCK_CATEGORIES
+        :return: boolean lookup table, True for palette entries belonging to the category
+        """
+        if category not in self.__tables:
+            predicate = BLOCK_CATEGORIES[category]
+            self.__tables[category] = np.array([predicate(short_name(_)) for _ in self.palette], dtype=bool)
+        return self.__tables[category]
+
+    def class_table(self, *categories: str) -> np.ndarray:
+        """
+        :param categories: keys of BLOCK_CATEGORIES
+        :return: uint8 lookup table mapping palette entries to 1 + index of their first matching category, 0 otherwise
+        """
+        classes = np.zeros(len(self.palette), dtype=np.uint8)
+        for index in range(len(categories) - 1, -1, -1):
+            classes[self.table(categories[index])] = index + 1
+        return classes
+
+    def mask(self, category: str) -> np.ndarray:
+        """
+        :return: boolean (x, y, z) array, True for blocks belonging to the category
+        """
+        return self.table(category)[self.ids]
+
+    def surface(self, category: str, heights: np.ndarray) -> np.ndarray:
+        """
+        :param category: key of BLOCK_CATEGORIES
+        :param heights: (x, z) array of altitudes
+        :return: boolean (x, z) array, True where the block at the given altitude belongs to the category
+        """
+        return self.table(category)[self.surface_ids(heights)]
+
+    def surface_ids(self, heights: np.ndarray) -> np.ndarray:
+        """
+        :param heights: (x, z) array of altitudes
+        :return: (x, z) array of palette indexes of the blocks at the given altitudes
+        """
+        heights = np.clip(np.asarray(heights, dtype=int), 0, WORLD_HEIGHT - 1)
+        x_array, z_array = np.indices(heights.shape)
+        return self.ids[x_array, heights, z_array]
+
+    def name_at(self, x: int, y: int, z: int) -> str:
+        """
+        :return: namespaced block string at coordinates relative to the build area, as WorldSlice.getBlockAt
+        """
+        if not 0 <= y < WORLD_HEIGHT:
+            return VOID_AIR
+        return self.palette[self.ids[x, y, z]]
+
+    @property
+    def shape(self):
+        return self.ids.shape
+
+
+_unpack_indexes: Dict[int, tuple] = {}
+
+
+def unpack_block_states(block_states, palette_size: int) -> np.ndarray:
+    """
+    Unpacks a section BlockStates long array (1.16+ layout: entries do not span over two longs)
+    :param block_states: packed signed longs
+    :param palette_size: length of the section palette
+    :return: 4096 palette indexes, in Y, Z, X order
+    """
+    bits = max(4, int(ceil(log2(palette_size))))
+    if bits not in _unpack_indexes:
+        per_long = 64 // bits
+        entries = np.arange(SECTION_SIZE ** 3)
+        _unpack_indexes[bits] = entries // per_long, ((entries % per_long) * bits).astype(np.uint64)
+    long_index, shifts = _unpack_indexes[bits]
+    longs = np.asarray(block_states, dtype=np.int64).view(np.uint64)
+    return ((longs[long_index] >> shifts) & np.uint64((1 << bits) - 1)).astype(np.intp)
@@ -1,5 +1,6 @@
 from typing import List, Dict
 
+import numpy as np
 from gdpc import worldLoader
 
 from utils import Position, euclidean, Point
@@ -25,6 +26,21 @@ class EntityManager():
     def from_world_slice(cls, world_slice: worldLoader.WorldSlice):
         return EntityManager(detect_entities(world_slice))
 
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray]):
+        positions = arrays["positions"].reshape((-1, 3)).tolist()
+        return EntityManager([Entity(str(e_type), tuple(pos)) for e_type, pos in zip(arrays["types"], positions)])
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        :return: types and initial positions of the wild entities
+        """
+        wild_entities = [e for e, is_wild in self.__is_wild.items() if is_wild]
+        return {
+            "types": np.array([e.entity_type for e in wild_entities], dtype=str),
+            "positions": np.array([e.position for e in wild_entities], dtype=float).reshape((-1, 3))
+        }
+
     def __add_entity(self, entity: Entity, is_wild: bool) -> Entity:
         etype = entity.entity_type.replace("minecraft:", "")
         self.__entities.setdefault(etype, []).append(entity)
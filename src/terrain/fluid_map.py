@@ -1,25 +1,30 @@
 from __future__ import print_function
 
-from itertools import product
 from time import time
-from typing import List
+from typing import Dict, List
 
 import numpy as np
+from scipy import ndimage
 from sklearn.semi_supervised import LabelPropagation, LabelSpreading
 
-from gdpc.worldLoader import WorldSlice
-from utils import Point, water_blocks, lava_blocks, \
-    BuildArea, getBlockRelativeAt, PointArray, Direction
+from utils import Point, BuildArea, PointArray
 import parameters
 from terrain.biomes import BiomeMap
-from utils.algorithms.fast_dijkstra import fast_dijkstra
+from terrain.block_volume import BlockVolume
+from utils.algorithms.fast_dijkstra import multi_source_distances
 from utils.parameters import MIN_DIST_TO_OCEAN, MIN_DIST_TO_RIVER, \
     MIN_DIST_TO_LAVA
 
 
 class FluidMap(PointArray):
 
-    def __new__(cls, level: WorldSlice, area: BuildArea, terrain, **kwargs):
+    def __new__(cls, blocks: BlockVolume, area: BuildArea, terrain, **kwargs):
+        obj = cls.__empty(area, terrain, **kwargs)
+        obj.detect_sources(blocks)
+        return obj
+
+    @classmethod
+    def __empty(cls, area: BuildArea, terrain, **kwargs):
         values = np.zeros((area.width, area.length), dtype=np.int0)
         obj = super().__new__(cls, values)
         obj.area = area
@@ -33,54 +38,55 @@ class FluidMap(PointArray):
         obj.__coastline = []  # type: List[Point]
 
         obj.has_lava = obj.has_river = obj.has_ocean = False
-        obj.detect_sources(level)
+        return obj
 
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray], area: BuildArea, terrain):
+        obj = cls.__empty(area, terrain)
+        obj.__water_map = np.asarray(arrays["water"])
+        obj.__lava_map = np.asarray(arrays["lava"])
+        obj.river_distance = np.asarray(arrays["river_distance"])
+        obj.ocean_distance = np.asarray(arrays["ocean_distance"])
+        obj.lava_distance = np.asarray(arrays["lava_distance"])
+        obj.__borderpts = [Point(x, z) for x, z in arrays["border_points"].tolist()]
+        obj.__coastline = [Point(x, z) for x, z in arrays["coastline"].tolist()]
+        obj.has_lava, obj.has_river, obj.has_ocean = (bool(_) for _ in arrays["flags"])
         return obj
 
-    def detect_sources(self, level, algorithm='spread', kernel='knn', param=16):
-        # type: (WorldSlice, str, str, int) -> None
-        water_points = []
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {
+            "water": self.__water_map,
+            "lava": self.__lava_map,
+            "river_distance": self.river_distance,
+            "ocean_distance": self.ocean_distance,
+            "lava_distance": self.lava_distance,
+            "border_points": np.array([(p.x, p.z) for p in self.__borderpts], dtype=int).reshape((-1, 2)),
+            "coastline": np.array([(p.x, p.z) for p in self.__coastline], dtype=int).reshape((-1, 2)),
+            "flags": np.array([self.has_lava, self.has_river, self.has_ocean])
+        }
+
+    def detect_sources(self, blocks, algorithm='components', kernel='knn', param=16):
+        # type: (BlockVolume, str, str, int) -> None
+        """
+        Detects surface water and lava, and labels water bodies as ocean (1), river (2) or swamp (3)
+        :param algorithm: 'components' to label each connected water body by majority vote of its biomes, 'spread' or
+        'prop' to fit sklearn LabelSpreading / LabelPropagation on the water points
+        """
         t0 = time()
-        for x, z in product(range(self.area.width), range(self.area.length)):
-            y: int = self.terrain.height_map[x, z]
-            if getBlockRelativeAt(level, x, y, z).split(':')[-1] in water_blocks:
-                biome = BiomeMap.getBiome(self.terrain.biome[x, z])
-                if 'ocean' in biome or 'beach' in biome:
-                    label = 1
-                elif 'river' in biome:
-                    label = 2
-                elif 'swamp' in biome:
-                    label = 3
-                else:
-                    label = -1  # yet unlabeled
-                water_points.append((x, z, label))
-
-            elif getBlockRelativeAt(level, x, y, z) in lava_blocks:
-                self.__lava_map[x, z] = True
-                self.has_lava = True
-
-        if water_points:
-            data = [entry[:2] for entry in water_points]
-            lbls = [entry[2] for entry in water_points]
-
-            if algorithm in ['prop', 'spread']:
-                algo = LabelPropagation if algorithm == 'prop' else LabelSpreading
-                model = algo(kernel, gamma=param, n_neighbors=min(len(lbls), param), tol=1e-4, max_iter=200)
-                try:
-                    model.fit(data, lbls)
-                    lbls = model.predict(data)
-                except ValueError:
-                    # no water or no labeled water point (ponds only)
-                    lbls = [3 for _ in data]
-
-            lbls = [2 if _ == -1 else _ for _ in lbls]
-
-            for (x, z), water_type in zip(data, lbls):
-                self.__water_map[x, z] = water_type
-                if water_type == 1:
-                    self.has_ocean = True
-                elif water_type in [2, 3]:
-                    self.has_river = True
+        surface_ids = blocks.surface_ids(self.terrain.height_map[:])
+        is_water = blocks.table("water")[surface_ids]
+        is_lava = blocks.table("lava")[surface_ids]
+        self.__lava_map[is_lava] = True
+        self.has_lava = bool(is_lava.any())
+
+        biome_labels = water_biome_labels(self.terrain.biome)
+        if algorithm == 'components':
+            water_map = label_water_components(is_water, biome_labels)
+        else:
+            water_map = label_water_spreading(is_water, biome_labels, algorithm, kernel, param)
+        self.__water_map[:] = water_map
+        self.has_ocean = bool((water_map == 1).any())
+        self.has_river = bool(((water_map == 2) | (water_map == 3)).any())
 
         t1 = time()
         print('Computed water map in {:0.3f} seconds'.format(t1 - t0))
@@ -88,51 +94,24 @@ class FluidMap(PointArray):
         print('Computed distance maps in {:0.3f} seconds'.format(time() - t1))
 
     def __build_distance_maps(self):
-        self.river_distance = np.full(self.__water_map.shape, self.__water_limit, dtype=np.float32)
-        self.ocean_distance = np.full(self.__water_map.shape, self.__water_limit, dtype=np.float32)
-        self.lava_distance = np.full(self.__lava_map.shape, self.__lava_limit, dtype=np.float32)
-
-        for x, z in product(range(self.area.width), range(self.area.length)):
-            if self.__water_map[x, z] in [2, 3]:
-                self.river_distance[x, z] = 0
-            elif self.__water_map[x, z] == 1:
-                self.ocean_distance[x, z] = 0
-            elif self.__lava_map[x, z]:
-                self.lava_distance[x, z] = 0
-            elif (x == 0) or (z == 0) or (x == (self.area.width - 1)) or (z == (self.area.length - 1)):
-                self.__borderpts.append(Point(x, z))
-
-        def is_init_neigh(distance_map, _x, _z):
-            # Context: find border water points in a water surface.
-            # Surrounded water points are useless in exploration
-            W, L = distance_map.shape
-            if distance_map[_x, _z] != 0:
-                return False
-            else:
-                for direction in Direction.cardinal_directions():
-                    x0, z0 = _x + direction.x, _z + direction.z
-                    try:
-                        if distance_map[x0, z0] != 0:
-                            return True  # (x, z) is a water (or lava) point with a non water neighbour
-                    except IndexError:
-                        continue
-                return False
-
-        self.__coastline = [Point(_x, _z) for _x, _z in product(range(self.area.width), range(self.area.length))
-                            if is_init_neigh(self.ocean_distance, _x, _z)]
-
-        fast_dijkstra(self.river_distance, self.terrain.height_map[:])
-        fast_dijkstra(self.ocean_distance, self.terrain.height_map[:])
-        fast_dijkstra(self.lava_distance, self.terrain.height_map[:])
-
-        # __pseudo_dijkstra(self.river_distance)
-        # __pseudo_dijkstra(self.ocean_distance)
-        # __pseudo_dijkstra(self.lava_distance)
-
-        # print(self.river_distance[0, 0])
-        # from matplotlib import pyplot as plt
-        # plt.imshow(self.river_distance)
-        # plt.show()
+        is_river = (self.__water_map == 2) | (self.__water_map == 3)
+        is_ocean = self.__water_map == 1
+        is_lava = self.__lava_map & (self.__water_map == 0)
+
+        sources = np.stack((is_river, is_ocean, is_lava))
+        limits = np.array([self.__water_limit, self.__water_limit, self.__lava_limit])
+        distances = multi_source_distances(self.terrain.height_map[:], sources, limits)
+        self.river_distance, self.ocean_distance, self.lava_distance = distances
+
+        # dry points on the border of the build area
+        is_border = np.ones(is_ocean.shape, dtype=bool)
+        is_border[1:-1, 1:-1] = False
+        dry_border = is_border & ~(is_river | is_ocean | is_lava)
+        self.__borderpts = [Point(x, z) for x, z in np.argwhere(dry_border).tolist()]
+
+        # ocean points with a non ocean cardinal neighbour
+        coastline = is_ocean & ~ndimage.binary_erosion(is_ocean, border_value=1)
+        self.__coastline = [Point(x, z) for x, z in np.argwhere(coastline).tolist()]
 
     def is_lava(self, x_or_point, z=None, margin=0):
         # type: (Point or int, None or int, float) -> object
@@ -186,3 +165,64 @@ class FluidMap(PointArray):
         if self.has_ocean: res = min(res, self.ocean_distance[px, pz])
         if self.has_river: res = min(res, self.river_distance[px, pz])
         return int(res)
+
+
+def water_biome_labels(biome: BiomeMap) -> np.ndarray:
+    """
+    :return: (x, z) array of water labels deduced from the biome: ocean (1), river (2), swamp (3), or unlabeled (-1)
+    """
+    def label(biome_id):
+        biome_name = BiomeMap.getBiome(int(biome_id))
+        if 'ocean' in biome_name or 'beach' in biome_name:
+            return 1
+        elif 'river' in biome_name:
+            return 2
+        elif 'swamp' in biome_name:
+            return 3
+        return -1
+
+    biome_ids, inverse = np.unique(biome.block_values, return_inverse=True)
+    return np.array([label(_) for _ in biome_ids])[inverse].reshape(biome.block_values.shape)
+
+
+def label_water_components(is_water: np.ndarray, biome_labels: np.ndarray) -> np.ndarray:
+    """
+    Labels each 8-connected water body with the most frequent label of its cells, bodies without any labeled cell
+    (ponds) are labeled as swamps
+    :param is_water: (x, z) surface water mask
+    :param biome_labels: (x, z) water labels of the biomes, see water_biome_labels
+    :return: (x, z) water map, 0 outside water
+    """
+    components, component_count = ndimage.label(is_water, structure=np.ones((3, 3)))
+    labeled = is_water & (biome_labels > 0)
+    votes = np.bincount(components[labeled] * 4 + biome_labels[labeled], minlength=4 * (component_count + 1))
+    votes = votes.reshape((component_count + 1, 4))[:, 1:]
+    component_labels = np.where(votes.any(axis=1), votes.argmax(axis=1) + 1, 3)
+    component_labels[0] = 0
+    return component_labels[components]
+
+
+def label_water_spreading(is_water: np.ndarray, biome_labels: np.ndarray, algorithm='spread', kernel='knn', param=16):
+    """
+    Spreads the biome labels over the water points with sklearn LabelSpreading (or LabelPropagation)
+    :return: (x, z) water map, 0 outside water
+    """
+    water_map = np.zeros(is_water.shape, dtype=int)
+    data = np.argwhere(is_water)
+    if not len(data):
+        return water_map
+
+    lbls = biome_labels[is_water]
+    if algorithm in ['prop', 'spread']:
+        algo = LabelPropagation if algorithm == 'prop' else LabelSpreading
+        model = algo(kernel, gamma=param, n_neighbors=min(len(lbls), param), tol=1e-4, max_iter=200)
+        try:
+            model.fit(data, lbls)
+            lbls = model.predict(data)
+        except ValueError:
+            # no water or no labeled water point (ponds only)
+            lbls = np.full(len(data), 3)
+
+    lbls[lbls == -1] = 2
+    water_map[is_water] = lbls
+    return water_map
@@ -1,28 +1,42 @@
-from typing import List
+from typing import Dict, List, Tuple
 
+import numba
 import numpy as np
 import cv2
 
-from gdpc.worldLoader import WorldSlice
-from utils import BuildArea, ground_blocks, water_blocks, lava_blocks, getBlockRelativeAt, PointArray
+from terrain.block_volume import BlockVolume
+from utils import BuildArea, PointArray
 from utils import Point
 
+# block classes used by the column scan, see BlockVolume.class_table
+_OTHER, _GROUND, _WATER, _LAVA, _AIR = range(5)
+
 
 class HeightMap(PointArray):
     __air_height: PointArray
 
-    def __new__(cls, level: WorldSlice, area: BuildArea):
-        # highest non air block
-        obj = super().__new__(cls, HeightMap.__calcGoodHeightmap(level))
+    def __new__(cls, blocks: BlockVolume, area: BuildArea):
+        height, air_height, ocean_floor = _scan_columns(blocks.ids, blocks.class_table("ground", "water", "lava", "air"))
+        return cls.restore({"height": height, "air_height": air_height, "ocean_floor": ocean_floor}, area)
+
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray], area: BuildArea):
+        # highest ground or fluid block, ignoring logs and leaves
+        obj = super().__new__(cls, arrays["height"])
         obj.area = area
-        obj.__air_height = PointArray(level.heightmaps["WORLD_SURFACE"][:] - 1)
+
+        # highest non air block
+        obj.__air_height = PointArray(arrays["air_height"])
 
         # highest solid block (below oceans)
-        obj.__ocean_floor: PointArray = PointArray(np.minimum(obj[:], level.heightmaps["OCEAN_FLOOR"]))
+        obj.__ocean_floor: PointArray = PointArray(arrays["ocean_floor"])
 
         # uses absolute coordinates
         obj.__origin = Point(area.x, area.z)
 
+        # number of calls to update, to tell when the data derived from the heights is outdated
+        obj.__version = 0
+
         steepness_x = cv2.Scharr(obj.astype(np.uint8), 5, 1, 0)
         steepness_z = cv2.Scharr(obj.astype(np.uint8), 5, 0, 1)
 
@@ -35,6 +49,10 @@ class HeightMap(PointArray):
 
         return obj
 
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {"height": np.asarray(self), "air_height": np.asarray(self.__air_height),
+                "ocean_floor": np.asarray(self.__ocean_floor)}
+
     def upper_height(self, xr: Point or int, zr=None):
         """
         :param xr: X coordinate or Point instance
@@ -55,6 +73,34 @@ class HeightMap(PointArray):
             return self.__ocean_floor[xr]
         return self.__ocean_floor[xr, zr]
 
+    @property
+    def upper_heights(self) -> PointArray:
+        """
+        :return: (x, z) array of the Y coordinates of the highest non air blocks
+        """
+        return self.__air_height
+
+    @property
+    def lower_heights(self) -> PointArray:
+        """
+        :return: (x, z) array of the Y coordinates of the highest ground blocks (below oceans, and trees)
+        """
+        return self.__ocean_floor
+
+    @property
+    def version(self) -> int:
+        """
+        :return: counter incremented on every update of the heights
+        """
+        return self.__version
+
+    @property
+    def steepness_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (x, z) arrays of the X and Z coordinates of the steepness vectors, see HeightMap.steepness
+        """
+        return self.__steepness_x, self.__steepness_z
+
     def box_height(self, box, use_relative_coords, include_fluids=False):
         x0 = box.minx if use_relative_coords else box.minx - self.__origin.x
         z0 = box.minz if use_relative_coords else box.minz - self.__origin.z
@@ -75,33 +121,48 @@ class HeightMap(PointArray):
             if self.lower_height(p) == self[p]:
                 self.__ocean_floor[p] = h
             self[p] = h
-
-    @staticmethod
-    def __calcGoodHeightmap(world_slice):
-        """Calculates a heightmap that is well suited for building.
-        It ignores any logs and leaves and treats water as ground.
-
-        Args:
-            world_slice (WorldSlice): an instance of the WorldSlice class containing the raw heightmaps and block data
-
-        Returns:
-            any: numpy array containing the calculated heightmap
-        """
-        hm_mbnl = world_slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"]
-        heightmapNoTrees = hm_mbnl[:]
-        area = world_slice.rect
-
-        valid_blocks = ground_blocks.union(water_blocks).union(lava_blocks)
-
-        def isValidBlock(block):
-            block = block.split(':')[-1].split('[')[0]
-            return block in valid_blocks
-
-        from itertools import product
-        for x, z in product(range(area[2]), range(area[3])):
-            y = heightmapNoTrees[x, z]
-            while not isValidBlock(getBlockRelativeAt(world_slice, x, y-1, z)):
-                y -= 1
-            heightmapNoTrees[x, z] = y
-
-        return np.array(np.minimum(hm_mbnl, heightmapNoTrees)) - 1
+        self.__version += 1
+
+
+@numba.njit(cache=True)
+def _scan_columns(ids: np.ndarray, classes: np.ndarray):
+    """
+    Walks down every column of the block volume in a single pass. Rows of constant (x, y) are contiguous in memory,
+    so that each x slice is scanned row by row from the top, keeping the progress of each column.
+    Logs and leaves are ignored, water and lava are treated as ground
+    :param ids: (x, y, z) palette indexes
+    :param classes: palette index -> _OTHER, _GROUND, _WATER, _LAVA or _AIR
+    :return: (ground or fluid height, highest non air block, ocean floor) as (x, z) arrays
+    """
+    width, world_height, length = ids.shape
+    height = np.zeros((width, length), dtype=np.int64)
+    air_height = np.zeros((width, length), dtype=np.int64)
+    ocean_floor = np.zeros((width, length), dtype=np.int64)
+
+    for x in range(width):
+        # 0: above the highest block, 1: above the surface, 2: in fluids, 3: done
+        phase = np.zeros(length, dtype=np.uint8)
+        remaining = length
+        for y in range(world_height - 1, -1, -1):
+            for z in range(length):
+                block_class = classes[ids[x, y, z]]
+                if phase[z] == 0 and block_class != _AIR:
+                    air_height[x, z] = y
+                    phase[z] = 1
+                if phase[z] == 1 and _OTHER < block_class < _AIR:
+                    height[x, z] = y
+                    if block_class == _GROUND:
+                        ocean_floor[x, z] = y
+                        phase[z] = 3
+                        remaining -= 1
+                    else:
+                        phase[z] = 2
+                elif phase[z] == 2 and block_class == _GROUND:
+                    # first ground block below the fluids, the floor is the lowest fluid block
+                    ocean_floor[x, z] = y + 1
+                    phase[z] = 3
+                    remaining -= 1
+            if remaining == 0:
+                break
+
+    return height, air_height, ocean_floor
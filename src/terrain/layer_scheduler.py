@@ -0,0 +1,154 @@
+"""
+Dependency aware construction of the terrain layers. Independent layers are computed at the same time in a process
+pool, the block volume being shared with the workers through shared memory
+"""
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from time import time
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from terrain.block_volume import BlockVolume
+
+
+class SharedBlocks:
+    """
+    Picklable handle on a block volume copied to shared memory, attached without copy by the worker processes
+    """
+
+    def __init__(self, blocks: BlockVolume):
+        self.__shm = shared_memory.SharedMemory(create=True, size=max(1, blocks.ids.nbytes))
+        self.name: str = self.__shm.name
+        self.shape: Tuple[int, int, int] = blocks.ids.shape
+        self.dtype = blocks.ids.dtype
+        self.palette: List[str] = blocks.palette
+        np.ndarray(self.shape, self.dtype, buffer=self.__shm.buf)[:] = blocks.ids
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype, self.palette
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype, self.palette = state
+        self.__shm = None
+
+    def apply(self, function: Callable, *args, **kwargs):
+        """
+        Attaches the shared memory for a single call, from a worker process: the volume must not be referenced by the
+        result of the function. Workers are forked, so they share the resource tracker of the creating process, which
+        already tracks this memory and is the only one to unlink it
+        :return: function(volume, *args, **kwargs)
+        """
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            return function(BlockVolume(np.ndarray(self.shape, self.dtype, buffer=shm.buf), self.palette), *args, **kwargs)
+        finally:
+            shm.close()
+
+    def release(self):
+        """
+        Frees the shared memory, only from the process which created it
+        """
+        if self.__shm is not None:
+            self.__shm.close()
+            self.__shm.unlink()
+            self.__shm = None
+
+
+class LayerTask(NamedTuple):
+    name: str
+    function: Callable  # called with the results of the dependencies, then the keyword arguments
+    dependencies: Tuple[str, ...]
+    kwargs: Dict
+    local: bool  # True to run in the main process, eg for tasks reading the world slice
+
+
+def _timed_call(function: Callable, *args, **kwargs):
+    t0 = time()
+    result = function(*args, **kwargs)
+    return result, t0, time()
+
+
+class LayerScheduler:
+    """
+    Runs a graph of tasks, each one as soon as its dependencies are completed. Local tasks run in the main process
+    while the other ones are computed by the process pool. Start and end times are recorded to find the critical path
+    """
+
+    def __init__(self, max_workers: int):
+        self.__max_workers = max_workers
+        self.__tasks: Dict[str, LayerTask] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}  # task -> (start, end) times
+
+    @staticmethod
+    def is_available() -> bool:
+        # workers inherit the initialized modules, notably the BuildArea singleton
+        return "fork" in mp.get_all_start_methods()
+
+    def add(self, name: str, function: Callable, *dependencies: str, local: bool = False, **kwargs):
+        assert name not in self.__tasks and all(_ in self.__tasks for _ in dependencies)
+        self.__tasks[name] = LayerTask(name, function, dependencies, kwargs, local)
+
+    def run(self, *targets: str) -> Dict[str, object]:
+        """
+        :param targets: tasks to compute with their dependencies, every task if not specified
+        :return: task name -> result
+        """
+        pending = self.__required_tasks(targets or tuple(self.__tasks))
+        results: Dict[str, object] = {}
+        running: Dict[Future, str] = {}
+
+        def ready_tasks(local: bool) -> List[LayerTask]:
+            return [task for task in pending.values() if task.local == local and all(_ in results for _ in task.dependencies)]
+
+        with ProcessPoolExecutor(self.__max_workers, mp_context=mp.get_context("fork")) as executor:
+            while pending or running:
+                for task in ready_tasks(local=False):
+                    args = [results[_] for _ in task.dependencies]
+                    running[executor.submit(_timed_call, task.function, *args, **task.kwargs)] = task.name
+                    del pending[task.name]
+
+                local_tasks = ready_tasks(local=True)
+                if local_tasks:
+                    # remote tasks keep running in the pool meanwhile
+                    task = local_tasks[0]
+                    del pending[task.name]
+                    args = [results[_] for _ in task.dependencies]
+                    results[task.name], start, end = _timed_call(task.function, *args, **task.kwargs)
+                    self.timings[task.name] = start, end
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name], start, end = future.result()
+                    self.timings[name] = start, end
+
+        return results
+
+    def __required_tasks(self, targets) -> Dict[str, LayerTask]:
+        required: Dict[str, LayerTask] = {}
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in required:
+                required[name] = self.__tasks[name]
+                stack.extend(self.__tasks[name].dependencies)
+        # keep insertion order, which is a topological order
+        return {name: task for name, task in self.__tasks.items() if name in required}
+
+    @property
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        :return: longest chain of dependent tasks among the last run, and its total duration
+        """
+        chains: Dict[str, Tuple[float, List[str]]] = {}
+        for name, task in self.__tasks.items():
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            previous = max((chains[_] for _ in task.dependencies if _ in chains), default=(0, []), key=lambda c: c[0])
+            chains[name] = (previous[0] + end - start, previous[1] + [name])
+        duration, path = max(chains.values(), default=(0, []), key=lambda c: c[0])
+        return path, duration
@@ -1,6 +1,8 @@
-import itertools
+from typing import Callable
 
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 from utils import *
 
@@ -11,31 +13,17 @@ class ObstacleMap(PointArray, metaclass=Singleton):
         obj = super().__new__(cls, values)
         obj.__all_maps = maps
         obj.__hidden_obstacles = []
+        # blocked points, to count obstacles in rectangles
+        obj.__blocked = FenwickTree(np.asarray(obj) != 0) if obj.ndim == 2 else None
+        # callbacks notified with the bounds of every modified rectangle
+        obj.__listeners = []
         return obj
 
     @classmethod
     def from_terrain(cls, terrain):
         height_map: np.ndarray = terrain.height_map[:]
         avg_height: float = np.percentile(height_map, 50)
-        reachable: np.ndarray = (height_map == avg_height)
-        points_to_explore = {(_[0], _[1]) for _ in np.argwhere(reachable).tolist()}
-        explored_points = set()
-        while points_to_explore:
-            point = points_to_explore.pop()
-            for dx, dz in map(lambda direction: (direction.x, direction.z), Direction.cardinal_directions()):
-                neighbour = point[0] + dx, point[1] + dz
-
-                if neighbour in explored_points:
-                    continue
-                try:
-                    if abs(height_map[point] - height_map[neighbour]) <= 1:
-                        reachable[neighbour] = True
-                        points_to_explore.add(neighbour)
-                    else:
-                        explored_points.add(neighbour)
-                except IndexError:
-                    continue
-            explored_points.add(point)
+        reachable: np.ndarray = _reachable_components(height_map, height_map == avg_height)
 
         # reachable = True -> 0, unreachable = False -> 1
         obstacle_from_reachability = (~reachable).astype(int)
@@ -64,14 +52,27 @@ class ObstacleMap(PointArray, metaclass=Singleton):
         # type: (Point) -> bool
         return self[point.x, point.z] == 0
 
-    def __set_obstacle(self, x, z, cost=1):
-        self[x, z] += cost
-
     def __add_obstacle(self, point, mask, cost):
-        for dx, dz in itertools.product(range(mask.shape[0]), range(mask.shape[1])):
-            p = point + Point(dx, dz)
-            if self.__all_maps.in_limits(p, False) and mask[dx, dz]:
-                self.__set_obstacle(p.x, p.z, cost)
+        # clip the mask to the map limits
+        x0, z0 = int(point.x), int(point.z)
+        x1, z1 = min(x0 + mask.shape[0], self.shape[0]), min(z0 + mask.shape[1], self.shape[1])
+        dx, dz = max(-x0, 0), max(-z0, 0)
+        if x1 <= x0 + dx or z1 <= z0 + dz:
+            return
+        clipped_mask = mask[dx:x1 - x0, dz:z1 - z0].astype(bool)
+        window = np.asarray(self)[x0 + dx:x1, z0 + dz:z1]
+        was_blocked = window != 0
+        window += cost * clipped_mask
+        self.__blocked.add(x0 + dx, z0 + dz, (window != 0).astype(int) - was_blocked)
+        for listener in self.__listeners:
+            listener(x0 + dx, z0 + dz, x1, z1)
+
+    def add_listener(self, listener):
+        # type: (Callable[[int, int, int, int], None]) -> None
+        """
+        Registers a callback, called with the bounds (x0, z0, x1, z1) of the rectangle on every obstacle modification
+        """
+        self.__listeners.append(listener)
 
     def hide_obstacle(self, point, mask=None, store_obstacle=True):
         """Hide an obstacle on the map, if store_obstacle, the obstacle will be stored in self._hidden_obstacles
@@ -88,6 +89,40 @@ class ObstacleMap(PointArray, metaclass=Singleton):
             p, mask = self.__hidden_obstacles.pop()
             self.__add_obstacle(p, mask, 1)
 
+    def blocked_count(self, x0, z0, x1, z1):
+        # type: (int, int, int, int) -> int
+        """
+        Number of obstacle points in [x0, x1[ x [z0, z1[, in logarithmic time
+        """
+        return self.__blocked.sum(x0, z0, x1, z1)
+
+    def is_free(self, x0, z0, x1, z1):
+        # type: (int, int, int, int) -> bool
+        """
+        Whether [x0, x1[ x [z0, z1[ is free of obstacles, in logarithmic time
+        """
+        return self.__blocked.sum(x0, z0, x1, z1) == 0
+
     def box_obstacle(self, box):
         matrix = self[box.minx: box.maxx, box.minz:box.maxz]
         return matrix <= 1
+
+
+def _reachable_components(height_map: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Points connected to a source by a 4-connected path whose steps climb at most one block
+    """
+    width, length = height_map.shape
+    index = np.arange(width * length).reshape((width, length))
+    height_map = height_map.astype(int)
+    edges = []
+    for src, dst, step in ((index[:-1, :], index[1:, :], np.diff(height_map, axis=0)),
+                           (index[:, :-1], index[:, 1:], np.diff(height_map, axis=1))):
+        walkable = np.abs(step) <= 1
+        edges.append((src[walkable], dst[walkable]))
+    rows = np.concatenate([_[0] for _ in edges])
+    cols = np.concatenate([_[1] for _ in edges])
+    graph = coo_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(width * length, width * length))
+    _, labels = connected_components(graph, directed=False)
+    labels = labels.reshape((width, length))
+    return np.isin(labels, np.unique(labels[sources]))
@@ -1,17 +1,25 @@
 # coding=utf-8
 import time
+from collections import deque
+from math import sqrt
 from random import choice
-from typing import Callable, List, Set
+from typing import Callable, Dict, List, Set, Tuple
 
-from sortedcontainers import SortedList
+from numba import njit
+from scipy import ndimage
+from scipy.spatial import cKDTree
 
 import terrain
 from generation.generators import *
 from generation.road_generator import RoadGenerator
 from parameters import *
 from utils import Point, euclidean
+from utils.algorithms.grid_astar import DIRECTIONS
 from .obstacle_map import ObstacleMap
 
+# classes of the road blocks, see RoadNetwork.road_class. Special blocks are steep, on water or on obstacles
+_NORMAL_ROAD, _SPECIAL_ROAD = 1, 2
+
 
 class RoadNetwork(metaclass=Singleton):
     """
@@ -25,23 +33,43 @@ class RoadNetwork(metaclass=Singleton):
         # type: (int, int, terrain.TerrainMaps) -> RoadNetwork
         self.width = width
         self.length = length
-        self.network = np.zeros((width, length), dtype=int)
+        # road width of every block, 0 outside of the roads
+        self.network = np.zeros((width, length), dtype=np.uint8)
+        # class of every road block, 0 outside of the roads
+        self.road_class = np.zeros((width, length), dtype=np.uint8)
         # Representing the distance from the network + the path to the network
-        self.cost_map = PointArray(np.full((width, length), MAX_INT))
-        self.distance_map = PointArray(np.full((width, length), MAX_INT))
-        # paths from existing road points to every reachable destination
-        self.path_map = PointArray(np.empty((width, length), dtype=list))
+        self.cost_map = PointArray(np.full((width, length), MAX_INT, dtype=np.float32))
+        self.distance_map = PointArray(np.full((width, length), MAX_INT, dtype=np.float32))
+        # flat index x * length + z of the next point on the path to the network, -1 if unreachable, see path_from_road
+        self.predecessor_map = PointArray(np.full((width, length), -1, dtype=np.int32))
+        # buffers of the distance map updates, only reset where they were used, see dijkstra
+        self.__scratch_costs = np.full((width, length), MAX_INT, dtype=np.int64)
+        self.__scratch_distances = np.full((width, length), MAX_INT, dtype=np.int64)
+        self.__scratch_predecessors = np.full((width, length), -1, dtype=np.int32)
+        self.__scratch_queue = np.empty(width * length, dtype=np.int64)
+        # callbacks notified with the bounds of every rectangle where the distance maps changed
+        self.__listeners = []
         self.lambda_max = MAX_LAMBDA
 
         # points passed through create_road or connect_to_network
         self.nodes: Set[Position] = set()
-        self.road_blocks: Set[Position] = set()
-        self.special_road_blocks: Set[Position] = set()
         self.__generator = RoadGenerator(self, mc_map.box, mc_map) if mc_map else None
         self.terrain = mc_map
+        # road blocks as flat indices x * length + z, linked to the adjacent road blocks, see road_path
+        self.__road_graph: Dict[int, Set[int]] = {}
+        # road blocks and nodes with their KD-trees, rebuilt after they change, see closest_road_block
+        self.__road_index: Tuple[np.ndarray, cKDTree] = None
+        self.__weighted_road_index: Tuple[terrain.HeightMap, int, cKDTree] = None
+        self.__node_index: Tuple[List[Position], cKDTree] = None
+        # build cost rasters by offsets, created on first use, and the terrain maps they share
+        self.__build_costs: Dict[Tuple[Tuple[int, int], ...], BuildCostRaster] = {}
+        self.__terrain_costs: _TerrainCostMaps = None
+        # views of the road rasters, dropped on every road change
+        self.__obstacle: np.ndarray = None
+        self.__blocks_by_class: Dict[int, Set[Position]] = {}
         RoadNetwork.INSTANCE = self
         from utils.algorithms.path_finder import PathFinder
-        self.__pathFinder: PathFinder = PathFinder(6)
+        self.__pathFinder: PathFinder = PathFinder(16)
 
     # region GETTER AND SETTER
 
@@ -61,25 +89,62 @@ class RoadNetwork(metaclass=Singleton):
         if not self.nodes:
             closest_node = choice(list(self.road_blocks))
         else:
-            for node in self.nodes:
-                if euclidean(node, point) < min_distance:
-                    closest_node = node
-                    min_distance = euclidean(node, point)
+            closest_node = self.__closest_nodes(point, 1)[0]
+            min_distance = euclidean(closest_node, point)
 
-        if not self.road_blocks.difference(self.nodes):
+        # try to promote an extremity to node. If the closest road block is a node, no other block is closer than
+        # the closest node
+        edge = self.closest_road_block(point)
+        if edge is None or edge in self.nodes:
             return closest_node
-
-        # try to promote an extremity to node
-        alt_edge = [_ for _ in self.road_blocks.difference(self.nodes)]
-        alt_dist = [euclidean(_, point) for _ in alt_edge]
-        i = int(argmin(alt_dist))
-        edge, dist = alt_edge[i], alt_dist[i]
+        dist = euclidean(edge, point)
         if dist < min_distance:
             if euclidean(edge, closest_node) >= DIST_BETWEEN_NODES:
                 self.nodes.add(edge)
             closest_node = edge
         return closest_node
 
+    def __closest_nodes(self, point, k):
+        # type: (Point, int) -> List[Position]
+        """
+        :return: the k closest nodes to point in euclidean distance, closest first
+        """
+        if self.__node_index is None or len(self.__node_index[0]) != len(self.nodes):
+            # nodes are only added, the index is rebuilt when their number changes
+            nodes = list(self.nodes)
+            self.__node_index = nodes, cKDTree([(_.x, _.z) for _ in nodes])
+        nodes, tree = self.__node_index
+        k = min(k, len(nodes))
+        _, indices = tree.query((point.x, point.z), k=list(range(1, k + 1)))
+        return [nodes[_] for _ in indices]
+
+    def closest_road_block(self, point, height_map=None):
+        # type: (Point, terrain.HeightMap) -> Position or None
+        """
+        Closest road block to a point, see road_blocks. Queries are answered by KD-trees over the road blocks, rebuilt
+        on the first query after the road blocks change, or after the heights change for the weighted variant
+        :param height_map: if given, distances are the manhattan distances between the highest blocks of the columns
+        of the points, instead of the euclidean distances
+        :return: closest road block, None if there are none
+        """
+        if self.__road_index is None:
+            xz = np.argwhere(self.road_class == _NORMAL_ROAD)
+            self.__road_index = xz, cKDTree(xz) if len(xz) else None
+        xz, tree = self.__road_index
+        if not len(xz):
+            return None
+        if height_map is None:
+            _, i = tree.query((point.x, point.z))
+            return Position(*xz[i])
+
+        if self.__weighted_road_index is None or self.__weighted_road_index[0] is not height_map \
+                or self.__weighted_road_index[1] != height_map.version:
+            # heights of the road blocks change with the terrain
+            heights = np.asarray(height_map)[xz[:, 0], xz[:, 1]]
+            self.__weighted_road_index = height_map, height_map.version, cKDTree(np.column_stack((xz, heights)))
+        _, i = self.__weighted_road_index[2].query((point.x, point.z, height_map[point.x, point.z]), p=1)
+        return Position(*xz[i])
+
     def get_distance(self, x: Point or int, z: int = None) -> float:
         if z is None:
             return MAX_INT if not ObstacleMap().is_accessible(x) else self.get_distance(x.x, x.z)
@@ -91,21 +156,78 @@ class RoadNetwork(metaclass=Singleton):
     def __set_road_block(self, xp, z=None):
         # type: (Position or int, None or int) -> None
         if z is None:
-            # steep roads are not marked as road points
+            x, z = xp.x, xp.z
+            previous = self.road_class[x, z], self.network[x, z]
+            # steep roads are not marked as road points, blocks once marked as road points remain so
             maps = self.terrain
-            if maps and (maps.height_map.steepness(xp.x, xp.z) >= 0.35 or maps.fluid_map.is_water(xp)
+            if maps and (maps.height_map.steepness(x, z) >= 0.35 or maps.fluid_map.is_water(xp)
                          or not ObstacleMap().is_accessible(xp)):
-                self.special_road_blocks.add(xp)
+                self.road_class[x, z] = self.road_class[x, z] or _SPECIAL_ROAD
             else:
-                self.road_blocks.add(xp)
-            x, z = xp.x, xp.z
+                self.road_class[x, z] = _NORMAL_ROAD
             if self.network[x, z] == 0:
                 self.network[x, z] = MIN_ROAD_WIDTH
             elif self.network[x, z] < MAX_ROAD_WIDTH:
                 self.network[x, z] += 1
+            if (self.road_class[x, z], self.network[x, z]) != previous:
+                self.__on_road_change(x, z)
         else:
             self.__set_road_block(Position(xp, z))
 
+    def remove_road_block(self, position: Position) -> None:
+        """
+        Removes a road block from the network, its distance maps are left as they are
+        """
+        x, z = position.x, position.z
+        self.network[x, z] = self.road_class[x, z] = 0
+        self.__on_road_change(x, z)
+        for neighbour in self.__road_graph.pop(x * self.length + z, ()):
+            self.__road_graph[neighbour].discard(x * self.length + z)
+
+    def __on_road_change(self, x, z):
+        # type: (int, int) -> None
+        """
+        Drops the data derived from the road rasters after the width or the class of the road block (x, z) changed
+        """
+        for build_costs in self.__build_costs.values():
+            build_costs.invalidate(x, z, x + 1, z + 1)
+        self.__obstacle = None
+        self.__blocks_by_class.clear()
+        self.__road_index = None
+        self.__weighted_road_index = None
+
+    @property
+    def road_blocks(self) -> Set[Position]:
+        """
+        :return: road blocks of the normal class, not to be modified, see road_class
+        """
+        return self.__blocks_of_class(_NORMAL_ROAD)
+
+    @property
+    def special_road_blocks(self) -> Set[Position]:
+        """
+        :return: steep, water or obstacle road blocks, not to be modified, see road_class
+        """
+        return self.__blocks_of_class(_SPECIAL_ROAD)
+
+    def __blocks_of_class(self, road_class):
+        # type: (int) -> Set[Position]
+        if road_class not in self.__blocks_by_class:
+            self.__blocks_by_class[road_class] = {Position(x, z) for x, z in np.argwhere(self.road_class == road_class)}
+        return self.__blocks_by_class[road_class]
+
+    def build_costs(self, step: int = 1, offsets=None) -> "BuildCostRaster":
+        """
+        :param offsets: moves (dx, dz) of the raster, def: moves of step in the 4 directions, see BuildCostRaster
+        :return: costs to build a road between every point and the points at these offsets, see BuildCostRaster
+        """
+        offsets = tuple(offsets) if offsets is not None else tuple((dx * step, dz * step) for dx, dz in DIRECTIONS)
+        if offsets not in self.__build_costs:
+            if self.__terrain_costs is None and self.terrain is not None:
+                self.__terrain_costs = _TerrainCostMaps(self.terrain)
+            self.__build_costs[offsets] = BuildCostRaster(self, offsets=offsets, terrain_costs=self.__terrain_costs)
+        return self.__build_costs[offsets]
+
     def is_road(self, x, z=None):
         # type: (Point or int, None or int) -> bool
         if z is None:
@@ -118,14 +240,14 @@ class RoadNetwork(metaclass=Singleton):
         if self.is_road(point):
             return point
         if self.is_accessible(point):
-            return self.path_map[point][0]
+            return self.path_from_road(point)[0]
         else:
             return self.__get_closest_node(point)
 
     def __invalidate(self, point):
         self.distance_map[point] = MAX_INT
         self.cost_map[point] = MAX_INT
-        self.path_map[point] = None
+        self.predecessor_map[point] = -1
 
     def __set_road(self, path):
         # type: ([Point]) -> None
@@ -134,12 +256,68 @@ class RoadNetwork(metaclass=Singleton):
             self.__generator.handle_new_road(path)
         for point in path:
             self.__set_road_block(point.asPosition)
+        self.__link_road_blocks(path)
         self.__update_distance_map(path, force_update)
         self.__pathFinder.registerRoad(path)
 
+    def __link_road_blocks(self, path):
+        # type: ([Point]) -> None
+        """
+        Adds the road blocks of the path to the road graph, linked to the next block of the path and to the adjacent
+        road blocks
+        """
+        indices = [p.x * self.length + p.z for p in path]
+        for i, j in zip(indices, indices[1:]):
+            self.__road_graph.setdefault(i, set()).add(j)
+            self.__road_graph.setdefault(j, set()).add(i)
+        for p, i in zip(path, indices):
+            self.__road_graph.setdefault(i, set())
+            for dx, dz in DIRECTIONS:
+                x, z = p.x + dx, p.z + dz
+                if 0 <= x < self.width and 0 <= z < self.length and self.network[x, z] > 0:
+                    self.__road_graph[i].add(x * self.length + z)
+                    self.__road_graph.setdefault(x * self.length + z, set()).add(i)
+
+    def road_path(self, source: Point, target: Point) -> List[Point]:
+        """
+        Shortest path between two road points walking on the roads only, breadth first in the road graph
+        :return: path from source to target, both included, empty if they are not connected by roads
+        """
+        source_index, target_index = source.x * self.length + source.z, target.x * self.length + target.z
+        if source_index not in self.__road_graph or target_index not in self.__road_graph:
+            return []
+        parents = {source_index: source_index}
+        queue = deque([source_index])
+        while queue and target_index not in parents:
+            index = queue.popleft()
+            for neighbour in self.__road_graph[index]:
+                if neighbour not in parents:
+                    parents[neighbour] = index
+                    queue.append(neighbour)
+        if target_index not in parents:
+            return []
+        path = [target_index]
+        while path[-1] != source_index:
+            path.append(parents[path[-1]])
+        return [Point(*divmod(index, self.length)) for index in reversed(path)]
+
     def is_accessible(self, point: Point) -> bool:
-        path = self.path_map[point]
-        return type(path) == list and (len(path) > 0 or self.is_road(point))
+        return self.predecessor_map[point] >= 0
+
+    def path_from_road(self, point: Point) -> List[Point]:
+        """
+        Rebuilds the path from the network to an accessible point, following the predecessor map
+        :return: path from a road point to point, both included, empty if point is not accessible
+        """
+        if not self.is_accessible(point):
+            return []
+        path = [point]
+        while not self.is_road(path[-1]):
+            x, z = divmod(int(self.predecessor_map[path[-1]]), self.length)
+            if (x, z) == (path[-1].x, path[-1].z):
+                break  # former road point, removed from the network
+            path.append(Point(x, z))
+        return path[::-1]
 
     # region PUBLIC INTERFACE
 
@@ -175,9 +353,8 @@ class RoadNetwork(metaclass=Singleton):
             return []
 
         # either the path is precomputed or computed with a*
-        path: List[Point]
-        if self.is_accessible(target) and all(ObstacleMap().is_accessible(_) for _ in self.path_map[target]):
-            path = self.path_map[target]
+        path: List[Point] = self.path_from_road(target)
+        if path and all(ObstacleMap().is_accessible(_) for _ in path):
             print(f"[RoadNetwork] Found existing road towards {str(target)}")
         else:
             _t0 = time.time()
@@ -187,8 +364,60 @@ class RoadNetwork(metaclass=Singleton):
         # if a* fails, return
         if not path:
             return []
+        return self.__connect_path(path, target, margin)
+
+    def connect_all_to_network(self, targets: List[Position], margin: int = 0) -> List[Set[Point]]:
+        """
+        Create roads to connect several points to the network, see connect_to_network. Paths are taken from a single
+        search tree grown from the network until every target is reached. Closest targets are connected first, and the
+        following paths stop as soon as they meet a road created for a previous target, or use the existing road
+        towards their target if it is cheaper
+        Parameters
+        ----------
+        targets new destinations in the network
+        margin how close to get to the new points when reaching them
+
+        Returns
+        -------
+        Created road cycles (possibly empty)
+        """
+        from utils.algorithms.fast_dijkstra import multi_source_tree
+        targets = [_ for _ in targets if not self.is_road(_)]
+        if not targets:
+            return []
+        _t0 = time.time()
+        target_indices = np.array([_.x * self.length + _.z for _ in targets])
+        distances, parents = multi_source_tree(self.build_costs().costs, self.network > 0, target_indices)
+        print(f"[RoadNetwork] Computed road paths towards {len(targets)} points in {(time.time() - _t0):0.2f}s")
+
+        cycles = []
+        for i in np.argsort(distances.flat[target_indices], kind="stable"):
+            target = targets[i]
+            if self.is_road(target):
+                continue
+            if distances.flat[target_indices[i]] == np.inf:
+                print(f"[RoadNetwork] No road path towards {str(target)}")
+                continue
+
+            # path in the tree, up to the closest road
+            path = [target]
+            while not self.is_road(path[-1]):
+                path.append(Position(*divmod(int(parents.flat[path[-1].x * self.length + path[-1].z]), self.length)))
+            path.reverse()
+            cost = distances[target.x, target.z] - distances[path[0].x, path[0].z]
+
+            existing_path = self.path_from_road(target)
+            if existing_path and self.cost_map[target] < cost \
+                    and all(ObstacleMap().is_accessible(_) for _ in existing_path):
+                print(f"[RoadNetwork] Found existing road towards {str(target)}")
+                path = existing_path
+            cycles.extend(self.__connect_path(path, target, margin))
+        return cycles
 
-        # else, register new road(s)
+    def __connect_path(self, path: List[Point], target: Position, margin: int) -> List[Set[Point]]:
+        """
+        Registers the road from the network towards target, then potential other roads to create cycles
+        """
         if margin > 0:
             truncate_index = next(i for i, p in enumerate(path) if manhattan(p, target) <= margin)
             path = path[:truncate_index]
@@ -199,7 +428,7 @@ class RoadNetwork(metaclass=Singleton):
         self.nodes.add(target.asPosition)
 
         _t1, cycles = time.time(), []
-        for node in sorted(self.nodes, key=lambda n: euclidean(n, target))[1:min(CYCLE_ALTERNATIVES, len(self.nodes))]:
+        for node in self.__closest_nodes(target, CYCLE_ALTERNATIVES)[1:]:
             old_path, new_path = self.cycle_creation_condition(node, target)
             if new_path:
                 new_path = self.create_road(path=new_path)
@@ -209,7 +438,7 @@ class RoadNetwork(metaclass=Singleton):
                     break
         print(f"[RoadNetwork] Computed {len(cycles)} new road cycles in {(time.time() - _t1):0.2f}s")
 
-        if path and all(euclidean(path[0], node) > DIST_BETWEEN_NODES for node in self.nodes):
+        if path and euclidean(path[0], self.__closest_nodes(path[0], 1)[0]) > DIST_BETWEEN_NODES:
             self.nodes.add(path[0].asPosition)
 
         return cycles
@@ -223,12 +452,12 @@ class RoadNetwork(metaclass=Singleton):
     def __update_distance_map(self, road: List[Point], force_update=False):
         self.dijkstra(road, self.lambda_max, force_update)
 
-    # return the path from the point satisfying the ending_condition to the root_point, excluded
     def dijkstra(self, root_points, max_distance, force_update):
         # type: (List[Point], int, bool) -> None
         """
         Accelerated Dijkstra algorithm to compute distance & shortest paths from root points to all others.
-        The cost function is the euclidean distance
+        The cost function is the euclidean distance. The exploration is limited to the bounding box of the root points
+        extended by max_distance, and runs in a compiled pass over preallocated buffers
         Parameters
         ----------
         root_points null distance points to start the exploration
@@ -237,65 +466,26 @@ class RoadNetwork(metaclass=Singleton):
 
         Returns
         -------
-        Nothing. Result is stored in self.distance_map and self.path_map
-        """
-
-        def init():
-            _distance_map = PointArray(np.full((self.width, self.length), MAX_INT))  # on foot distance walking from road points
-            _cost_map = PointArray(np.full((self.width, self.length), MAX_INT))  # cost distance building from road points
-            for root_point in root_points:
-                _distance_map[root_point] = 0
-                _cost_map[root_point] = 0
-            _neighbours = SortedList(root_points, lambda p: _cost_map[p])
-            _predecessor_map = PointArray(np.empty((self.width, self.length), dtype=object))
-            return _cost_map, _distance_map, _neighbours, _predecessor_map
-
-        def update_distance(updated_point, neighbor, _neighbors: SortedList):
-            edge_cost = road_build_cost(updated_point, neighbor)
-            edge_dist = euclidean(updated_point, neighbor)
-            if edge_cost == MAX_INT:
-                return
-
-            new_cost = cost_map[updated_point] + edge_cost
-            new_dist = distance_map[updated_point] + edge_dist
-            previous_cost = cost_map[neighbor]
-            if previous_cost >= MAX_INT and new_dist <= max_distance and not self.is_road(neighbor) \
-                    and (new_cost < self.cost_map[neighbor] or force_update):
-                _neighbors.add(neighbor)
-            if previous_cost > new_cost:
-                cost_map[neighbor] = new_cost
-                distance_map[neighbor] = new_dist
-                predecessor_map[neighbor] = updated_point
-
-        def update_distances(updated_point):
-            x, z = updated_point.x, updated_point.z
-            if x + 1 < self.width:
-                update_distance(updated_point, Point(x + 1, z), neighbors)
-            if x - 1 >= 0:
-                update_distance(updated_point, Point(x - 1, z), neighbors)
-            if z + 1 < self.length:
-                update_distance(updated_point, Point(x, z + 1), neighbors)
-            if z - 1 >= 0:
-                update_distance(updated_point, Point(x, z - 1), neighbors)
-
-        def path_to_dest(dest_point):
-            path = [dest_point]
-            while not self.is_road(path[0]):
-                path.insert(0, predecessor_map[path[0]])
-            return path
-
-        def update_maps_info_at(point):
-            x, z = point.x, point.z
-            if self.cost_map[x, z] > cost_map[x, z]:
-                self.cost_map[point] = cost_map[point]
-                self.distance_map[point] = distance_map[point]
-                self.path_map[point] = path_to_dest(point)
-
-        cost_map, distance_map, neighbors, predecessor_map = init()
-        while neighbors:
-            clst_neighbor = neighbors.pop(0)
-            update_maps_info_at(clst_neighbor)
-            update_distances(clst_neighbor)
+        Nothing. Result is stored in self.cost_map, self.distance_map and self.predecessor_map
+        """
+        if not root_points:
+            return
+        roots = np.array([(p.x, p.z) for p in root_points])
+        x0, z0 = np.maximum(roots.min(axis=0) - max_distance - 1, 0)
+        x1, z1 = np.minimum(roots.max(axis=0) + max_distance + 2, (self.width, self.length))
+        _update_proximity(self.build_costs().costs, self.network > 0, roots[:, 0] * self.length + roots[:, 1],
+                          max_distance, force_update, (x0, z0, x1, z1), self.__scratch_costs,
+                          self.__scratch_distances, self.__scratch_predecessors, self.__scratch_queue,
+                          np.asarray(self.cost_map), np.asarray(self.distance_map), np.asarray(self.predecessor_map))
+        for listener in self.__listeners:
+            listener(int(x0), int(z0), int(x1), int(z1))
+
+    def add_listener(self, listener):
+        # type: (Callable[[int, int, int, int], None]) -> None
+        """
+        Registers a callback, called with the bounds (x0, z0, x1, z1) of the rectangle on every distance maps update
+        """
+        self.__listeners.append(listener)
 
     def a_star(self, root_point, ending_point, cost_function, timer=False):
         # type: (Point, Point, Callable[[Point, Point], int], bool) -> List[Point]
@@ -304,7 +494,7 @@ class RoadNetwork(metaclass=Singleton):
         ----------
         root_point path origin
         ending_point path destination
-        cost_function (RoadNetwork, Point, Point) -> int
+        cost_function road_build_cost, the only cost function with a raster
 
         Returns
         -------
@@ -314,18 +504,25 @@ class RoadNetwork(metaclass=Singleton):
         if root_point == ending_point:
             return [root_point]
         t0 = time.time()
-        try:
-            tuple_path = a_star((root_point.x, root_point.z), (ending_point.x, ending_point.z), (self.width, self.length),
-                                lambda u, v: cost_function(Position(u[0], u[1]), Position(v[0], v[1])))
-            path = [Point(u, v) for u, v in tuple_path]
-        except SystemError or KeyError or ValueError:
-            return []
+        tuple_path = a_star((root_point.x, root_point.z), (ending_point.x, ending_point.z),
+                            self.__exploration_costs(cost_function))
+        path = [Point(u, v) for u, v in tuple_path]
         if timer:
             t0 = time.time() - t0 + .001
             print(f"Fast a*'ed a {len(path)} blocks road in {int(t0) if t0 > 1 else t0} seconds, "
                   f"avg: {int(len(path) / t0)}mps")
         return path
 
+    def __exploration_costs(self, cost_function):
+        """
+        :return: (n, W, L) costs of the moves of fast_astar.EXPLORATION_OFFSETS from every point, read from their
+        raster. Only road_build_cost has a raster
+        """
+        from utils.algorithms.fast_astar import EXPLORATION_OFFSETS
+        if cost_function is not road_build_cost:
+            raise ValueError(f"Expected road_build_cost, found {cost_function}: other cost functions have no raster")
+        return self.build_costs(offsets=tuple(map(tuple, EXPLORATION_OFFSETS.tolist()))).costs
+
     def cycle_creation_condition(self, node1: Point, node2: Point) -> (List[Point], List[Point]):
         """
         Evaluates whether it's useful to create a new road between two road points
@@ -337,7 +534,7 @@ class RoadNetwork(metaclass=Singleton):
         if not (MIN_DISTANCE_CYCLE <= straight_dist <= MAX_DISTANCE_CYCLE):
             return [], []
 
-        existing_path = self.a_star(node1, node2, road_only_cost)
+        existing_path = self.road_path(node1, node2)
         current_dist = len(existing_path)
         if current_dist / straight_dist < MIN_CYCLE_GAIN:
             return existing_path, []
@@ -348,70 +545,205 @@ class RoadNetwork(metaclass=Singleton):
         return existing_path, []
 
     @property
-    def obstacle(self):
-        obs = np.full((self.width, self.length), False)
-        for p in self.road_blocks.union(self.special_road_blocks):
-            x0, z0 = p.x, p.z
-            # build a circular obstacle of designated width around road point
-            margin = self.get_road_width(x0, z0) / 2 + .5
-            for x1, z1 in itertools.product(sym_range(x0, margin, self.width), sym_range(z0, margin, self.length)):
-                obs[x1, z1] = True
-        return obs
-
-road_build_cache = {}
+    def obstacle(self) -> np.ndarray:
+        """
+        :return: (W, L) mask of the blocks covered by the roads, not to be modified. Each road block is widened to a
+        square of side its road width + 2, by one dilation of the road blocks of each width. Cached until the next road
+        change
+        """
+        if self.__obstacle is None:
+            self.__obstacle = np.zeros((self.width, self.length), dtype=bool)
+            for width in np.unique(self.network[self.network > 0]):
+                square = np.ones((width + 2, width + 2), dtype=bool)
+                self.__obstacle |= ndimage.binary_dilation(self.network == width, structure=square)
+            self.__obstacle.flags.writeable = False
+        return self.__obstacle
+
+
 def road_build_cost(src_point, dest_point):
+    """
+    Cost to build a road from src_point to dest_point, which must be aligned along the X or Z axis, see BuildCostRaster
+    """
     network: RoadNetwork = RoadNetwork.INSTANCE
-    cost = scale = manhattan(src_point, dest_point)
+    scale = manhattan(src_point, dest_point)
+    if not scale:
+        return 0
+    if src_point.x != dest_point.x and src_point.z != dest_point.z:
+        raise ValueError(f"Expected points aligned along the X or Z axis, found {src_point} and {dest_point}")
+    dx, dz = (dest_point.x - src_point.x) // scale, (dest_point.z - src_point.z) // scale
+    return network.build_costs(scale).costs[DIRECTIONS.index((dx, dz)), src_point.x, src_point.z]
+
+
+def road_build_costs() -> np.ndarray:
+    """
+    road_build_cost between every point and its 4 neighbours, not to be modified
+    :return: (4, W, L) costs to move towards the neighbours ordered as in grid_astar.DIRECTIONS, MAX_INT outside the map
+    """
+    return RoadNetwork.INSTANCE.build_costs().costs
+
+
+class BuildCostRaster:
+    """
+    Costs to build a road between every point and the points at a set of offsets, as (n, W, L) float32 rasters ordered
+    as the offsets, by default the moves of a given step in the 4 directions ordered as in grid_astar.DIRECTIONS.
+    The costs are recomputed lazily over the rectangles of destination points modified since the last read (roads and
+    obstacles), from terrain maps computed once
+    """
+
+    def __init__(self, network, step=1, offsets=None, terrain_costs=None):
+        # type: (RoadNetwork, int, Tuple[Tuple[int, int], ...], _TerrainCostMaps) -> None
+        self.__network = network
+        self.__offsets = offsets if offsets is not None else tuple((dx * step, dz * step) for dx, dz in DIRECTIONS)
+        shape = (network.width, network.length)
+        if network.terrain is not None:
+            self.__terrain = terrain_costs if terrain_costs is not None else _TerrainCostMaps(network.terrain)
+            self.__obstacle = ObstacleMap()
+            self.__obstacle.add_listener(self.invalidate)
+        else:
+            self.__terrain = self.__obstacle = None
+        self.__costs = np.full((len(self.__offsets),) + shape, MAX_INT, dtype=np.float32)
+        # modified rectangles of destination points, as (x0, z0, x1, z1)
+        self.__dirty: Set[Tuple[int, int, int, int]] = {(0, 0) + shape}
+
+    @property
+    def costs(self) -> np.ndarray:
+        """
+        :return: (n, W, L) up to date costs, MAX_INT for forbidden moves
+        """
+        while self.__dirty:
+            self.__update(*self.__dirty.pop())
+        return self.__costs
+
+    def invalidate(self, x0, z0, x1, z1):
+        # type: (int, int, int, int) -> None
+        """
+        Marks the moves towards [x0, x1[ x [z0, z1[ as outdated
+        """
+        self.__dirty.add((x0, z0, x1, z1))
+
+    def __update(self, x0, z0, x1, z1):
+        network = self.__network
+        for d, (dx, dz) in enumerate(self.__offsets):
+            # sources of the moves towards the rectangle
+            sx0, sz0 = max(x0 - dx, 0), max(z0 - dz, 0)
+            sx1, sz1 = min(x1 - dx, network.width - max(dx, 0)), min(z1 - dz, network.length - max(dz, 0))
+            if sx1 <= sx0 or sz1 <= sz0:
+                continue
+            if self.__terrain is not None:
+                costs = self.__terrain.costs(dx, dz, sx0, sz0, sx1, sz1)
+            else:
+                costs = np.full((sx1 - sx0, sz1 - sz0), abs(dx) + abs(dz), dtype=float)
+            dest = (slice(sx0 + dx, sx1 + dx), slice(sz0 + dz, sz1 + dz))
+            if self.__obstacle is not None:
+                costs[np.asarray(self.__obstacle)[dest] != 0] = MAX_INT
+            costs[network.network[dest] > 0] = abs(dx) + abs(dz)
+            self.__costs[d, sx0:sx1, sz0:sz1] = costs
 
-    # First, a couple safe checks
-    # if we don't have access to terrain info
-    if network.terrain is None or network.is_road(dest_point) or not cost:
-        return cost
 
-    # if dest_point is an obstacle, return inf
-    is_dest_obstacle = not ObstacleMap().is_accessible(dest_point)
-    is_dest_obstacle |= network.terrain.fluid_map.is_lava(dest_point, margin=MIN_DIST_TO_LAVA)
-    if is_dest_obstacle:
-        return MAX_INT
+@njit(cache=True)
+def _update_proximity(build_costs, is_road, roots, max_distance, force_update, window, costs, distances,
+                      predecessors, queue, cost_map, distance_map, predecessor_map):
+    """
+    Explores from the roots in first in first out order, and lowers the cost, distance and predecessor maps of the
+    explored points. A point enters the queue when it is first reached within max_distance, if this lowers its cost.
+    Costs are truncated to integers as they are propagated
+    :param build_costs: (4, W, L) build costs towards the neighbours, ordered as in grid_astar.DIRECTIONS
+    :param roots: flat indices of the road points to explore from
+    :param window: (x0, z0, x1, z1) bounds of the explored points
+    :param costs: (W, L) scratch costs, MAX_INT outside of the window, restored when done
+    :param distances: (W, L) scratch distances, MAX_INT outside of the window, restored when done
+    :param predecessors: (W, L) scratch predecessors, -1 outside of the window, restored when done
+    :param queue: scratch queue, at least as long as the window area
+    """
+    length = is_road.shape[1]
+    x0, z0, x1, z1 = window
+    head = tail = 0
+    for root in roots:
+        x, z = root // length, root % length
+        if costs[x, z] != 0:
+            costs[x, z] = distances[x, z] = 0
+            queue[tail] = root
+            tail += 1
+
+    while head < tail:
+        x, z = queue[head] // length, queue[head] % length
+        head += 1
+        if cost_map[x, z] > costs[x, z]:
+            cost_map[x, z] = costs[x, z]
+            distance_map[x, z] = distances[x, z]
+            predecessor_map[x, z] = x * length + z if is_road[x, z] else predecessors[x, z]
+
+        for d in (0, 2, 1, 3):  # East, West, South, North
+            nx, nz = x + DIRECTIONS[d][0], z + DIRECTIONS[d][1]
+            if not (x0 <= nx < x1 and z0 <= nz < z1) or build_costs[d, x, z] == MAX_INT:
+                continue
+            new_cost = costs[x, z] + build_costs[d, x, z]
+            new_distance = distances[x, z] + 1
+            previous_cost = costs[nx, nz]
+            if previous_cost >= MAX_INT and new_distance <= max_distance and not is_road[nx, nz] \
+                    and (new_cost < cost_map[nx, nz] or force_update):
+                queue[tail] = nx * length + nz
+                tail += 1
+            if previous_cost > new_cost:
+                costs[nx, nz] = int(new_cost)
+                distances[nx, nz] = new_distance
+                predecessors[nx, nz] = x * length + z
+
+    costs[x0:x1, z0:z1] = MAX_INT
+    distances[x0:x1, z0:z1] = MAX_INT
+    predecessors[x0:x1, z0:z1] = -1
+
+
+class _TerrainCostMaps:
+    """
+    Terrain maps read by the build costs, ignoring the roads and the obstacle map
+    """
 
-    # Then, terrain specific costs, use cache
-    if (src_point, dest_point) not in road_build_cache:
-        # specific cost to build on water
-        if network.terrain.fluid_map.is_water(dest_point, margin=MIN_DIST_TO_RIVER):
-            if network.terrain.fluid_map.is_water(src_point):
-                return scale * BRIDGE_COST  # bridge continuation
-            return BRIDGE_UNIT_COST + (scale - 1) * BRIDGE_COST  # bridge creation
+    def __init__(self, maps):
+        # type: (terrain.TerrainMaps) -> None
+        fluids, height_map = maps.fluid_map, maps.height_map
+        self.is_water = (fluids.ocean_distance <= 0) | (fluids.river_distance <= 0)
+        self.is_lava = fluids.lava_distance <= MIN_DIST_TO_LAVA
+        water_distance = np.full((maps.width, maps.length), maps.width * maps.length, dtype=float)
+        if fluids.has_ocean:
+            water_distance = np.minimum(water_distance, fluids.ocean_distance)
+        if fluids.has_river:
+            water_distance = np.minimum(water_distance, fluids.river_distance)
+        self.water_distance = water_distance.astype(int)
+        self.steepness_x, self.steepness_z = (_.astype(float) for _ in height_map.steepness_vectors)
+
+    def costs(self, dx, dz, x0, z0, x1, z1) -> np.ndarray:
+        """
+        :return: costs of the moves (dx, dz) from the points in [x0, x1[ x [z0, z1[, whose destinations must be in the map
+        """
+        src = (slice(x0, x1), slice(z0, z1))
+        dest = (slice(x0 + dx, x1 + dx), slice(z0 + dz, z1 + dz))
+        scale = abs(dx) + abs(dz)
 
         # discount to get roads closer to water
-        src_water = network.terrain.fluid_map.water_distance(src_point)
-        dest_water = network.terrain.fluid_map.water_distance(dest_point)
-        if 2.5 * MIN_DIST_TO_RIVER >= dest_water > MIN_DIST_TO_RIVER:
-            cost += (dest_water - src_water)
-
-        # additional cost for slopes
-        direction: Point = (dest_point - src_point).unit
-        hm = network.terrain.height_map
-        steepness: Point = (hm.steepness(src_point, norm=False) + hm.steepness(dest_point, norm=False)) / 2
-        elevation = abs(steepness.dot(direction))
-        if elevation / scale > 3:
-            return MAX_INT
-        cost += (1 + elevation) ** 2 - 1  # quadratic cost over slopes
-
-        road_build_cache[(src_point, dest_point)] = value = max(scale, cost)
-        return value
-    return road_build_cache[(src_point, dest_point)]
-
-
-def road_only_cost(src_point, dest_point):
-    network = RoadNetwork.INSTANCE
-    return manhattan(src_point, dest_point) if network.is_road(dest_point) else MAX_INT
+        src_water, dest_water = self.water_distance[src], self.water_distance[dest]
+        cost = scale + np.where((2.5 * MIN_DIST_TO_RIVER >= dest_water) & (dest_water > MIN_DIST_TO_RIVER),
+                                dest_water - src_water, 0)
+
+        # additional cost for slopes, along the direction
+        norm = sqrt(dx ** 2 + dz ** 2)
+        elevation = np.abs((self.steepness_x[src] + self.steepness_x[dest]) / 2 * (dx / norm)
+                           + (self.steepness_z[src] + self.steepness_z[dest]) / 2 * (dz / norm))
+        cost = np.maximum(scale, cost + ((1 + elevation) ** 2 - 1))
+        cost[elevation / scale > 3] = MAX_INT
+
+        # specific cost to build on water: bridge continuation or creation
+        bridge_cost = np.where(self.is_water[src], scale * BRIDGE_COST, BRIDGE_UNIT_COST + (scale - 1) * BRIDGE_COST)
+        cost = np.where(self.is_water[dest], bridge_cost, cost)
+        cost[self.is_lava[dest]] = MAX_INT
+        return cost
 
 
 def road_recording_cost(src_point, dest_point):
     network = RoadNetwork.INSTANCE
     if network.is_road(dest_point):
         return 1
-    if network.path_map[src_point] and dest_point in network.path_map[src_point]:
-        # Use Dijkstra optimal path to road network if it exists
+    if network.predecessor_map[src_point] == dest_point.x * network.length + dest_point.z:
+        # Use Dijkstra optimal path to road network if it exists: the move goes up the predecessor map
         return 1
     return road_build_cost(src_point, dest_point)
@@ -5,7 +5,7 @@ import numpy
 
 from building_seeding import Parcel, MaskedParcel, BuildingType
 from terrain import TerrainMaps
-from utils import Position, BuildArea, PointArray
+from utils import Position, PointArray
 from utils.algorithms.graphs import connected_component, GridGraph, point_set_as_array
 
 
@@ -37,12 +37,8 @@ class StructureDetector:
         return parcels
 
     def __detect_mines(self) -> List[Parcel]:
-        def is_cave(p: Position):
-            y = self.terrain.height_map.lower_height(p)
-            block = self.terrain.level.getBlockAt(p.abs_x, y + 1, p.abs_z)
-            return block.endswith("cave_air")
-
-        structure_points = set(filter(is_cave, BuildArea.building_positions()))
+        is_cave = self.terrain.blocks.surface("cave_air", self.terrain.height_map.lower_heights + 1)
+        structure_points = {Position(x, z) for x, z in numpy.argwhere(is_cave).tolist()}
         return self.__connected_components(structure_points, BuildingType.cave)
 
     def __connected_components(self, points_to_explore: Set[Position], btype: BuildingType):
@@ -0,0 +1,139 @@
+"""
+Persistent cache of the terrain maps. The decoded level and the derived maps are stored as .npy files in a versioned
+directory, and memory-mapped on load, so that consecutive runs on the same build area skip the level request and the
+terrain analysis
+"""
+import json
+import shutil
+from hashlib import sha1
+from os import listdir, makedirs, replace
+from os.path import abspath, dirname, isdir, join
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from utils import BuildArea
+
+CACHE_VERSION = 1  # increase when the layout or the computation of the cached arrays changes
+CACHE_DIR = abspath(join(dirname(__file__), "..", "..", ".terrain_cache"))
+SOURCE_LAYERS = ("level", "blocks", "biome")  # arrays decoded from the level, the others are derived from them
+
+
+def layer_arrays(arrays: Dict[str, np.ndarray], layer: str) -> Dict[str, np.ndarray]:
+    """
+    :param arrays: flat snapshot, keys formatted as "layer.key"
+    :return: arrays of a single layer, without the layer prefix
+    """
+    prefix = layer + "."
+    return {key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)}
+
+
+class CachedLevel:
+    """
+    Stands for the WorldSlice of a terrain loaded from the cache, only exposes the slice geometry and heightmaps
+    """
+
+    def __init__(self, rect: Tuple[int, int, int, int], chunk_rect: Tuple[int, int, int, int], heightmaps: Dict[str, np.ndarray]):
+        self.rect = rect
+        self.chunkRect = chunk_rect
+        self.heightmaps = heightmaps
+
+    @staticmethod
+    def snapshot(level) -> Dict[str, np.ndarray]:
+        arrays = {"rect": np.array(level.rect), "chunk_rect": np.array(level.chunkRect)}
+        arrays.update({f"heightmaps.{name}": np.asarray(hm) for name, hm in level.heightmaps.items()})
+        return arrays
+
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray]):
+        rect = tuple(int(_) for _ in arrays["rect"])
+        chunk_rect = tuple(int(_) for _ in arrays["chunk_rect"])
+        return cls(rect, chunk_rect, layer_arrays(arrays, "heightmaps"))
+
+
+class TerrainCache:
+    """
+    Cache entries are keyed by the build area rect only, the level is not requested to check them: an entry must be
+    dropped when the world is modified in the build area, see TerrainCache.drop. The hash of the level content names
+    the data directory, so that derived maps are only stored alongside the source arrays they were computed from.
+    Layout: <root>/v<version>/<x>_<z>_<width>_<length>/manifest.json and <content hash>/<layer>.<key>.npy
+    """
+
+    def __init__(self, root: str = CACHE_DIR):
+        self.__root = join(root, f"v{CACHE_VERSION}")
+
+    def __entry_dir(self, area: BuildArea) -> str:
+        return join(self.__root, f"{area.x}_{area.z}_{area.width}_{area.length}")
+
+    def load(self, area: BuildArea) -> Optional[Dict[str, np.ndarray]]:
+        """
+        :return: flat snapshot of the terrain maps, arrays are copy-on-write memory maps, None if there is no valid entry
+        """
+        entry_dir = self.__entry_dir(area)
+        try:
+            with open(join(entry_dir, "manifest.json")) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != CACHE_VERSION or manifest.get("rect") != _rect(area):
+            return None
+        data_dir = join(entry_dir, manifest["content_hash"])
+        try:
+            return {key: np.load(join(data_dir, f"{key}.npy"), mmap_mode='c') for key in manifest["arrays"]}
+        except (OSError, ValueError) as e:
+            print(f"[TerrainCache] Ignored corrupted cache entry {data_dir}: {e}")
+            return None
+
+    def save(self, area: BuildArea, arrays: Dict[str, np.ndarray]) -> str:
+        """
+        Writes the snapshot of the terrain maps, replacing the previous entry of the build area
+        :return: content hash of the level
+        """
+        content_hash = TerrainCache.content_hash(arrays)
+        entry_dir = self.__entry_dir(area)
+        data_dir = join(entry_dir, content_hash)
+        makedirs(data_dir, exist_ok=True)
+        for key, array in arrays.items():
+            np.save(join(data_dir, f"{key}.npy"), np.asarray(array), allow_pickle=False)
+
+        manifest = {"version": CACHE_VERSION, "rect": _rect(area), "content_hash": content_hash, "arrays": sorted(arrays)}
+        manifest_path = join(entry_dir, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        replace(manifest_path + ".tmp", manifest_path)
+
+        # remove entries computed from an older state of the level
+        for name in listdir(entry_dir):
+            if name != content_hash and isdir(join(entry_dir, name)):
+                shutil.rmtree(join(entry_dir, name), ignore_errors=True)
+
+        print(f"[TerrainCache] Saved {len(arrays)} arrays to {data_dir}")
+        return content_hash
+
+    def drop(self, area: BuildArea):
+        """
+        Removes the entry of the build area, if any
+        """
+        entry_dir = self.__entry_dir(area)
+        if isdir(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            print(f"[TerrainCache] Dropped cache entry {entry_dir}")
+
+    @staticmethod
+    def content_hash(arrays: Dict[str, np.ndarray]) -> str:
+        """
+        :return: hash of the arrays decoded from the level
+        """
+        digest = sha1()
+        for key in sorted(arrays):
+            if key.split('.')[0] in SOURCE_LAYERS:
+                array = np.ascontiguousarray(arrays[key])
+                digest.update(key.encode())
+                digest.update(str(array.dtype).encode() + str(array.shape).encode())
+                digest.update(array.view(np.uint8).reshape(-1) if array.size else b"")
+        return digest.hexdigest()
+
+
+def _rect(area: BuildArea):
+    return [int(_) for _ in area.rect]
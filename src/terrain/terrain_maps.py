@@ -1,10 +1,20 @@
+from time import time
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import numpy as np
 from gdpc import worldLoader
 
 from terrain import RoadNetwork, EntityManager
+from terrain.block_volume import BlockVolume
 from terrain.biomes import BiomeMap
 from terrain.fluid_map import FluidMap
 from terrain.height_map import HeightMap
+from terrain.layer_scheduler import LayerScheduler, SharedBlocks
+from terrain.terrain_cache import CachedLevel, TerrainCache, layer_arrays
+from terrain.tiled_world_slice import TiledWorldSlice
 from terrain.tree_map import TreesMap
+from parameters import LAYER_WORKERS
 from utils import BuildArea, BoundingBox, Position, dump
 
 
@@ -13,37 +23,206 @@ class TerrainMaps:
     The Map class gather all the maps representing the Minecraft Map selected for the filter
     """
 
-    def __init__(self, level: worldLoader.WorldSlice, area: BuildArea):
+    LAYERS = ("blocks", "height_map", "biome", "fluid_map", "trees", "entities")  # in topological order
+    LAYER_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+        "blocks": (),
+        "height_map": ("blocks",),
+        "biome": (),
+        "fluid_map": ("blocks", "height_map", "biome"),
+        "trees": ("blocks", "height_map"),
+        "entities": ()
+    }
+    # layers computed by the worker processes in parallel builds, the others read the level in the main process
+    POOL_LAYERS = ("height_map", "fluid_map", "trees")
+
+    critical_path: Tuple[List[str], float] = None  # longest chain of layers computed in parallel, and its duration
+
+    def __init__(self, level: worldLoader.WorldSlice, area: BuildArea, snapshot: Dict[str, np.ndarray] = None,
+                 workers: int = LAYER_WORKERS):
+        """
+        Layers are computed on first access, or explicitly with TerrainMaps.materialize
+        :param level: world slice of the build area, or CachedLevel if the terrain is restored from a snapshot
+        :param area: build area
+        :param snapshot: optional flat snapshot of the terrain maps, see TerrainMaps.snapshot
+        :param workers: number of processes computing independent layers, 1 to compute them sequentially
+        """
         if area.width < level.heightmaps["WORLD_SURFACE"].shape[0]:
             for k, hm in level.heightmaps.items():
                 level.heightmaps[k] = hm[:-1, :-1]
         self.level = level
         self.area: BuildArea = area
-        from time import time
-        t0 = t1 = time()
-        self.height_map = HeightMap(level, area)
-        print(f'Computed height map in {time() - t1}')
-
-        t1 = time()
-        self.biome = BiomeMap(level, area)
-        print(f'Computed biome map in {time() - t1}')
-
-        t1 = time()
-        self.fluid_map = FluidMap(level, area, self)
-        print(f'Computed fluid map in {time() - t1}')
+        self.__snapshot = snapshot
+        self.__workers = workers
+        self.__layers: Dict[str, object] = {}
+        self.__features: Dict[str, np.ndarray] = None
 
         t1 = time()
         self.road_network = RoadNetwork(self.width, self.length, self)  # type: RoadNetwork
         print(f'Computed road map in {time() - t1}')
 
-        t1 = time()
-        self.trees = TreesMap(level, self.height_map)
-        print(f'Computed trees map in {time() - t1}')
+    # region LAYERS
 
-        t1 = time()
-        print(f'Computed terrain maps in {t1 - t0}')
+    @property
+    def blocks(self) -> BlockVolume:
+        return self.__layer("blocks")
+
+    @property
+    def height_map(self) -> HeightMap:
+        return self.__layer("height_map")
+
+    @property
+    def biome(self) -> BiomeMap:
+        return self.__layer("biome")
+
+    @property
+    def fluid_map(self) -> FluidMap:
+        return self.__layer("fluid_map")
+
+    @property
+    def trees(self) -> TreesMap:
+        return self.__layer("trees")
+
+    @property
+    def entities(self) -> EntityManager:
+        return self.__layer("entities")
+
+    def __layer(self, layer: str):
+        if layer not in self.__layers:
+            self.materialize(layer)
+        return self.__layers[layer]
+
+    def materialize(self, *layers: str):
+        """
+        Computes the layers and their dependencies, unless already done. Independent layers are computed in parallel
+        when several of them are missing
+        :param layers: names of the layers, see TerrainMaps.LAYERS, every layer if not specified
+        """
+        missing = self.__missing_layers(layers or self.LAYERS)
+        if not missing:
+            return
+
+        t0 = time()
+        if self.__snapshot is not None:
+            for layer in missing:
+                self.__layers[layer] = self.__restore_layer(layer)
+        elif self.__workers > 1 and LayerScheduler.is_available() and len(set(missing) & set(self.POOL_LAYERS)) > 1:
+            self.__build_layers_parallel(missing)
+        else:
+            for layer in missing:
+                t1 = time()
+                self.__layers[layer] = self.__build_layer(layer)
+                print(f'Computed {layer} in {time() - t1}')
+        print(f'Computed terrain layers {", ".join(missing)} in {time() - t0}')
+
+    def __missing_layers(self, layers) -> List[str]:
+        required = set()
+        stack = list(layers)
+        while stack:
+            layer = stack.pop()
+            if layer not in required and layer not in self.__layers:
+                required.add(layer)
+                stack.extend(self.LAYER_DEPENDENCIES[layer])
+        return [layer for layer in self.LAYERS if layer in required]
+
+    def __build_layer(self, layer: str):
+        level, area = self.level, self.area
+        builders = {
+            "blocks": lambda: BlockVolume.from_world_slice(level, area),
+            "height_map": lambda: HeightMap(self.blocks, area),
+            "biome": lambda: BiomeMap(level, area),
+            "fluid_map": lambda: FluidMap(self.blocks, area, self),
+            "trees": lambda: TreesMap(self.blocks, self.height_map),
+            "entities": lambda: EntityManager.from_world_slice(level)
+        }
+        return builders[layer]()
+
+    def __restore_layer(self, layer: str):
+        area, arrays = self.area, layer_arrays(self.__snapshot, layer)
+        restorers = {
+            "blocks": lambda: BlockVolume.restore(arrays),
+            "height_map": lambda: HeightMap.restore(arrays, area),
+            "biome": lambda: BiomeMap.restore(arrays, area),
+            "fluid_map": lambda: FluidMap.restore(arrays, area, self),
+            "trees": lambda: TreesMap.restore(arrays, area),
+            "entities": lambda: EntityManager.restore(arrays)
+        }
+        return restorers[layer]()
 
-        self.entities: EntityManager = EntityManager.from_world_slice(level)
+    def __build_layers_parallel(self, missing: List[str]):
+        """
+        Builds the missing layers following their dependencies: layers reading the level are computed in this process,
+        while the height map, then the fluid and trees maps are computed by the worker processes
+        """
+        shared_blocks: List[SharedBlocks] = []
+
+        def share_blocks():
+            shared_blocks.append(SharedBlocks(self.blocks))
+            return shared_blocks[0]
+
+        scheduler = LayerScheduler(self.__workers)
+        for layer in self.LAYERS:
+            if layer in missing and layer in self.POOL_LAYERS:
+                scheduler.add(layer, _POOL_BUILDERS[layer], *self.LAYER_DEPENDENCIES[layer], area=self.area)
+            elif layer == "blocks":
+                scheduler.add(layer, share_blocks, local=True)
+            elif layer == "entities":
+                scheduler.add(layer, lambda: self.entities, local=True)
+            else:
+                # computed in this process if missing, then passed to the workers as a snapshot
+                scheduler.add(layer, lambda _layer=layer: getattr(self, _layer).snapshot(), local=True)
+        try:
+            layers = scheduler.run(*missing)
+        finally:
+            for _ in shared_blocks:
+                _.release()
+
+        for layer in filter(lambda _: _ in self.POOL_LAYERS, missing):
+            self.__layers[layer] = self.__restore_pool_layer(layer, layers[layer])
+        for layer, (start, end) in scheduler.timings.items():
+            print(f'Computed {layer} in {end - start}')
+        self.critical_path = scheduler.critical_path
+        print(f'Critical path: {" -> ".join(self.critical_path[0])} in {self.critical_path[1]}')
+
+    def __restore_pool_layer(self, layer: str, arrays: Dict[str, np.ndarray]):
+        if layer == "height_map":
+            return HeightMap.restore(arrays, self.area)
+        elif layer == "fluid_map":
+            return FluidMap.restore(arrays, self.area, self)
+        return TreesMap.restore(arrays, self.area)
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        Computes every layer if needed
+        :return: arrays of the level and of the terrain layers, keys formatted as "layer.key"
+        """
+        self.materialize()
+        layers = {"level": CachedLevel.snapshot(self.level)}
+        layers.update({layer: self.__layers[layer].snapshot() for layer in self.LAYERS})
+        return {f"{layer}.{key}": array for layer, arrays in layers.items() for key, array in arrays.items()}
+
+    # endregion
+
+    @property
+    def features(self) -> Dict[str, np.ndarray]:
+        """
+        Raw terrain features of the interest functions, computed on first access as (W, L) float32 rasters: altitude,
+        steepness norm, ocean, river and lava distances (None if there is no such fluid), temperature and tree distance
+        """
+        if self.__features is None:
+            fluids = self.fluid_map
+            steepness_x, steepness_z = (_.astype(float) for _ in self.height_map.steepness_vectors)
+            features = {
+                "altitude": self.height_map,
+                "steepness": np.hypot(steepness_x, steepness_z),
+                "ocean_distance": fluids.ocean_distance if fluids.has_ocean else None,
+                "river_distance": fluids.river_distance if fluids.has_river else None,
+                "lava_distance": fluids.lava_distance if fluids.has_lava else None,
+                "temperature": self.biome.temperature_map,
+                "tree_distance": self.trees.tree_distance
+            }
+            self.__features = {key: None if raster is None else np.asarray(raster, dtype=np.float32)
+                               for key, raster in features.items()}
+        return self.__features
 
     @property
     def width(self):
@@ -68,35 +247,81 @@ class TerrainMaps:
             return point + self.area.origin in self.area
 
     @staticmethod
-    def request(build_area_json=None):
-        from time import time
+    def request(build_area_json=None, cache: str = None, tile_size: int = None):
+        """
+        :param build_area_json: optional build area, requested to the server otherwise
+        :param cache: None to always request the level, "use" to restore the terrain from the cache when available,
+        "refresh" to request the level and overwrite the cache
+        :param tile_size: if specified, the level is requested as concurrent tiles of this size, see TiledWorldSlice
+        """
         print("Requesting build area...", end='')
         area = BuildArea(build_area_json)
         print(f"OK: {str(area)}")
+
+        terrain_cache = TerrainCache() if cache else None
+        if cache == "use":
+            t0 = time()
+            snapshot = terrain_cache.load(area)
+            if snapshot is not None:
+                print(f"Loaded terrain from cache in {(time() - t0)}s")
+                return TerrainMaps(CachedLevel.restore(layer_arrays(snapshot, "level")), area, snapshot)
+            print("No cached terrain for this build area")
+
         print("Requesting level...")
         t0 = time()
-        level = worldLoader.WorldSlice(area.x, area.z, area.x + area.width, area.z + area.length)
+        if tile_size:
+            level = TiledWorldSlice(area.x, area.z, area.x + area.width, area.z + area.length, tile_size)
+        else:
+            level = worldLoader.WorldSlice(area.x, area.z, area.x + area.width, area.z + area.length)
         print(f"completed in {(time() - t0)}s")
-        return TerrainMaps(level, area)
+        terrain = TerrainMaps(level, area)
+        if terrain_cache:
+            terrain_cache.save(area, terrain.snapshot())
+        return terrain
+
+    def forget_cache(self):
+        """
+        Drops the cached terrain of the build area, must be called before modifying the world in the build area
+        """
+        TerrainCache().drop(self.area)
 
     def undo(self):
         """
         Undo all modifications to the terrain for debug purposes
         """
         from utils import setBlock, Point
+        self.forget_cache()
         dump()
         current_terrain = TerrainMaps.request(self.area.json)
-        old_level = self.level
-        new_level = current_terrain.level
         for pos in BuildArea.building_positions():  # type: Position
             min_y = min(self.height_map.lower_height(pos.x, pos.z),
                         current_terrain.height_map.lower_height(pos.x, pos.z))
             max_y = max(self.height_map.upper_height(pos.x, pos.z),
                         current_terrain.height_map.upper_height(pos.x, pos.z))
             for y in range(min_y - 2, max_y + 2):
-                coords = pos.abs_x, y, pos.abs_z
-                if old_level.getBlockAt(*coords) != new_level.getBlockAt(*coords):
-                    setBlock(Point(pos.abs_x, pos.abs_z, y), old_level.getBlockAt(*coords))
+                old_block = self.blocks.name_at(pos.x, y, pos.z)
+                if old_block != current_terrain.blocks.name_at(pos.x, y, pos.z):
+                    setBlock(Point(pos.abs_x, pos.abs_z, y), old_block)
         dump()
 
         self.entities.reset()
+
+
+# Layers computed by the worker processes, returned as snapshots
+
+
+def _height_map_arrays(blocks: SharedBlocks, area: BuildArea) -> Dict[str, np.ndarray]:
+    return blocks.apply(lambda volume: HeightMap(volume, area).snapshot())
+
+
+def _fluid_map_arrays(blocks: SharedBlocks, height_map, biome, area: BuildArea) -> Dict[str, np.ndarray]:
+    # the fluid map only reads the height and biome maps of the terrain during its construction
+    layers = SimpleNamespace(height_map=HeightMap.restore(height_map, area), biome=BiomeMap.restore(biome, area))
+    return blocks.apply(lambda volume: FluidMap(volume, area, layers).snapshot())
+
+
+def _trees_arrays(blocks: SharedBlocks, height_map, area: BuildArea) -> Dict[str, np.ndarray]:
+    return blocks.apply(lambda volume: TreesMap(volume, HeightMap.restore(height_map, area)).snapshot())
+
+
+_POOL_BUILDERS = {"height_map": _height_map_arrays, "fluid_map": _fluid_map_arrays, "trees": _trees_arrays}
@@ -0,0 +1,103 @@
+"""
+World slice assembled from chunk aligned tiles, requested concurrently to the server
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from gdpc import worldLoader
+import parameters
+
+Rect = Tuple[int, int, int, int]  # x, z, width, length
+
+
+def chunk_rect(rect: Rect) -> Rect:
+    """
+    :return: x, z, width, length of the chunks covering the rect, in chunk coordinates
+    """
+    x, z, width, length = rect
+    return x >> 4, z >> 4, ((x + width - 1) >> 4) - (x >> 4) + 1, ((z + length - 1) >> 4) - (z >> 4) + 1
+
+
+def split_tiles(rect: Rect, tile_size: int) -> List[Rect]:
+    """
+    Splits the rect on a grid of tile_size blocks, aligned on absolute chunk coordinates
+    :param tile_size: side of the tiles, rounded up to a multiple of the chunk size
+    :return: tiles rects, each tile covering a disjoint set of chunks
+    """
+    tile_size = max(16, (tile_size + 15) // 16 * 16)
+    x, z, width, length = rect
+
+    def bounds(start, size):
+        cuts = list(range((start // tile_size + 1) * tile_size, start + size, tile_size))
+        return list(zip([start] + cuts, cuts + [start + size]))
+
+    return [(x0, z0, x1 - x0, z1 - z0) for x0, x1 in bounds(x, width) for z0, z1 in bounds(z, length)]
+
+
+class TiledWorldSlice:
+    """
+    Drop-in replacement of worldLoader.WorldSlice for large areas. The build area is split into chunk aligned tiles, which
+    are requested over a bounded thread pool, then stitched into the same chunk list and heightmaps as a single slice
+    """
+
+    def __init__(self, x1: int, z1: int, x2: int, z2: int, tile_size: int = parameters.FETCH_TILE_SIZE,
+                 max_workers: int = parameters.FETCH_WORKERS):
+        self.rect: Rect = (x1, z1, x2 - x1, z2 - z1)
+        self.chunkRect: Rect = chunk_rect(self.rect)
+        self.tile_timings: Dict[Rect, float] = {}  # request duration of each tile, in seconds
+
+        tiles = split_tiles(self.rect, tile_size)
+        self.__tiles: Dict[Rect, worldLoader.WorldSlice] = {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tiles))) as executor:
+            futures = {executor.submit(TiledWorldSlice.__fetch, tile): tile for tile in tiles}
+            for future in as_completed(futures):
+                tile = futures[future]
+                self.__tiles[tile], self.tile_timings[tile] = future.result()
+                print(f"[TiledWorldSlice] Fetched tile {tile} in {self.tile_timings[tile]:0.2f}s "
+                      f"({len(self.__tiles)}/{len(tiles)})")
+
+        self.nbtfile = {'Chunks': self.__stitch_chunks()}
+        self.heightmaps: Dict[str, np.ndarray] = self.__stitch_heightmaps()
+
+    @staticmethod
+    def __fetch(tile: Rect):
+        x, z, width, length = tile
+        for attempt in range(parameters.FETCH_RETRIES + 1):
+            t0 = time()
+            try:
+                return worldLoader.WorldSlice(x, z, x + width, z + length), time() - t0
+            except IOError as e:
+                if attempt == parameters.FETCH_RETRIES:
+                    raise
+                print(f"[TiledWorldSlice] Request of tile {tile} failed ({e}), retrying")
+
+    def __stitch_chunks(self) -> list:
+        chunk_x0, chunk_z0, chunk_width, chunk_length = self.chunkRect
+        chunks = [None] * (chunk_width * chunk_length)
+        for tile, level in self.__tiles.items():
+            tile_x0, tile_z0, tile_width, tile_length = chunk_rect(tile)
+            for dx in range(tile_width):
+                for dz in range(tile_length):
+                    chunk_id = (tile_x0 - chunk_x0 + dx) + (tile_z0 - chunk_z0 + dz) * chunk_width
+                    chunks[chunk_id] = level.nbtfile['Chunks'][dx + dz * tile_width]
+        return chunks
+
+    def __stitch_heightmaps(self) -> Dict[str, np.ndarray]:
+        x, z, width, length = self.rect
+        heightmaps = {}
+        for (tile_x, tile_z, tile_width, tile_length), level in self.__tiles.items():
+            for name, tile_hm in level.heightmaps.items():
+                if name not in heightmaps:
+                    heightmaps[name] = np.zeros((width, length), dtype=tile_hm.dtype)
+                dx, dz = tile_x - x, tile_z - z
+                heightmaps[name][dx:(dx + tile_width), dz:(dz + tile_length)] = tile_hm[:tile_width, :tile_length]
+        return heightmaps
+
+    def getBlockAt(self, x: int, y: int, z: int) -> str:
+        for (tile_x, tile_z, tile_width, tile_length), level in self.__tiles.items():
+            if tile_x <= x < tile_x + tile_width and tile_z <= z < tile_z + tile_length:
+                return level.getBlockAt(x, y, z)
+        return "minecraft:void_air"
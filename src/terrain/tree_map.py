@@ -1,117 +1,127 @@
-from typing import Tuple, List
+from typing import Dict
 
-from gdpc import worldLoader
 import numba
-from numba import prange, i8
-from numba.core.types import UniTuple, Set as nbSet
 import numpy as np
+from scipy import ndimage
 
 from terrain import HeightMap
+from terrain.block_volume import BlockVolume
 from utils import *
-from utils.misc_objects_functions import _in_limits
 
 
 class TreesMap(PointArray):
-    __trees: List[List[Tuple[int, int, int]]]
+    __tree_blocks: np.ndarray  # (N, 3) relative (x, y, z) tree blocks, grouped by tree, starting with the trunk base
+    __tree_bounds: np.ndarray  # blocks of tree i are __tree_blocks[__tree_bounds[i]:__tree_bounds[i + 1]]
     __tree_distance: np.ndarray = None
 
-    def __new__(cls, level: worldLoader.WorldSlice, height: HeightMap):
-        values, trees = _process(level, height)
-        obj = super().__new__(cls, values)
-        obj.__trees = trees
-        obj.__origin = Point(level.rect[0], level.rect[1])
+    def __new__(cls, blocks: BlockVolume, height: HeightMap):
+        values, tree_blocks, tree_sizes = _process(blocks, height)
+        return cls.restore({"values": values, "tree_blocks": tree_blocks, "tree_sizes": tree_sizes}, height.area)
 
+    @classmethod
+    def restore(cls, arrays: Dict[str, np.ndarray], area: BuildArea):
+        obj = super().__new__(cls, arrays["values"])
+        obj.__tree_blocks = np.asarray(arrays["tree_blocks"])
+        obj.__tree_bounds = np.concatenate(([0], np.cumsum(arrays["tree_sizes"])))
+        obj.__origin = Point(area.x, area.z)
         return obj
 
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {
+            "values": np.asarray(self),
+            "tree_blocks": self.__tree_blocks,
+            "tree_sizes": np.diff(self.__tree_bounds)
+        }
+
     def remove_tree_at(self, position: Point):
         tree_index = int(self[position])
-        for x, y, z in self.__trees[tree_index]:
+        start, end = self.__tree_bounds[tree_index:tree_index + 2]
+        for x, y, z in self.__tree_blocks[start:end].tolist():
             tree_point = Point(x, z, y) + self.__origin
             setBlock(tree_point, BlockAPI.blocks.Air)
-        self.__trees[tree_index] = []
+        self.__tree_blocks = np.delete(self.__tree_blocks, np.s_[start:end], axis=0)
+        self.__tree_bounds[tree_index + 1:] -= end - start
 
     @property
     def tree_distance(self) -> np.ndarray:
+        """
+        Manhattan distance to the closest trunk base
+        """
         if self.__tree_distance is None:
-            tree_distances = []
-            for tree in self.__trees:
-                if tree:
-                    x, _, z = tree[0]  # base trunk block position
-                    x_dist = X_ARRAY - x
-                    z_dist = Z_ARRAY - z
-                    tree_distances.append(abs(x_dist) + abs(z_dist))  # manhattan dist to the tree
-            if tree_distances:
-                self.__tree_distance = np.minimum.reduce(tree_distances)
+            remaining_trees = np.diff(self.__tree_bounds) > 0
+            trunk_bases = self.__tree_blocks[self.__tree_bounds[:-1][remaining_trees]]
+            if len(trunk_bases):
+                not_trunk = np.ones((self.width, self.length), dtype=bool)
+                not_trunk[trunk_bases[:, 0], trunk_bases[:, 2]] = False
+                self.__tree_distance = ndimage.distance_transform_cdt(not_trunk, metric="taxicab")
             else:
                 self.__tree_distance = np.full((self.width, self.length), 1000)
 
         return self.__tree_distance
 
 
-def _detect_trunks(level: worldLoader.WorldSlice, height: HeightMap):
+def _detect_trunks(blocks: BlockVolume, height: HeightMap):
     # detect trunks
-    trunks = set()
-
-    for xz in prange(height.width * height.length):
-        x = xz // height.length
-        z = xz % height.length
-        y = height[x, z] + 1
-        block = getBlockRelativeAt(level, x, y, z)
-        if _is_trunk(block):
-            trunks.add((x, z))
-
-    return trunks
-
-
-def _process(level: worldLoader.WorldSlice, height: HeightMap):
-    width, length = height.width, height.length
-    values = np.zeros((width, length))
-
-    trunks = _detect_trunks(level, height)
-
-    # Initialize tree structure & propagation
-    tree_blocks: List[UniTuple(i8, 2)] = []
-    marked_blocks: nbSet(UniTuple(i8, 2)) = set()
-
-    trees = [[]]
-    for tree_index, position in enumerate(trunks):
-        tree_index += 1  # Start counter to 1
-        trees.append([])  # instantiate new tree
-        tree_blocks.append((*position, tree_index))  # register trunk
-        marked_blocks.add(position)
-
-    # propagate trees through trunks and leaves (and mushrooms)
-    while tree_blocks:
-        # Get the oldest element in the blocks to process
-        x1, z1, tree_index = tree_blocks.pop(0)  # type: int, int, int
-
-        # add it to the structure of its tree
-        for y1 in range(height[x1, z1]+1, height.upper_height(x1, z1)+1):
-            trees[tree_index].append((x1, y1, z1))
-        values[x1, z1] = tree_index
-
-        # check if neighbours for possible other tree points
-        for x2 in prange(x1 - 1, x1 + 2):
-            for z2 in prange(z1 - 1, z1 + 2):
-                if _in_limits((x2, 0, z2), width, length):
-                    y2 = height.upper_height(x2, z2)
-                    position = (x2, y2, z2)
-                    possible_tree_point = (x2, z2)
-                    if (possible_tree_point not in marked_blocks) and _is_tree(getBlockRelativeAt(level, *position)):
-                        marked_blocks.add(possible_tree_point)
-                        tree_blocks.append((*possible_tree_point, tree_index))
-
-    return values, trees
-
-
-@numba.njit(cache=True)
-def _is_trunk(block: str) -> bool:
-    return 'log' in block or 'stem' in block
+    is_trunk = blocks.surface("log", height[:] + 1)
+    return np.argwhere(is_trunk)
+
+
+def _process(blocks: BlockVolume, height: HeightMap):
+    """
+    Segments the canopies: each tree point is assigned to the closest trunk through tree points
+    :return: tree index of each (x, z) point, 0 if no tree, then the (N, 3) tree blocks grouped by tree, from the trunk
+    base, and the number of blocks of each tree
+    """
+    trunks = _detect_trunks(blocks, height)
+    is_tree = blocks.surface("tree", height.upper_heights)
+    labels, order = _label_canopies(is_tree, trunks)
+    values = labels.astype(float)
+
+    # blocks of the tree columns, between the ground and the top of the canopy
+    x, z = np.divmod(order, height.length)
+    bottom = np.asarray(height)[x, z] + 1
+    sizes = np.maximum(height.upper_heights[x, z] - bottom + 1, 0)
+    column = np.repeat(np.arange(len(order)), sizes)
+    y = bottom[column] + np.arange(len(column)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    tree_blocks = np.stack((x[column], y, z[column]), axis=1).reshape((-1, 3))
+
+    # group the blocks by tree, keeping the propagation order in each tree
+    tree_index = labels[x, z][column]
+    tree_blocks = tree_blocks[np.argsort(tree_index, kind="stable")]
+    tree_sizes = np.bincount(tree_index, minlength=len(trunks) + 1)
+    return values, tree_blocks, tree_sizes
 
 
 @numba.njit(cache=True)
-def _is_tree(bid: str) -> bool:
-    return _is_trunk(bid) or '_leaves' in bid or 'mushroom_block' in bid
+def _label_canopies(is_tree: np.ndarray, trunks: np.ndarray):
+    """
+    Breadth first propagation of the trunk indexes through the 8-connected tree points
+    :param is_tree: (W, L) tree points
+    :param trunks: (n, 2) trunk positions, tree i + 1 grows from trunks[i]
+    :return: (W, L) tree index, 0 outside of trees, and the flat indexes of the labeled points in propagation order
+    """
+    width, length = is_tree.shape
+    labels = np.zeros((width, length), dtype=np.int64)
+    queue = np.empty(width * length, dtype=np.int64)
+    head, tail = 0, 0
+    for tree_index in range(len(trunks)):
+        x, z = trunks[tree_index, 0], trunks[tree_index, 1]
+        if labels[x, z] == 0:
+            labels[x, z] = tree_index + 1
+            queue[tail] = x * length + z
+            tail += 1
+
+    while head < tail:
+        x1, z1 = queue[head] // length, queue[head] % length
+        head += 1
+        for x2 in range(max(x1 - 1, 0), min(x1 + 2, width)):
+            for z2 in range(max(z1 - 1, 0), min(z1 + 2, length)):
+                if labels[x2, z2] == 0 and is_tree[x2, z2]:
+                    labels[x2, z2] = labels[x1, z1]
+                    queue[tail] = x2 * length + z2
+                    tail += 1
+
+    return labels, queue[:tail]
 
 
 # @numba.njit(b1(UniTuple(i8, 3), string, nbSet(UniTuple(i8, 3))))
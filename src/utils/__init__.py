@@ -1,6 +1,6 @@
 from .pymclevel import *
 from .geometry_utils import *
-from .custom_2darray import PointArray
+from .custom_2darray import PointArray, FenwickTree
 from .block_utils import BlockAPI, setBlock, water_blocks, lava_blocks, fillBlocks, clear_tree_at, \
     place_torch, ground_blocks, getBlockRelativeAt, dump
 from .entities import *
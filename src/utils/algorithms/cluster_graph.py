@@ -0,0 +1,277 @@
+"""
+Hierarchical abstraction of the grid for path finding (HPA*): the map is divided in square clusters, adjacent clusters
+are connected through transition points in the middle of the passable segments of their common border, and the costs
+between the transition points of a cluster are precomputed. Rough paths are searched in this abstract graph, whose
+clusters are refreshed only where the costs changed
+"""
+import heapq
+from math import ceil, sqrt
+from typing import Callable, Dict, List, Set, Tuple
+
+import numpy as np
+from numba import njit
+
+from parameters import MAX_INT
+from .grid_astar import DIRECTIONS
+
+_EAST, _SOUTH, _WEST, _NORTH = range(4)
+
+
+class ClusterGraph:
+
+    def __init__(self, costs: Callable[[], np.ndarray], width: int, length: int, cluster_size: int):
+        """
+        :param costs: function returning the current (4, width, length) costs to move towards the neighbours, ordered
+        as in grid_astar.DIRECTIONS, MAX_INT for forbidden moves
+        :param cluster_size: side of the clusters
+        """
+        self.__costs = costs
+        self.width, self.length = width, length
+        self.cluster_size = cluster_size
+        self.cwidth, self.clength = int(ceil(width / cluster_size)), int(ceil(length / cluster_size))
+
+        # transitions (cell, cell across the border) of every border, keyed by the (west or north cluster, direction)
+        self.__borders: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        # transition cells of every cluster, flat indices x * length + z
+        self.__nodes: List[np.ndarray] = [np.empty(0, dtype=np.int64)] * (self.cwidth * self.clength)
+        # (n, n) costs between the transition cells of every cluster, moving inside the cluster
+        self.__intra: List[np.ndarray] = [np.empty((0, 0))] * (self.cwidth * self.clength)
+        self.__node_index: Dict[int, int] = {}  # position of every transition cell in the nodes of its cluster
+        self.__dirty: Set[int] = set(range(self.cwidth * self.clength))
+
+    def invalidate(self, x0, z0, x1, z1):
+        # type: (int, int, int, int) -> None
+        """
+        Marks the clusters whose costs depend on [x0, x1[ x [z0, z1[ as outdated: moves towards the rectangle start
+        from its neighbours
+        """
+        size = self.cluster_size
+        cx0, cz0 = max(x0 - 1, 0) // size, max(z0 - 1, 0) // size
+        cx1, cz1 = min(x1, self.width - 1) // size + 1, min(z1, self.length - 1) // size + 1
+        self.__dirty.update(cx * self.clength + cz for cx in range(cx0, cx1) for cz in range(cz0, cz1))
+
+    def cluster(self, x, z) -> int:
+        return (x // self.cluster_size) * self.clength + z // self.cluster_size
+
+    # region QUERIES
+
+    def path(self, source: Tuple[int, int], target: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        :return: rough path from source to target through transition points, [source, target] if there is none
+        """
+        self.__refresh()
+        costs = self.__costs()
+        source_index, target_index = source[0] * self.length + source[1], target[0] * self.length + target[1]
+        # costs from the nodes of the target cluster to the target
+        target_cluster = self.cluster(*target)
+        nodes = self.__nodes[target_cluster]
+        towards_target = self.__window_costs(costs, target_index, nodes, True)
+        goal_edges = {int(node): cost for node, cost in zip(nodes, towards_target) if cost < np.inf}
+        if self.cluster(*source) == target_cluster:
+            direct = self.__window_costs(costs, source_index, np.array([target_index]), False)[0]
+            if direct < np.inf:
+                goal_edges[source_index] = direct
+
+        def heuristic(index):
+            x, z = divmod(index, self.length)
+            return sqrt((x - target[0]) ** 2 + (z - target[1]) ** 2)
+
+        path = self.__search(costs, source_index, False, heuristic, lambda index: index == target_index,
+                             goal_edges, target_index)
+        return path if path[-1] == tuple(target) else [tuple(source), tuple(target)]
+
+    def path_towards(self, target: Tuple[int, int], is_source: Callable[[int, int], bool]) -> List[Tuple[int, int]]:
+        """
+        Searches backwards from the target for the closest transition point in a source cluster
+        :param is_source: (cx, cz) -> whether a path can start in the cluster
+        :return: rough path towards target, starting in the target itself if its cluster is a source, or in the last
+        explored point if no source could be reached
+        """
+        self.__refresh()
+        target_index = target[0] * self.length + target[1]
+
+        def end_condition(index):
+            return is_source(*divmod(self.cluster(*divmod(index, self.length)), self.clength))
+
+        path = self.__search(self.__costs(), target_index, True, lambda _: 0, end_condition, {}, -1)
+        return path[::-1]
+
+    def __search(self, costs, start, reverse, heuristic, end_condition, goal_edges, goal) -> List[Tuple[int, int]]:
+        """
+        A* in the abstract graph extended by the start and goal points
+        :param reverse: explore the edges backwards, the start is then the end of the paths
+        :param goal_edges: costs from the abstract nodes to the goal
+        :return: path from start to the first node satisfying end_condition, or to the last explored node
+        """
+        distances, parents = {start: 0.}, {start: start}
+        heap = [(heuristic(start), 0., start)]
+        node = start
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            if end_condition(node):
+                break
+            for neighbour, cost in self.__edges(costs, node, start, reverse):
+                self.__relax(heap, distances, parents, heuristic, node, neighbour, distance + cost)
+            if node in goal_edges:
+                self.__relax(heap, distances, parents, heuristic, node, goal, distance + goal_edges[node])
+
+        path = [node]
+        while path[-1] != start:
+            path.append(parents[path[-1]])
+        return [divmod(index, self.length) for index in reversed(path)]
+
+    @staticmethod
+    def __relax(heap, distances, parents, heuristic, node, neighbour, distance):
+        if distance < distances.get(neighbour, np.inf):
+            distances[neighbour] = distance
+            parents[neighbour] = node
+            heapq.heappush(heap, (distance + heuristic(neighbour), distance, neighbour))
+
+    def __edges(self, costs, node, start, reverse):
+        """
+        Edges from (towards if reverse) node: to the other nodes of its cluster, and across the borders
+        """
+        cluster = self.cluster(*divmod(node, self.length))
+        nodes = self.__nodes[cluster]
+        if node == start and node not in self.__node_index:
+            window_costs = self.__window_costs(costs, node, nodes, reverse)
+        else:
+            i = self.__node_index[node]
+            window_costs = self.__intra[cluster][:, i] if reverse else self.__intra[cluster][i]
+        for neighbour, cost in zip(nodes, window_costs):
+            if cost < np.inf and neighbour != node:
+                yield int(neighbour), cost
+
+        x, z = divmod(node, self.length)
+        for direction, (dx, dz) in enumerate(DIRECTIONS):
+            nx, nz = x + dx, z + dz
+            if 0 <= nx < self.width and 0 <= nz < self.length and self.cluster(nx, nz) != cluster:
+                neighbour = nx * self.length + nz
+                if self.__is_transition(node, neighbour, direction):
+                    cost = costs[(direction + 2) % 4, nx, nz] if reverse else costs[direction, x, z]
+                    if cost < MAX_INT:
+                        yield neighbour, cost
+
+    def __is_transition(self, node, neighbour, direction) -> bool:
+        if direction in (_EAST, _SOUTH):
+            return (node, neighbour) in self.__borders.get((self.cluster(*divmod(node, self.length)), direction), ())
+        return (neighbour, node) in self.__borders.get(
+            (self.cluster(*divmod(neighbour, self.length)), (direction + 2) % 4), ())
+
+    def __window_costs(self, costs, index, nodes, reverse) -> np.ndarray:
+        """
+        :return: costs from (towards if reverse) the point to the nodes, moving inside the cluster of the point
+        """
+        x0, z0, x1, z1 = self.__cluster_bounds(self.cluster(*divmod(index, self.length)))
+        distances = _window_distances(costs, x0, z0, x1, z1, np.array([index]), reverse)[0]
+        return distances[nodes // self.length - x0, nodes % self.length - z0]
+
+    # endregion
+
+    # region CLUSTERS UPDATE
+
+    def __cluster_bounds(self, cluster) -> Tuple[int, int, int, int]:
+        cx, cz = divmod(cluster, self.clength)
+        size = self.cluster_size
+        return cx * size, cz * size, min((cx + 1) * size, self.width), min((cz + 1) * size, self.length)
+
+    def __neighbour_clusters(self, cluster) -> List[int]:
+        cx, cz = divmod(cluster, self.clength)
+        return [(cx + dx) * self.clength + cz + dz for dx, dz in DIRECTIONS
+                if 0 <= cx + dx < self.cwidth and 0 <= cz + dz < self.clength]
+
+    def __refresh(self):
+        """
+        Recomputes the borders of the outdated clusters, and the costs inside the clusters whose transitions changed
+        """
+        if not self.__dirty:
+            return
+        costs = self.__costs()
+        dirty, self.__dirty = self.__dirty, set()
+        for cluster in dirty:
+            cx, cz = divmod(cluster, self.clength)
+            self.__update_border(costs, cluster, _EAST)
+            self.__update_border(costs, cluster, _SOUTH)
+            if cx > 0:
+                self.__update_border(costs, cluster - self.clength, _EAST)
+            if cz > 0:
+                self.__update_border(costs, cluster - 1, _SOUTH)
+
+        for cluster in dirty.union(*(self.__neighbour_clusters(_) for _ in dirty)):
+            nodes = self.__cluster_nodes(cluster)
+            if cluster in dirty or not np.array_equal(nodes, self.__nodes[cluster]):
+                self.__update_cluster(costs, cluster, nodes)
+
+    def __update_border(self, costs, cluster, direction):
+        """
+        Transitions between the cluster and its east or south neighbour: middles of the passable border segments
+        """
+        cx, cz = divmod(cluster, self.clength)
+        x0, z0, x1, z1 = self.__cluster_bounds(cluster)
+        if direction == _EAST and cx + 1 < self.cwidth:
+            side, across, span = (x1 - 1, slice(z0, z1)), (x1, slice(z0, z1)), z0
+        elif direction == _SOUTH and cz + 1 < self.clength:
+            side, across, span = (slice(x0, x1), z1 - 1), (slice(x0, x1), z1), x0
+        else:
+            return
+        passable = (costs[direction][side] < MAX_INT) & (costs[(direction + 2) % 4][across] < MAX_INT)
+        edges = np.diff(np.concatenate(([0], passable.astype(int), [0])))
+        middles = span + (np.flatnonzero(edges == 1) + np.flatnonzero(edges == -1) - 1) // 2
+        if direction == _EAST:
+            transitions = [((x1 - 1) * self.length + z, x1 * self.length + z) for z in middles.tolist()]
+        else:
+            transitions = [(x * self.length + z1 - 1, x * self.length + z1) for x in middles.tolist()]
+        self.__borders[(cluster, direction)] = transitions
+
+    def __cluster_nodes(self, cluster) -> np.ndarray:
+        cx, cz = divmod(cluster, self.clength)
+        nodes = [a for a, _ in self.__borders.get((cluster, _EAST), ())]
+        nodes += [a for a, _ in self.__borders.get((cluster, _SOUTH), ())]
+        if cx > 0:
+            nodes += [b for _, b in self.__borders.get((cluster - self.clength, _EAST), ())]
+        if cz > 0:
+            nodes += [b for _, b in self.__borders.get((cluster - 1, _SOUTH), ())]
+        return np.unique(np.array(nodes, dtype=np.int64))
+
+    def __update_cluster(self, costs, cluster, nodes):
+        for node in self.__nodes[cluster]:
+            self.__node_index.pop(int(node), None)
+        self.__nodes[cluster] = nodes
+        self.__node_index.update({int(node): i for i, node in enumerate(nodes)})
+        x0, z0, x1, z1 = self.__cluster_bounds(cluster)
+        distances = _window_distances(costs, x0, z0, x1, z1, nodes, False)
+        self.__intra[cluster] = distances[:, nodes // self.length - x0, nodes % self.length - z0]
+
+    # endregion
+
+
+@njit(cache=True)
+def _window_distances(costs, x0, z0, x1, z1, sources, reverse):
+    """
+    :param sources: flat indices x * L + z of points in the window
+    :param reverse: compute the distances towards the sources instead
+    :return: (n, x1 - x0, z1 - z0) distances from each source to the points of the window, moving inside the window,
+    inf for unreachable points
+    """
+    length = costs.shape[2]
+    distances = np.full((len(sources), x1 - x0, z1 - z0), np.inf)
+    for i in range(len(sources)):
+        distance = distances[i]
+        distance[sources[i] // length - x0, sources[i] % length - z0] = 0
+        heap = [(0., sources[i])]
+        while heap:
+            d, index = heapq.heappop(heap)
+            x, z = index // length, index % length
+            if d > distance[x - x0, z - z0]:
+                continue  # outdated entry
+            for direction in range(4):
+                nx, nz = x + DIRECTIONS[direction][0], z + DIRECTIONS[direction][1]
+                if not (x0 <= nx < x1 and z0 <= nz < z1):
+                    continue
+                cost = costs[(direction + 2) % 4, nx, nz] if reverse else costs[direction, x, z]
+                if cost < MAX_INT and d + cost < distance[nx - x0, nz - z0]:
+                    distance[nx - x0, nz - z0] = d + cost
+                    heapq.heappush(heap, (d + cost, nx * length + nz))
+    return distances
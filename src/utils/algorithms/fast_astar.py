@@ -1,115 +1,115 @@
-import numba
+import heapq
+
 import numpy as np
-from numba import njit, jit
-from numpy.random import choice
+from numba import njit
 
 from parameters import MAX_INT
-from utils.misc_objects_functions import _in_limits
 
 
-def a_star(root_point, ending_point, dimensions, cost_function):
+def rotated_offsets(offsets) -> np.ndarray:
+    """
+    :param offsets: moves (dx, dz)
+    :return: (4n, 2) moves and their rotations by a quarter turn
+    """
+    rotations = []
+    for dx, dz in offsets:
+        for _ in range(4):
+            dx, dz = dz, -dx
+            rotations.append((dx, dz))
+    return np.array(rotations, dtype=np.int64)
+
+
+# moves explored from every point, costs[i, x, z] is the cost to move from (x, z) to (x, z) + EXPLORATION_OFFSETS[i]
+EXPLORATION_OFFSETS = rotated_offsets([(0, 1), (-1, 2), (0, 2), (1, 2), (-1, 3), (0, 3), (1, 3)])
+
+
+def a_star(root_point, ending_point, costs):
     """
     Parameters
-    ----------p
-    root_point path origin
-    ending_point path destination
-    cost_function (RoadNetwork, Point, Point) -> int
+    ----------
+    root_point path origin (x, z)
+    ending_point path destination (x, z)
+    costs (len(EXPLORATION_OFFSETS), W, L) costs of the moves of EXPLORATION_OFFSETS from every point, MAX_INT for
+    forbidden moves
 
     Returns
     -------
     best first path from root_point to ending_point if any exists
     """
-    distance_map, neighbours, predecessor_map, heuristic_map = astar_env = _init(root_point, dimensions)
-
-    clst_neighbor = root_point
-    n_steps = 0
-    max_step = max(1000, 10 * _heuristic(root_point, ending_point))
-    while neighbours and (min(distance_map[n] for n in neighbours) < MAX_INT) and (clst_neighbor != ending_point):
-        n_steps += 1
-        clst_neighbor = _closest_neighbor(astar_env, ending_point)
-        neighbours.remove(clst_neighbor)
-        _update_distances(astar_env + (cost_function,), dimensions, clst_neighbor)
-
-        if n_steps >= max_step:
-            break
-
-    if clst_neighbor != ending_point:
+    length = costs.shape[2]
+    max_step = int(max(1000, 10 * _heuristic(root_point[0], root_point[1], ending_point[0], ending_point[1])))
+    parent, found = _best_first_search(np.asarray(costs), EXPLORATION_OFFSETS,
+                                       root_point[0] * length + root_point[1],
+                                       ending_point[0] * length + ending_point[1], max_step)
+    if not found:
         return []
-    else:
-        path = _path_to_dest(predecessor_map, root_point, ending_point, True)
-        return path
+    return _path_to_dest(parent, (int(root_point[0]), int(root_point[1])),
+                         (int(ending_point[0]), int(ending_point[1])), True)
 
 
-@njit
-def _init(point, dims):
-    x, z = point
-    _distance_map = np.full(dims, MAX_INT)
-    _distance_map[x, z] = 0
-    _neighbours = {point}
-    _predecessor_map = np.full((*dims, 2), max(dims))
-    _heuristic_map = np.full(dims, MAX_INT)
-    return _distance_map, _neighbours, _predecessor_map, _heuristic_map
+@njit(cache=True)
+def _best_first_search(costs, offsets, source, target, max_expansions):
+    """
+    A* from source to target with a heap as open set. Points are expanded once, ties are expanded first in first out.
+    Distances are truncated to integers as they are stored
+    :return: (W, L) flat index of the predecessor of every point, -1 for unexplored points, and whether the target
+    was reached
+    """
+    width, length = costs.shape[1:]
+    distance = np.full((width, length), MAX_INT, dtype=np.int64)
+    parent = np.full((width, length), -1, dtype=np.int64)
+    closed = np.zeros((width, length), dtype=np.bool_)
+    target_x, target_z = target // length, target % length
+    distance[source // length, source % length] = 0
+    parent[source // length, source % length] = source
+
+    heap = [(0., 0, source)]
+    rank, expansions = 1, 0
+    while heap and expansions < max_expansions:
+        _, _, node = heapq.heappop(heap)
+        x0, z0 = node // length, node % length
+        if closed[x0, z0]:
+            continue  # outdated entry
+        closed[x0, z0] = True
+        if node == target:
+            break
+        expansions += 1
 
+        for i in range(len(offsets)):
+            x1, z1 = x0 + offsets[i, 0], z0 + offsets[i, 1]
+            if not (0 <= x1 < width and 0 <= z1 < length) or closed[x1, z1] or costs[i, x0, z0] >= MAX_INT:
+                continue
+            new_distance = distance[x0, z0] + costs[i, x0, z0]
+            if new_distance < distance[x1, z1]:
+                distance[x1, z1] = int(new_distance)
+                parent[x1, z1] = node
+                key = distance[x1, z1] + _heuristic(x1, z1, target_x, target_z)
+                heapq.heappush(heap, (key, rank, x1 * length + z1))
+                rank += 1
 
-@njit(cache=True)
-def _closest_neighbor(env, destination):
-
-    distance_map, neighbours = env[:2]
-    heuristic_map = env[3]
-    closest_neighbors = [(0, 0)]
-    min_heuristic = MAX_INT
-    for neighbour in neighbours:
-        x, z = neighbour
-        if heuristic_map[neighbour] == MAX_INT:
-            heuristic_map[neighbour] = _heuristic(neighbour, destination)
-        current_heuristic = distance_map[x, z] + heuristic_map[neighbour]
-        if current_heuristic < min_heuristic:
-            closest_neighbors = [neighbour]
-            min_heuristic = current_heuristic
-        elif current_heuristic == min_heuristic:
-            closest_neighbors.append(neighbour)
-    return closest_neighbors[np.random.randint(0, len(closest_neighbors))]
+    return parent, closed[target_x, target_z]
 
 
 @njit(cache=True)
-def _heuristic(point, destination):
-    x0, z0 = point
-    xf, zf = destination
+def _heuristic(x0, z0, xf, zf):
     return 1.1 * np.sqrt((xf - x0) ** 2 + (zf - z0) ** 2)
 
 
-@jit(forceobj=True)
-def _update_distance(env, updated_point, neighbor):
-    distance_map, neighbors, predecessor_map, h_map, cost = env
-    edge_cost = cost(updated_point, neighbor)
-    if edge_cost == MAX_INT:
-        return
-
-    new_distance = distance_map[updated_point] + edge_cost
-    previous_distance = distance_map[neighbor]
-    if previous_distance >= MAX_INT:
-        neighbors.add(neighbor)
-    if previous_distance > new_distance:
-        distance_map[neighbor] = new_distance
-        predecessor_map[neighbor] = updated_point
-
-
-@jit(forceobj=True, parallel=True)
-def _update_distances(env, dims, point):
-    x, z = point  # type: int, int
-    for xz in _exploration_neighbourhood(x, z, *dims):
-        _update_distance(env, point, xz)
-
-
 @njit(cache=True)
-def _path_to_dest(predecessor_map, origin, destination, fill_missing_points):
+def _path_to_dest(parent, origin, destination, fill_missing_points):
+    """
+    :param parent: (W, L) flat index of the predecessor of every point
+    :return: path from origin to destination, as (x, z) tuples
+    """
+    length = parent.shape[1]
     current_point = destination
     path = [destination]
     while current_point != origin:
-        current_point = (predecessor_map[current_point][0], predecessor_map[current_point][1])
+        index = parent[current_point[0], current_point[1]]
+        current_point = (index // length, index % length)
         dist = abs_distance(path[-1], current_point)
         if fill_missing_points and dist > 1:
-            # because of the large steps in exploration_neighbourhood, the path is sometimes "incomplete"
+            # because of the large steps in the exploration offsets, the path is sometimes "incomplete"
             # here we add intermediate blocks by exploring convex points between the last element of path and
             # the current one
             for i in range(1, dist):
@@ -130,18 +130,6 @@ def nb_reversed(arr: list):
     return target
 
 
-@njit(cache=True)
-def _exploration_neighbourhood(x, z, width, length):
-    neighbourhood = set()
-    for dx, dz in [(0, 1), (-1, 2), (0, 2), (1, 2), (-1, 3), (0, 3), (1, 3)]:
-        for _ in numba.prange(4):
-            dx, dz = dz, -dx
-            x0, z0 = x+dx, z+dz
-            if _in_limits((x0, 0, z0), width, length):
-                neighbourhood.add((x0, z0))
-    return neighbourhood
-
-
 @njit(cache=True)
 def abs_distance(xz0, xz1):
     dx = abs(xz0[0] - xz1[0])
@@ -1,66 +1,122 @@
-from numba import njit
+import heapq
 from math import sqrt
-from typing import Tuple, List, Collection, Set
+
 import numpy as np
+from numba import njit
+from scipy import ndimage
 
-@njit
-def is_init_neigh(distance_map: np.ndarray, _x: int, _z: int):
-    # Context: find border water points in a water surface.
-    # Surrounded water points are useless in exploration
-    W, L = distance_map.shape
-    if distance_map[_x, _z] != 0:
-        return False
-    else:
-        for dx, dz in [(-1, 0), (0, 1), (1, 0), (0, -1)]:
-            x0, z0 = _x + dx, _z + dz
-            if (0 <= x0 < W) and (0 <= z0 < L) and distance_map[x0, z0] != 0:
-                return True
-        return False
+from parameters import MAX_INT
+from utils.algorithms.grid_astar import DIRECTIONS
 
 
-@njit(cache=True)
-def cost(height_map: np.ndarray, src_point: Tuple[int, int], dst_point: Tuple[int, int]):
-    x0, z0 = src_point
-    x1, z1 = dst_point
-    y0 = height_map[src_point]
-    y1 = height_map[dst_point]
-    return sqrt((x0 - x1) ** 2 + (y0 - y1) ** 2 + (z0 - z1) ** 2)
+def multi_source_distances(height_map: np.ndarray, sources: np.ndarray, max_distances: np.ndarray) -> np.ndarray:
+    """
+    Exact distances to the closest source of several fields at once, on the 8-connected grid where moves cost their
+    3D euclidean length
+    :param height_map: (W, L) altitudes
+    :param sources: (n, W, L) boolean sources of each field
+    :param max_distances: (n,) exploration limit of each field, farther points are set to this value
+    :return: (n, W, L) float32 distances
+    """
+    sources = np.asarray(sources, dtype=bool)
+    # sources whose neighbours are all sources are useless in exploration
+    per_field = np.zeros((3, 3, 3), dtype=bool)
+    per_field[1] = True
+    seeds = sources & ~ndimage.binary_erosion(sources, structure=per_field, border_value=1)
+    return _multi_source_dijkstra(np.asarray(height_map, dtype=np.float64), sources, seeds,
+                                  np.asarray(max_distances, dtype=np.float64))
 
 
 @njit(cache=True)
-def update_distance(distance_map: np.ndarray, height_map: np.ndarray, neighbours: List, origin: Tuple[int, int], destination: Tuple[int, int], max_distance):
-    new_distance = distance_map[origin[0], origin[1]] + cost(height_map, origin, destination)
-    previous_distance = distance_map[destination[0], destination[1]]
-    if previous_distance >= max_distance > new_distance:
-        neighbours.append(destination)
-    distance_map[destination[0], destination[1]] = min(previous_distance, new_distance)
+def _multi_source_dijkstra(height_map: np.ndarray, sources: np.ndarray, seeds: np.ndarray, max_distances: np.ndarray):
+    n, W, L = sources.shape
+    distances = np.empty((n, W, L), dtype=np.float32)
+    distance = np.empty((W, L), dtype=np.float64)
 
+    for field in range(n):
+        max_distance = max_distances[field]
+        distance[:] = max_distance
+        heap = [(0., 0)]
+        heap.pop()
+        for x in range(W):
+            for z in range(L):
+                if sources[field, x, z]:
+                    distance[x, z] = 0
+                    if seeds[field, x, z]:
+                        heap.append((0., x * L + z))  # equal keys: valid heap
 
-@njit(cache=True)
-def update_distances(distance_map: np.ndarray, height_map: np.ndarray, neighbours: List, neighbour: Tuple[int, int], max_distance):
-    W, L = distance_map.shape
-    x0, z0 = neighbour
-    for xn in range(x0 - 1, x0 + 2):
-        for zn in range(z0 - 1, z0 + 2):
-            if (xn != x0 or zn != z0) and 0 <= xn < W and 0 <= zn < L and distance_map[xn, zn] > 0:
-                update_distance(distance_map, height_map, neighbours, neighbour, (xn, zn), max_distance)
+        while heap:
+            d, index = heapq.heappop(heap)
+            x0, z0 = index // L, index % L
+            if d > distance[x0, z0]:
+                continue  # outdated entry
+            for x1 in range(max(x0 - 1, 0), min(x0 + 2, W)):
+                for z1 in range(max(z0 - 1, 0), min(z0 + 2, L)):
+                    dy = height_map[x1, z1] - height_map[x0, z0]
+                    new_distance = d + sqrt((x1 - x0) ** 2 + dy ** 2 + (z1 - z0) ** 2)
+                    if new_distance < distance[x1, z1] and new_distance < max_distance:
+                        distance[x1, z1] = new_distance
+                        heapq.heappush(heap, (new_distance, x1 * L + z1))
 
+        distances[field] = distance
+    return distances
 
-@njit
-def fast_dijkstra(distance_map: np.ndarray, height_map: np.ndarray):
-    max_distance = distance_map.max()
-    W, L = distance_map.shape
-    neighbours = []
-    for x1 in range(W):
-        for z1 in range(L):
-            if is_init_neigh(distance_map, x1, z1):
-                neighbours.append((x1, z1))
-
-    while len(neighbours) > 0:
-        # true Dijkstra would require to explore the nearest neighbour. For faster computing, we assume that the oldest
-        # added neighbour is not so far from being the closest unexplored
-        clst_neighbor = neighbours[0]
-        update_distances(distance_map, height_map, neighbours, clst_neighbor, max_distance)
-        del neighbours[0]
 
+def fast_dijkstra(distance_map: np.ndarray, height_map: np.ndarray):
+    """
+    Computes in place the distances to the null points of distance_map, explored up to its maximum value
+    """
+    sources = (distance_map == 0)[np.newaxis]
+    distance_map[:] = multi_source_distances(height_map, sources, np.array([distance_map.max()]))[0]
     return distance_map
+
+
+def multi_source_tree(costs: np.ndarray, sources: np.ndarray, targets: np.ndarray):
+    """
+    Shortest paths tree grown from every source at once, until all the targets are reached
+    :param costs: (4, W, L) costs to move towards the neighbours, ordered as in grid_astar.DIRECTIONS, MAX_INT for
+    forbidden moves
+    :param sources: (W, L) boolean sources of the tree
+    :param targets: flat indices x * L + z of the points to reach
+    :return: (W, L) distances to the closest source, inf for unexplored points, and (W, L) flat index of the parent of
+    each point in the tree, -1 for the sources and unexplored points
+    """
+    return _multi_source_tree(np.asarray(costs, dtype=np.float64), np.asarray(sources, dtype=bool),
+                              np.asarray(targets, dtype=np.int64))
+
+
+@njit(cache=True)
+def _multi_source_tree(costs: np.ndarray, sources: np.ndarray, targets: np.ndarray):
+    W, L = sources.shape
+    distance = np.full((W, L), np.inf)
+    parent = np.full((W, L), -1, dtype=np.int32)
+    is_target = np.zeros(W * L, dtype=np.bool_)
+    is_target[targets] = True
+    remaining = is_target.sum()
+
+    heap = [(0., 0)]
+    heap.pop()
+    for x in range(W):
+        for z in range(L):
+            if sources[x, z]:
+                distance[x, z] = 0
+                heap.append((0., x * L + z))  # equal keys: valid heap
+
+    while heap and remaining > 0:
+        d, index = heapq.heappop(heap)
+        x0, z0 = index // L, index % L
+        if d > distance[x0, z0]:
+            continue  # outdated entry
+        if is_target[index]:
+            is_target[index] = False
+            remaining -= 1
+        for direction in range(4):
+            x1, z1 = x0 + DIRECTIONS[direction][0], z0 + DIRECTIONS[direction][1]
+            if not (0 <= x1 < W and 0 <= z1 < L) or costs[direction, x0, z0] >= MAX_INT:
+                continue
+            new_distance = d + costs[direction, x0, z0]
+            if new_distance < distance[x1, z1]:
+                distance[x1, z1] = new_distance
+                parent[x1, z1] = index
+                heapq.heappush(heap, (new_distance, x1 * L + z1))
+    return distance, parent
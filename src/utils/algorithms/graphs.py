@@ -1,118 +1,104 @@
-from typing import Dict, List, Tuple, Set, Callable
+import heapq
+from math import ceil
+from typing import Callable, List, Set, Tuple
 
 import numpy as np
-from sortedcontainers import SortedList
 
 from parameters import MAX_INT
-from utils import Point, BuildArea, manhattan, Direction
+from utils import Point, Position, BuildArea, manhattan
+from .grid_astar import DIRECTIONS
 
 __all__ = [
     'connected_component',
-    'Graph',
+    'dijkstra',
     'GridGraph',
-    'point_set_as_array'
+    'point_set_as_array',
+    'Tree'
 ]
 
 
-class Graph:
-    def __init__(self, directed, wtype=float):
-        self.__adjacency_lists: Dict[Point, Dict[Point, wtype]] = {}
-        self.__directed = directed
-
-    def addEdge(self, node, neighbour, weight=None):
-        self.__addNode(node)
-        self.__addNode(neighbour)
-        self.__adjacency_lists[node][neighbour] = weight
-        if not self.__directed:
-            self.__adjacency_lists[neighbour][node] = weight
+class GridGraph:
+    def __init__(self, directed, **kwargs):
+        """
+        Grid of the points at a given step, connected to their 4 neighbours. Nodes are flat indices gx * glength + gz
+        of the points (gx * step, gz * step), and the adjacency is stored in CSR format, neighbours in DIRECTIONS order
+        :param directed: is the graph directed
+        :keyword step: granularity of the graph, def = 1
+        :keyword width: width of the graph, def: terrain width
+        :keyword length: length of the graph, def: terrain length
+        :keyword cost: cost function to apply on edges (pair of nodes), def = manhattan distance
+        """
+        self.directed = directed
+        self.step = kwargs.get("step", 1)
+        self.width = kwargs.get("width", BuildArea().width)
+        self.length = kwargs.get("length", BuildArea().length)
+        self.__cost = kwargs.get("cost", manhattan)
+        self.gwidth, self.glength = int(ceil(self.width / self.step)), int(ceil(self.length / self.step))
+        self.indptr, self.indices = _grid_adjacency(self.gwidth, self.glength)
 
-    def removeEdge(self, node, neighbour):
-        self.__adjacency_lists[node].pop(neighbour)
-        if not self.__directed:
-            self.__adjacency_lists[neighbour].pop(node)
+    @property
+    def size(self) -> int:
+        return self.gwidth * self.glength
 
-    def __addNode(self, node):
-        if node not in self.nodes:
-            self.__adjacency_lists[node] = {}
+    def index(self, point: Point) -> int:
+        return (point.x // self.step) * self.glength + point.z // self.step
 
-    @property
-    def nodes(self):
-        return self.__adjacency_lists.keys()
+    def point(self, index: int) -> Position:
+        gx, gz = divmod(int(index), self.glength)
+        return Position(gx * self.step, gz * self.step)
 
-    def getNeighbours(self, node):
-        return set(self.__adjacency_lists[node].keys())
+    def getNeighbours(self, node: Point) -> List[Position]:
+        i = self.index(node)
+        return [self.point(j) for j in self.indices[self.indptr[i]:self.indptr[i + 1]]]
 
     def __getitem__(self, item):
+        # costs are not stored, as they change with the roads and the obstacles
         node, neigh = item
-        return self.__adjacency_lists[node][neigh]
+        return self.__cost(node, neigh)
 
 
-class Tree(Graph):
-    def __init__(self):
-        super().__init__(True)
-        self.__parent_node: Dict[Point, Point] = {}
+class Tree:
+    """
+    Shortest paths tree, stored as the parent index of every node of a GridGraph (-1 outside of the tree)
+    """
 
-    def addEdge(self, node, neighbour, weight=None):
-        if neighbour in self.__parent_node:
-            self.removeEdge(self.__parent_node[neighbour], neighbour)
-        super().addEdge(node, neighbour, weight)
-        self.__parent_node[neighbour] = node
+    def __init__(self, graph: GridGraph, parents: np.ndarray):
+        self.__graph = graph
+        self.__parents = parents
 
-    def getParent(self, node):
-        if node in self.__parent_node:
-            return self.__parent_node[node]
-        return None
+    def getParent(self, node: Point):
+        parent = self.__parents[self.__graph.index(node)]
+        return self.__graph.point(parent) if parent >= 0 else None
 
-    def getPathTowards(self, target: Point) -> List[Point]:
+    def getPathTowards(self, target: Point) -> List[Position]:
         """
         Gets the path in the tree
         :param target: Node in the tree
         :return: path from tree source to target
         """
-        node = target  # starts in the target
-        path: List[Point] = []
-        while node != self.getParent(node):
-            path.insert(0, node)  # adds in first Point, keeps the order
-            node = self.getParent(node)  # go up in the tree
-        path.insert(0, node)  # finally, add the tree source
-        return path
+        path = [self.__graph.index(target)]  # starts in the target
+        while self.__parents[path[-1]] != path[-1]:
+            path.append(self.__parents[path[-1]])  # go up in the tree
+        return [self.__graph.point(_) for _ in reversed(path)]
 
 
-class GridGraph(Graph):
-    def __init__(self, directed, **kwargs):
-        """
-        :param directed: is the graph directed
-        :keyword step: granularity of the graph, def = 1
-        :keyword width: width of the graph, def: terrain width
-        :keyword length: length of the graph, def: terrain length
-        :keyword cost: cost function to apply on edges (pair of nodes), def = road build cost
-        """
-        super().__init__(directed)
-        self.step = kwargs.get("step", 1)
-        self.width = kwargs.get("width", BuildArea().width)
-        self.length = kwargs.get("length", BuildArea().length)
-        self.__cost = kwargs.get("cost", manhattan)
-
-    def getNeighbours(self, node):
-        res = set()
-        for _dir in Direction.cardinal_directions():
-            neigh = node + (_dir * self.step)
-            if 0 <= neigh.x < self.width and 0 <= neigh.z < self.length:
-                res.add(neigh)
-
-        return res
-
-    def __getitem__(self, item):
-        try:
-            return super().__getitem__(item)
-        except KeyError:
-            node, neigh = item
-            cost = self.__cost(node, neigh)
-            self.addEdge(node, neigh, cost)
-            return cost
-
-
-def dijkstra(graph: Graph, source: Point or Set[Point], end_condition=(lambda _: False)) -> Tuple[Tree, Point]:
+def _grid_adjacency(gwidth: int, glength: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: CSR adjacency of the 4-connected grid (indptr, indices)
+    """
+    index = np.arange(gwidth * glength).reshape((gwidth, glength))
+    sources, neighbours = [], []
+    for dx, dz in DIRECTIONS:
+        sources.append(index[max(-dx, 0):gwidth - max(dx, 0), max(-dz, 0):glength - max(dz, 0)].ravel())
+        neighbours.append(index[max(dx, 0):gwidth + min(dx, 0), max(dz, 0):glength + min(dz, 0)].ravel())
+    sources = np.concatenate(sources)
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(gwidth * glength + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=gwidth * glength))
+    return indptr, np.concatenate(neighbours)[order]
+
+
+def dijkstra(graph: GridGraph, source: Point or Set[Point], end_condition=(lambda _: False)) -> Tuple[Tree, Point]:
     """
     Dijkstra algorithm
     :param graph: graph to explore
@@ -120,50 +106,61 @@ def dijkstra(graph: Graph, source: Point or Set[Point], end_condition=(lambda _:
     :param end_condition: ending condition on the explored node
     :return: (tree starting in source, last node explored)
     """
-
-    if isinstance(source, Point):
-        source = {source}
-    tree = Tree()
-    explored: Set[Point] = set()
-    for source_pos in source:
-        tree.addEdge(source_pos, source_pos, 0)
-    neighbours: SortedList = SortedList(source, lambda pos: tree[tree.getParent(pos), pos])
-
-    node: Point = source.pop()
-    while neighbours:
-        node = neighbours.pop(0)
-        if end_condition(node):
-            break
-
-        elif node in explored:
+    sources = [graph.index(source)] if isinstance(source, Point) else [graph.index(_) for _ in source]
+    distances = np.full(graph.size, np.inf)
+    parents = np.full(graph.size, -1, dtype=np.int64)
+    explored = np.zeros(graph.size, dtype=bool)
+    distances[sources] = 0
+    parents[sources] = sources
+    heap = [(0., _) for _ in set(sources)]
+    heapq.heapify(heap)
+    indptr, indices = graph.indptr, graph.indices
+
+    node = sources[-1]
+    while heap:
+        distance, index = heapq.heappop(heap)
+        if explored[index]:
             continue
+        node = index
+        point = graph.point(index)
+        if end_condition(point):
+            break
+        explored[index] = True
 
-        node_value = tree[tree.getParent(node), node]
-        for neighbour in filter(lambda n: n not in explored, graph.getNeighbours(node)):
-            cost = graph[node, neighbour]
-            if cost < MAX_INT:
-                tree.addEdge(node, neighbour, node_value + cost)
-                neighbours.add(neighbour)
-        explored.add(node)
+        for edge in range(indptr[index], indptr[index + 1]):
+            neighbour = indices[edge]
+            if explored[neighbour]:
+                continue
+            cost = graph[point, graph.point(neighbour)]
+            if cost < MAX_INT and distance + cost < distances[neighbour]:
+                distances[neighbour] = distance + cost
+                parents[neighbour] = index
+                heapq.heappush(heap, (distance + cost, neighbour))
 
-    return tree, node
+    return Tree(graph, parents), graph.point(node)
 
 
 def connected_component(
-        graph: Graph,
+        graph: GridGraph,
         source: Point,
         are_connected: Callable[[Point, Point], bool],
         max_size: int = -1
 ) -> Set[Point]:
+    in_component = np.zeros(graph.size, dtype=bool)
+    source_index = graph.index(source)
+    in_component[source_index] = True
     component: Set[Point] = set()
-    points_to_explore: Set[Point] = {source}
-
-    while points_to_explore and max_size:
-        new_comp_point = points_to_explore.pop()
-
-        for neighbour in graph.getNeighbours(new_comp_point):
-            if are_connected(new_comp_point, neighbour) and neighbour not in component:
-                points_to_explore.add(neighbour)
+    to_explore: List[Tuple[int, Point]] = [(source_index, source)]
+
+    while to_explore and max_size:
+        index, new_comp_point = to_explore.pop()
+        for neighbour in graph.indices[graph.indptr[index]:graph.indptr[index + 1]]:
+            if in_component[neighbour]:
+                continue
+            neighbour_point = graph.point(neighbour)
+            if are_connected(new_comp_point, neighbour_point):
+                in_component[neighbour] = True
+                to_explore.append((neighbour, neighbour_point))
 
         component.add(new_comp_point)
         max_size -= 1
@@ -172,15 +169,15 @@ def connected_component(
 
 
 def point_set_as_array(points: Set[Point]) -> Tuple[Point, np.ndarray]:
-    min_x, max_x = min(_.x for _ in points), max(_.x for _ in points)
-    min_z, max_z = min(_.z for _ in points), max(_.z for _ in points)
+    coords = np.array([(_.x, _.z) for _ in points])
+    min_x, min_z = coords.min(axis=0)
+    max_x, max_z = coords.max(axis=0)
 
     origin = Point(min_x, min_z)
 
     width = max_x - min_x + 1
     length = max_z - min_z + 1
     mask = np.full((width, length), False)
-    for p in points:
-        mask[p.x - min_x, p.z - min_z] = True
+    mask[coords[:, 0] - min_x, coords[:, 1] - min_z] = True
 
     return origin, mask
@@ -0,0 +1,157 @@
+"""
+A* over the grid with unit steps, on flat indices. Edge costs are given as directional rasters, and the search runs in
+compiled batches of expansions, so that the caller can stop it at a deadline between two batches
+"""
+import time
+from math import sqrt
+from typing import List, Tuple
+
+import numpy as np
+from numba import njit
+
+from parameters import MAX_INT
+
+# neighbours order, costs[d, x, z] is the cost to move from (x, z) to (x + DX[d], z + DZ[d])
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))  # East, South, West, North
+_DX = np.array([_[0] for _ in DIRECTIONS])
+_DZ = np.array([_[1] for _ in DIRECTIONS])
+
+ASTAR_BATCH_SIZE = 2048  # expansions between two deadline checks
+
+_RUNNING, _DONE, _HEAP_FULL = range(3)
+
+
+def grid_astar(costs: np.ndarray, source: Tuple[int, int], target: Tuple[int, int], rough_path: np.ndarray,
+               time_limit: float) -> List[Tuple[int, int]]:
+    """
+    :param costs: (4, W, L) edge costs towards the neighbours in DIRECTIONS order, MAX_INT for forbidden moves
+    :param source: (x, z) origin of the path
+    :param target: (x, z) destination of the path
+    :param rough_path: (n, 2) reference path from source to target, the heuristic of a point is its distance to the
+    rough path point after the closest one, plus the length of the rough path from there
+    :param time_limit: maximum duration of the search in seconds
+    :return: path from source to target as (x, z) tuples, empty if no path was found in time
+    """
+    width, length = costs.shape[1:]
+    rough_path = np.asarray(rough_path, dtype=np.float64).reshape((-1, 2))
+    remaining_length = np.zeros(len(rough_path))
+    for i in range(len(rough_path) - 2, -1, -1):
+        remaining_length[i] = remaining_length[i + 1] + np.linalg.norm(rough_path[i + 1] - rough_path[i])
+
+    distance = np.full((width, length), MAX_INT, dtype=np.float64)
+    parent = np.full((width, length), -1, dtype=np.int32)
+    heuristic = np.full((width, length), MAX_INT, dtype=np.float64)
+    heap_keys, heap_order, heap_nodes = np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # heap size, insertion counter, last expanded node
+    state = np.array([0, 0, source[0] * length + source[1]], dtype=np.int64)
+    source_index, target_index = source[0] * length + source[1], target[0] * length + target[1]
+
+    deadline = time.monotonic() + time_limit
+    status = _HEAP_FULL
+    while status != _DONE and time.monotonic() < deadline:
+        if status == _HEAP_FULL:
+            capacity = max(1024, 2 * len(heap_keys))
+            heap_keys = np.resize(heap_keys, capacity)
+            heap_order = np.resize(heap_order, capacity)
+            heap_nodes = np.resize(heap_nodes, capacity)
+        status = _astar_batch(costs, source_index, target_index, rough_path, remaining_length, distance, parent,
+                              heuristic, heap_keys, heap_order, heap_nodes, state, ASTAR_BATCH_SIZE)
+
+    if parent[target] < 0:
+        return []
+    path = [target_index]
+    while path[-1] != source_index:
+        path.append(parent.flat[path[-1]])
+    return [divmod(int(index), length) for index in reversed(path)]
+
+
+@njit(cache=True)
+def _heap_push(keys, order, nodes, state, key, node):
+    i = state[0]
+    state[0] += 1
+    rank = state[1]
+    state[1] += 1
+    while i > 0:
+        up = (i - 1) >> 1
+        if keys[up] < key or (keys[up] == key and order[up] < rank):
+            break
+        keys[i], order[i], nodes[i] = keys[up], order[up], nodes[up]
+        i = up
+    keys[i], order[i], nodes[i] = key, rank, node
+
+
+@njit(cache=True)
+def _heap_pop(keys, order, nodes, state):
+    node = nodes[0]
+    state[0] -= 1
+    size = state[0]
+    key, rank, last = keys[size], order[size], nodes[size]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and (keys[child + 1] < keys[child]
+                                 or (keys[child + 1] == keys[child] and order[child + 1] < order[child])):
+            child += 1
+        if key < keys[child] or (key == keys[child] and rank < order[child]):
+            break
+        keys[i], order[i], nodes[i] = keys[child], order[child], nodes[child]
+        i = child
+    if size > 0:
+        keys[i], order[i], nodes[i] = key, rank, last
+    return node
+
+
+@njit(cache=True)
+def _heuristic(x, z, target_x, target_z, rough_path, remaining_length):
+    closest, closest_distance = 0, np.inf
+    for i in range(len(rough_path)):
+        d = sqrt((x - rough_path[i, 0]) ** 2 + (z - rough_path[i, 1]) ** 2)
+        if d < closest_distance:
+            closest, closest_distance = i, d
+    if closest >= len(rough_path) - 2:
+        return sqrt((x - target_x) ** 2 + (z - target_z) ** 2)
+    ref = closest + 2
+    return sqrt((x - rough_path[ref, 0]) ** 2 + (z - rough_path[ref, 1]) ** 2) + remaining_length[ref]
+
+
+@njit(cache=True)
+def _astar_batch(costs, source, target, rough_path, remaining_length, distance, parent, heuristic,
+                 heap_keys, heap_order, heap_nodes, state, max_expansions):
+    """
+    Runs at most max_expansions expansions of the search, whose progress is kept in the arrays.
+    Points are ordered by their distance before their last update plus heuristic, with ties explored first in first out
+    """
+    width, length = distance.shape
+    target_x, target_z = target // length, target % length
+    if state[1] == 0:
+        # first batch
+        distance[source // length, source % length] = 0
+        _heap_push(heap_keys, heap_order, heap_nodes, state, 0., source)
+
+    for _ in range(max_expansions):
+        if state[2] == target or state[0] == 0:
+            return _DONE
+        if state[0] + 4 > len(heap_keys):
+            return _HEAP_FULL
+
+        node = _heap_pop(heap_keys, heap_order, heap_nodes, state)
+        state[2] = node
+        x0, z0 = node // length, node % length
+        for d in range(4):
+            x1, z1 = x0 + _DX[d], z0 + _DZ[d]
+            if not (0 <= x1 < width and 0 <= z1 < length):
+                continue
+            cost = costs[d, x0, z0]
+            if cost == MAX_INT:
+                continue
+            old_distance = distance[x1, z1]
+            new_distance = distance[x0, z0] + cost
+            if new_distance < old_distance:
+                if heuristic[x1, z1] == MAX_INT:
+                    heuristic[x1, z1] = _heuristic(x1, z1, target_x, target_z, rough_path, remaining_length)
+                _heap_push(heap_keys, heap_order, heap_nodes, state, old_distance + heuristic[x1, z1], x1 * length + z1)
+                distance[x1, z1] = new_distance
+                parent[x1, z1] = node
+    return _RUNNING
@@ -1,20 +1,32 @@
-from numba.typed import List as nbList
-from numpy.random import randint
+import heapq
 
-from utils.algorithms.fast_astar import abs_distance, numba, _in_limits, MAX_INT, \
-    _path_to_dest, _heuristic as euclidean, njit, np, jit
-from utils.misc_objects_functions import index_argmin
+import numpy as np
+from numba import njit
+
+from utils.algorithms.fast_astar import abs_distance, MAX_INT, rotated_offsets, _path_to_dest, \
+    _heuristic as euclidean
 GAMMA = 4
 
+# moves explored from every point at step 1, see exploration_offsets
+_BASE_OFFSETS = rotated_offsets([(0, 1), (1, 1), (-1, 2), (0, 2), (1, 2)])
+
 
-def hierarchical_astar(source, target, dimensions, cost_function):
+def exploration_offsets(step: int) -> np.ndarray:
+    """
+    :return: (n, 2) moves explored from every point at this step of the search
+    """
+    return _BASE_OFFSETS * step
+
+
+def hierarchical_astar(source, target, costs):
     """
     Custom A* algorithm - computes path with decreasing steps
     :param source: source point (x, z)
     :param target: target point (x, z)
-    :param dimensions: (width, length)
-    :param cost_function: cost function ((xo, zo), (xd, zd)) -> value
+    :param costs: function step -> (n, W, L) costs of the moves of exploration_offsets(step) from every point, MAX_INT
+    for forbidden moves
     """
+    source, target = (int(source[0]), int(source[1])), (int(target[0]), int(target[1]))
 
     # Compute initial step
     step = 1
@@ -22,137 +34,92 @@ def hierarchical_astar(source, target, dimensions, cost_function):
     while step * GAMMA < d:
         step *= GAMMA
 
-    def get_cumsum():
-        """
-        Computes target heuristic for each point in the rough path
-        :return:
-        """
-        l = [0]
-        for i in range(len(rough_path) - 1, 0, -1):
-            l.append(l[-1] + cost_function(rough_path[i], rough_path[i - 1]))
-        res = nbList()
-        [res.append(_) for _ in reversed(l)]
-        return res
-
-    rough_path = [source, target]
+    # rough path, and target heuristic for each of its points
+    rough_path = np.array([source, target], dtype=np.int64)
+    path_heuristic = np.array([euclidean(*source, *target), 0.])
 
     while True:
-        distance_map, neighbours, predecessor_map, heuristic_map = astar_env = _init(source, dimensions)
-        cumsum = get_cumsum()
-        clst_neighbour = source
-        heuristic_idx = {}
-
-        while neighbours and (min(distance_map[n] for n in neighbours) < MAX_INT) and abs_distance(clst_neighbour, target) >= step:
-
-            # pick new exploration point -> point closer to target
-            clst_neighbour = _closest_neighbor(astar_env, rough_path, cumsum)
-            neighbours.remove(clst_neighbour)
-            neighbours = list(filter(lambda n: heuristic_idx[n] >= heuristic_idx[clst_neighbour], neighbours))
-            astar_env = distance_map, neighbours, predecessor_map, heuristic_map
-            known_neighbours = len(neighbours)
-
-            # explore neighbours to this point
-            _update_distances(astar_env + (cost_function,), dimensions + (step,), clst_neighbour)
-
-            # handle new neighbours: store their heuristic index
-            for new_neighbour in neighbours[known_neighbours:]:
-                heuristic_idx[new_neighbour] = _heuristic_index(new_neighbour, rough_path)
+        step_costs = np.asarray(costs(step))
+        distance, parent, last = _rough_search(step_costs, exploration_offsets(step), source, target, step,
+                                               rough_path, path_heuristic)
 
         if step == 1:
-            if abs_distance(clst_neighbour, target) >= step:
+            if abs_distance(last, target) >= step:
                 return []
             else:
-                return _path_to_dest(predecessor_map, source, target, True)
+                return _path_to_dest(parent, source, target, True)
         else:
-            rough_path = _path_to_dest(predecessor_map, source, clst_neighbour, False)
-            if rough_path[-1] != target:
-                rough_path.append(target)
+            path = _path_to_dest(parent, source, last, False)
+            path_heuristic = [float(distance[last] - distance[_]) for _ in path]
+            if path[-1] != target:
+                path_heuristic = [_ + euclidean(*last, *target) for _ in path_heuristic] + [0.]
+                path.append(target)
+            rough_path, path_heuristic = np.array(path, dtype=np.int64), np.array(path_heuristic)
             step //= GAMMA
 
 
-@njit
-def _heuristic_index(point, path):
-    distance_to_path = nbList()
-    [distance_to_path.append(euclidean(point, point2)) for point2 in path]
-    return index_argmin(distance_to_path)
+@njit(cache=True)
+def _heuristic_index(x, z, path):
+    closest, closest_distance = 0, np.inf
+    for i in range(len(path)):
+        d = euclidean(x, z, path[i, 0], path[i, 1])
+        if d < closest_distance:
+            closest, closest_distance = i, d
+    return closest
 
 
-@njit()
-def _heuristic(point, path, path_heuristic):
-    i = _heuristic_index(point, path)
+@njit(cache=True)
+def _heuristic(x, z, i, path, path_heuristic):
     if i == len(path) - 1:
-        return euclidean(point, path[-1])
-    target = path[i + 1]
-    return euclidean(point, target) + path_heuristic[i + 1]
-
-
-@njit()
-def _closest_neighbor(env, path, path_heuristic):
-    distance_map, neighbors = env[:2]
-    heuristic_map = env[3]
-    closest_neighbors = nbList()
-    closest_neighbors.append((1 << 16, 1 << 16))
-    min_heuristic = MAX_INT
-    for neighbor in neighbors:
-        x, z = neighbor
-        if heuristic_map[neighbor] >= MAX_INT:
-            heuristic_map[neighbor] = _heuristic(neighbor, path, path_heuristic)
-        current_heuristic = distance_map[x, z] + heuristic_map[neighbor]
-        if min_heuristic == MAX_INT or current_heuristic < min_heuristic:
-            closest_neighbors = nbList()
-            closest_neighbors.append(neighbor)
-            min_heuristic = current_heuristic
-        elif current_heuristic == min_heuristic:
-            closest_neighbors.append(neighbor)
-    return closest_neighbors[randint(len(closest_neighbors))]
-
-
-@jit(forceobj=True, parallel=True)
-def _update_distances(env, dims, point):
-    """
-    :param env: (...)
-    :param dims: (width, length, step)
-    :param point: (x, z)
-    """
-    x, z = point  # type: int, int
-    for xz in _exploration_neighbourhood(x, z, *dims):
-        _update_distance(env, point, xz)
+        return euclidean(x, z, path[-1, 0], path[-1, 1])
+    return euclidean(x, z, path[i + 1, 0], path[i + 1, 1]) + path_heuristic[i + 1]
 
 
 @njit(cache=True)
-def _exploration_neighbourhood(x, z, width, length, step):
-    neighbourhood = set()
-    for dx, dz in [(0, step), (step, step), (-step, 2 * step), (0, 2 * step), (step, 2 * step)]:
-        for _ in numba.prange(4):
-            dx, dz = dz, -dx
-            x0, z0 = x + dx, z + dz
-            if _in_limits((x0, 0, z0), width, length):
-                neighbourhood.add((x0, z0))
-    return neighbourhood
-
-
-@njit
-def _init(point, dims):
-    x, z = point
-    _distance_map = np.full(dims, MAX_INT)
-    _distance_map[x, z] = 0
-    _neighbours = [point]
-    _predecessor_map = np.full((*dims, 2), max(dims))
-    _heuristic_map = np.full(dims, MAX_INT)
-    return _distance_map, _neighbours, _predecessor_map, _heuristic_map
-
-
-@jit(forceobj=True)
-def _update_distance(env, updated_point, neighbor):
-    distance_map, neighbors, predecessor_map, h_map, cost = env
-    edge_cost = cost(updated_point, neighbor)
-    if edge_cost == MAX_INT:
-        return
-
-    new_distance = distance_map[updated_point] + edge_cost
-    previous_distance = distance_map[neighbor]
-    if previous_distance >= MAX_INT:
-        neighbors.append(neighbor)
-    if previous_distance > new_distance:
-        distance_map[neighbor] = new_distance
-        predecessor_map[neighbor] = updated_point
+def _rough_search(costs, offsets, source, target, step, path, path_heuristic):
+    """
+    A* from source until a point closer than step to target, guided by the rough path. The heuristic of a point is its
+    distance to the rough path point after the closest one, plus the heuristic of this rough path point. The
+    exploration never goes back along the rough path: points closer to an earlier rough path point than the last
+    expanded point are dropped from the heap. Distances are truncated to integers as they are stored
+    :return: (W, L) distances from source, (W, L) flat index of the predecessor of every point, last expanded point
+    """
+    width, length = costs.shape[1:]
+    distance = np.full((width, length), MAX_INT, dtype=np.int64)
+    parent = np.full((width, length), -1, dtype=np.int64)
+    closed = np.zeros((width, length), dtype=np.bool_)
+    path_index = np.full((width, length), -1, dtype=np.int64)
+    x0, z0 = source
+    distance[x0, z0] = 0
+    parent[x0, z0] = x0 * length + z0
+    path_index[x0, z0] = _heuristic_index(x0, z0, path)
+
+    heap = [(0., 0, x0 * length + z0)]
+    rank, progress = 1, 0
+    last = source
+    while heap:
+        _, _, node = heapq.heappop(heap)
+        x0, z0 = node // length, node % length
+        if closed[x0, z0] or path_index[x0, z0] < progress:
+            continue  # outdated entry or point behind the exploration
+        closed[x0, z0] = True
+        progress = path_index[x0, z0]
+        last = (x0, z0)
+        if abs_distance(last, target) < step:
+            break
+
+        for i in range(len(offsets)):
+            x1, z1 = x0 + offsets[i, 0], z0 + offsets[i, 1]
+            if not (0 <= x1 < width and 0 <= z1 < length) or closed[x1, z1] or costs[i, x0, z0] >= MAX_INT:
+                continue
+            new_distance = distance[x0, z0] + costs[i, x0, z0]
+            if new_distance < distance[x1, z1]:
+                if path_index[x1, z1] < 0:
+                    path_index[x1, z1] = _heuristic_index(x1, z1, path)
+                distance[x1, z1] = int(new_distance)
+                parent[x1, z1] = node
+                key = distance[x1, z1] + _heuristic(x1, z1, path_index[x1, z1], path, path_heuristic)
+                heapq.heappush(heap, (key, rank, x1 * length + z1))
+                rank += 1
+
+    return distance, parent, last
@@ -1,4 +1,5 @@
 import numpy as np
+from numba import njit
 from .geometry_utils import Point
 
 
@@ -35,3 +36,83 @@ class PointArray(np.ndarray):
     @property
     def length(self):
         return self.shape[1]
+
+
+class FenwickTree:
+    """
+    Sums of a 2d array over rectangles, stored as a 2d Fenwick tree: queries and updates of a point in O(log W.log L)
+    """
+    def __init__(self, values: np.ndarray):
+        self.__tree = _fenwick_tree(np.asarray(values, dtype=np.int64))
+
+    def sum(self, x0: int, z0: int, x1: int, z1: int) -> int:
+        """
+        Sum of the values in [x0, x1[ x [z0, z1[, clipped to the array limits
+        """
+        width, length = self.shape
+        x0, z0 = min(max(x0, 0), width), min(max(z0, 0), length)
+        x1, z1 = min(max(x1, x0), width), min(max(z1, z0), length)
+        return int(_rectangle_sum(self.__tree, x0, z0, x1, z1))
+
+    def add(self, x0: int, z0: int, delta: np.ndarray):
+        """
+        Adds delta to the values starting at (x0, z0), delta must fit in the array
+        """
+        if not delta.any():
+            return
+        _add(self.__tree, x0, z0, np.asarray(delta, dtype=np.int64))
+
+    @property
+    def shape(self):
+        return self.__tree.shape[0] - 1, self.__tree.shape[1] - 1
+
+
+@njit(cache=True)
+def _fenwick_tree(values):
+    # a 2d Fenwick tree is a 1d Fenwick tree along each axis, tree[x, z] sums values over ]x - lsb(x), x] x ]z - lsb(z), z]
+    width, length = values.shape
+    tree = np.zeros((width + 1, length + 1), dtype=np.int64)
+    tree[1:, 1:] = values
+    for x in range(1, width + 1):
+        parent = x + (x & -x)
+        if parent <= width:
+            tree[parent, :] += tree[x, :]
+    for z in range(1, length + 1):
+        parent = z + (z & -z)
+        if parent <= length:
+            tree[:, parent] += tree[:, z]
+    return tree
+
+
+@njit(cache=True)
+def _prefix_sum(tree, x, z):
+    # sum of the values in [0, x[ x [0, z[
+    res = 0
+    while x > 0:
+        j = z
+        while j > 0:
+            res += tree[x, j]
+            j -= j & -j
+        x -= x & -x
+    return res
+
+
+@njit(cache=True)
+def _rectangle_sum(tree, x0, z0, x1, z1):
+    return _prefix_sum(tree, x1, z1) - _prefix_sum(tree, x0, z1) - _prefix_sum(tree, x1, z0) + _prefix_sum(tree, x0, z0)
+
+
+@njit(cache=True)
+def _add(tree, x0, z0, delta):
+    width, length = tree.shape[0] - 1, tree.shape[1] - 1
+    for dx in range(delta.shape[0]):
+        for dz in range(delta.shape[1]):
+            if delta[dx, dz] == 0:
+                continue
+            x = x0 + dx + 1
+            while x <= width:
+                z = z0 + dz + 1
+                while z <= length:
+                    tree[x, z] += delta[dx, dz]
+                    z += z & -z
+                x += x & -x
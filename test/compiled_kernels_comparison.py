@@ -0,0 +1,301 @@
+"""
+Compares the compiled search kernels with scalar versions of the algorithms they replaced, on seeded synthetic rasters.
+The scalar versions are the former pure Python loops, with their neighbour orders fixed and ties broken in first in
+first out order, or plain Dijkstra searches where the former algorithm was approximate
+"""
+import heapq
+from collections import deque
+from math import sqrt
+
+import numpy as np
+from sortedcontainers import SortedList
+
+from parameters import MAX_INT
+from terrain.road_network import _update_proximity
+from terrain.tree_map import _label_canopies
+from utils.algorithms.fast_astar import EXPLORATION_OFFSETS, _best_first_search, _heuristic
+from utils.algorithms.fast_dijkstra import multi_source_distances, multi_source_tree
+from utils.algorithms.grid_astar import DIRECTIONS, grid_astar
+
+SEEDS = range(10)
+WIDTH, LENGTH = 40, 32
+
+
+def random_costs(rng, n_moves, forbidden_ratio=.1):
+    costs = rng.integers(1, 20, (n_moves, WIDTH, LENGTH)).astype(float)
+    costs[rng.random(costs.shape) < forbidden_ratio] = MAX_INT
+    return costs
+
+
+def random_point(rng):
+    return int(rng.integers(WIDTH)), int(rng.integers(LENGTH))
+
+
+def scalar_dijkstra(costs, offsets, sources):
+    distance = np.full((WIDTH, LENGTH), np.inf)
+    heap = [(0., source) for source in sources]
+    for source in sources:
+        distance[source] = 0
+    while heap:
+        d, (x0, z0) = heapq.heappop(heap)
+        if d > distance[x0, z0]:
+            continue
+        for i, (dx, dz) in enumerate(offsets):
+            x1, z1 = x0 + dx, z0 + dz
+            if 0 <= x1 < WIDTH and 0 <= z1 < LENGTH and costs[i, x0, z0] < MAX_INT \
+                    and d + costs[i, x0, z0] < distance[x1, z1]:
+                distance[x1, z1] = d + costs[i, x0, z0]
+                heapq.heappush(heap, (distance[x1, z1], (x1, z1)))
+    return distance
+
+
+def scalar_astar(costs, source, target, rough_path):
+    """
+    Former PathFinder.__astar, with the neighbours explored in DIRECTIONS order and without time limit
+    """
+    cumsum = [0]
+    for i in range(len(rough_path) - 1, 0, -1):
+        cumsum.append(cumsum[-1] + sqrt((rough_path[i][0] - rough_path[i - 1][0]) ** 2
+                                        + (rough_path[i][1] - rough_path[i - 1][1]) ** 2))
+    cumsum.reverse()
+
+    distance_map = np.full((WIDTH, LENGTH), MAX_INT, dtype=float)
+    distance_map[source] = 0
+    predecessor_map = np.full((WIDTH, LENGTH), None)
+    heuristic_map = np.full((WIDTH, LENGTH), MAX_INT, dtype=float)
+
+    def heuristic(pos):
+        if heuristic_map[pos] == MAX_INT:
+            distances = [sqrt((pos[0] - p[0]) ** 2 + (pos[1] - p[1]) ** 2) for p in rough_path]
+            closest = int(np.argmin(distances))
+            if closest >= len(rough_path) - 2:
+                heuristic_map[pos] = sqrt((pos[0] - target[0]) ** 2 + (pos[1] - target[1]) ** 2)
+            else:
+                heuristic_map[pos] = distances[closest + 2] + cumsum[closest + 2]
+        return heuristic_map[pos]
+
+    neighbours = SortedList([source], lambda pos: distance_map[pos] + heuristic(pos))
+    node = source
+    while node != target and neighbours:
+        node = neighbours.pop(0)
+        for d, (dx, dz) in enumerate(DIRECTIONS):
+            neigh = node[0] + dx, node[1] + dz
+            if not (0 <= neigh[0] < WIDTH and 0 <= neigh[1] < LENGTH) or costs[d][node] == MAX_INT:
+                continue
+            new_dist = distance_map[node] + costs[d][node]
+            if new_dist < distance_map[neigh]:
+                neighbours.add(neigh)
+                distance_map[neigh] = new_dist
+                predecessor_map[neigh] = node
+
+    if predecessor_map[target] is None:
+        return []
+    path = [target]
+    while path[-1] != source:
+        path.append(predecessor_map[path[-1]])
+    return path[::-1]
+
+
+def compare_grid_astar(rng):
+    costs = random_costs(rng, 4)
+    source, target = random_point(rng), random_point(rng)
+    steps = max(abs(target[0] - source[0]), abs(target[1] - source[1])) // 4 + 2
+    rough_path = [tuple(map(int, np.round(p))) for p in np.linspace(source, target, steps)]
+    return grid_astar(costs, source, target, np.array(rough_path), 60) == scalar_astar(costs, source, target, rough_path)
+
+
+def compare_multi_source_distances(rng):
+    """
+    The former exploration only approximated Dijkstra: the fields are compared with an exact scalar search
+    """
+    height_map = rng.integers(60, 66, (WIDTH, LENGTH)).astype(float)
+    sources = rng.random((2, WIDTH, LENGTH)) < .02
+    max_distances = np.array([10., 1000.])
+    distances = multi_source_distances(height_map, sources, max_distances)
+
+    offsets = [(dx, dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1)]
+    moves = np.full((len(offsets), WIDTH, LENGTH), MAX_INT, dtype=float)
+    for i, (dx, dz) in enumerate(offsets):
+        x0, x1, z0, z1 = max(-dx, 0), WIDTH - max(dx, 0), max(-dz, 0), LENGTH - max(dz, 0)
+        dy = height_map[x0 + dx:x1 + dx, z0 + dz:z1 + dz] - height_map[x0:x1, z0:z1]
+        moves[i, x0:x1, z0:z1] = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+    for field in range(len(max_distances)):
+        expected = scalar_dijkstra(moves, offsets, list(map(tuple, np.argwhere(sources[field]))))
+        expected = np.minimum(expected, max_distances[field]).astype(np.float32)
+        if not np.allclose(distances[field], expected, rtol=1e-6):
+            return False
+    return True
+
+
+def scalar_label_canopies(is_tree, trunks):
+    """
+    Former TreesMap propagation, from trunks given in order
+    """
+    labels = np.zeros(is_tree.shape, dtype=int)
+    marked = set()
+    queue = []
+    for tree_index, position in enumerate(trunks, 1):
+        if position not in marked:
+            queue.append((*position, tree_index))
+            marked.add(position)
+    while queue:
+        x1, z1, tree_index = queue.pop(0)
+        labels[x1, z1] = tree_index
+        for x2 in range(x1 - 1, x1 + 2):
+            for z2 in range(z1 - 1, z1 + 2):
+                if 0 <= x2 < WIDTH and 0 <= z2 < LENGTH and (x2, z2) not in marked and is_tree[x2, z2]:
+                    marked.add((x2, z2))
+                    queue.append((x2, z2, tree_index))
+    return labels
+
+
+def compare_label_canopies(rng):
+    is_tree = rng.random((WIDTH, LENGTH)) < .4
+    trunks = np.argwhere(is_tree & (rng.random((WIDTH, LENGTH)) < .05))
+    labels, _ = _label_canopies(is_tree, trunks)
+    return np.array_equal(labels, scalar_label_canopies(is_tree, list(map(tuple, trunks.tolist()))))
+
+
+def scalar_update_proximity(build_costs, is_road, roots, max_distance, force_update, cost_map, distance_map,
+                            predecessor_map):
+    """
+    Former RoadNetwork.dijkstra: the explored points are all keyed by MAX_INT when queued, hence a first in first out
+    exploration after the roots
+    """
+    costs = np.full((WIDTH, LENGTH), MAX_INT)
+    distances = np.full((WIDTH, LENGTH), MAX_INT)
+    predecessors = np.full((WIDTH, LENGTH), -1)
+    queue = deque()
+    for x, z in roots:
+        if costs[x, z] != 0:
+            costs[x, z] = distances[x, z] = 0
+            queue.append((x, z))
+    while queue:
+        x, z = queue.popleft()
+        if cost_map[x, z] > costs[x, z]:
+            cost_map[x, z] = costs[x, z]
+            distance_map[x, z] = distances[x, z]
+            predecessor_map[x, z] = x * LENGTH + z if is_road[x, z] else predecessors[x, z]
+        for d in (0, 2, 1, 3):
+            nx, nz = x + DIRECTIONS[d][0], z + DIRECTIONS[d][1]
+            if not (0 <= nx < WIDTH and 0 <= nz < LENGTH) or build_costs[d, x, z] == MAX_INT:
+                continue
+            new_cost = costs[x, z] + build_costs[d, x, z]
+            new_distance = distances[x, z] + 1
+            previous_cost = costs[nx, nz]
+            if previous_cost >= MAX_INT and new_distance <= max_distance and not is_road[nx, nz] \
+                    and (new_cost < cost_map[nx, nz] or force_update):
+                queue.append((nx, nz))
+            if previous_cost > new_cost:
+                costs[nx, nz] = new_cost
+                distances[nx, nz] = new_distance
+                predecessors[nx, nz] = x * LENGTH + z
+
+
+def compare_update_proximity(rng):
+    build_costs = random_costs(rng, 4).astype(np.float32)
+    is_road = np.zeros((WIDTH, LENGTH), dtype=bool)
+    is_road[rng.integers(WIDTH), :] = True
+    is_road[:, rng.integers(LENGTH)] = True
+    maps = [np.full((WIDTH, LENGTH), MAX_INT, dtype=np.float32), np.full((WIDTH, LENGTH), MAX_INT, dtype=np.float32),
+            np.full((WIDTH, LENGTH), -1, dtype=np.int32)]
+    expected = [_.copy() for _ in maps]
+
+    for max_distance, force_update in ((8, False), (20, False), (12, True)):
+        roots = np.argwhere(is_road)
+        roots = roots[rng.random(len(roots)) < .5]
+        x0, z0 = np.maximum(roots.min(axis=0) - max_distance - 1, 0)
+        x1, z1 = np.minimum(roots.max(axis=0) + max_distance + 2, (WIDTH, LENGTH))
+        scratch = [np.full((WIDTH, LENGTH), MAX_INT), np.full((WIDTH, LENGTH), MAX_INT),
+                   np.full((WIDTH, LENGTH), -1, dtype=np.int32), np.empty(WIDTH * LENGTH, dtype=np.int64)]
+        _update_proximity(build_costs, is_road, roots[:, 0] * LENGTH + roots[:, 1], max_distance, force_update,
+                          (x0, z0, x1, z1), *scratch, *maps)
+        scalar_update_proximity(build_costs, is_road, roots.tolist(), max_distance, force_update, *expected)
+        if not all(np.array_equal(a, b) for a, b in zip(maps, expected)):
+            return False
+    return True
+
+
+def compare_multi_source_tree(rng):
+    """
+    The tree has no former version: its distances are compared with a scalar search, and the costs of its branches
+    with these distances
+    """
+    costs = random_costs(rng, 4)
+    sources = rng.random((WIDTH, LENGTH)) < .01
+    targets = rng.choice(WIDTH * LENGTH, 5, replace=False)
+    distance, parent = multi_source_tree(costs, sources, targets)
+    expected = scalar_dijkstra(costs, DIRECTIONS, list(map(tuple, np.argwhere(sources))))
+
+    for target in targets:
+        x, z = divmod(int(target), LENGTH)
+        if distance[x, z] != expected[x, z]:
+            return False
+        if expected[x, z] == np.inf:
+            continue
+        branch_cost = 0
+        while parent[x, z] >= 0:
+            px, pz = divmod(int(parent[x, z]), LENGTH)
+            branch_cost += costs[DIRECTIONS.index((x - px, z - pz)), px, pz]
+            x, z = px, pz
+        if not sources[x, z] or branch_cost != expected.flat[target]:
+            return False
+    return True
+
+
+def scalar_best_first_search(costs, source, target, max_expansions):
+    """
+    Former fast_astar.a_star, breaking ties in first in first out order instead of randomly
+    """
+    distance_map = np.full((WIDTH, LENGTH), MAX_INT)
+    distance_map[source] = 0
+    predecessor_map = {source: source}
+    neighbours = [source]
+    node, n_steps = source, 0
+    while neighbours and node != target:
+        n_steps += 1
+        node = min(neighbours, key=lambda p: distance_map[p] + _heuristic(p[0], p[1], *target))
+        neighbours.remove(node)
+        for i, (dx, dz) in enumerate(EXPLORATION_OFFSETS.tolist()):
+            neighbour = node[0] + dx, node[1] + dz
+            if not (0 <= neighbour[0] < WIDTH and 0 <= neighbour[1] < LENGTH) or costs[i][node] == MAX_INT:
+                continue
+            new_distance = distance_map[node] + costs[i][node]
+            if distance_map[neighbour] >= MAX_INT:
+                neighbours.append(neighbour)
+            if distance_map[neighbour] > new_distance:
+                distance_map[neighbour] = new_distance
+                predecessor_map[neighbour] = node
+        if n_steps >= max_expansions:
+            break
+    return predecessor_map if node == target else None
+
+
+def compare_best_first_search(rng):
+    """
+    The former search could lower the distance of an expanded point: the found paths are compared by their costs
+    """
+    costs = random_costs(rng, len(EXPLORATION_OFFSETS)).astype(np.float32)
+    source, target = random_point(rng), random_point(rng)
+    parent, found = _best_first_search(costs, EXPLORATION_OFFSETS, source[0] * LENGTH + source[1],
+                                       target[0] * LENGTH + target[1], 10000)
+    expected = scalar_best_first_search(costs, source, target, 10000)
+    if not found or expected is None:
+        return not found and expected is None
+
+    def path_cost(predecessor):
+        cost, point = 0, target
+        while point != source:
+            previous = predecessor(point)
+            cost += costs[EXPLORATION_OFFSETS.tolist().index([point[0] - previous[0], point[1] - previous[1]])][previous]
+            point = previous
+        return cost
+
+    return path_cost(lambda p: divmod(int(parent[p]), LENGTH)) == path_cost(expected.get)
+
+
+if __name__ == '__main__':
+    for comparison in (compare_grid_astar, compare_multi_source_distances, compare_label_canopies,
+                       compare_update_proximity, compare_multi_source_tree, compare_best_first_search):
+        results = [comparison(np.random.default_rng(seed)) for seed in SEEDS]
+        print(f"{comparison.__name__}: {sum(results)}/{len(results)} seeds match")
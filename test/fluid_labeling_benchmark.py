@@ -0,0 +1,29 @@
+"""
+Benchmark of the water labeling algorithms of the FluidMap, to be run on a coastal build area: compares the connected
+components labeling with the former LabelSpreading fit
+"""
+from time import time
+
+import numpy as np
+
+from terrain import TerrainMaps
+from terrain.fluid_map import label_water_components, label_water_spreading, water_biome_labels
+
+WATER_TYPES = {1: "ocean", 2: "river", 3: "swamp"}
+
+if __name__ == '__main__':
+    terrain = TerrainMaps.request()
+    is_water = terrain.blocks.surface("water", terrain.height_map[:])
+    biome_labels = water_biome_labels(terrain.biome)
+    print(f"{is_water.sum()} water points, {(biome_labels[is_water] > 0).sum()} in water biomes")
+
+    water_maps = {}
+    for name, labeling in (("components", label_water_components), ("spread", label_water_spreading)):
+        t0 = time()
+        water_maps[name] = labeling(is_water, biome_labels)
+        counts = {water_type: int((water_maps[name] == label).sum()) for label, water_type in WATER_TYPES.items()}
+        print(f"{name}: labeled water in {time() - t0:0.3f}s, {counts}")
+
+    if is_water.any():
+        agreement = np.mean(water_maps["components"][is_water] == water_maps["spread"][is_water])
+        print(f"Both algorithms agree on {100 * agreement:0.1f}% of the water points")